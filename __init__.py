@@ -1,7 +1,13 @@
+import logging
+import time
+
 from pyramid.config import Configurator
-from sqlalchemy import engine_from_config
 
+import lass.common.database
+import lass.common.jobs
+import lass.common.warmup
 import lass.model_base
+import lass.people.profiles
 
 #from . import (
 #    common,
@@ -10,13 +16,35 @@ import lass.model_base
 #)
 
 
+log = logging.getLogger(__name__)
+
+
 def main(_, **settings):
     """ This function returns a Pyramid WSGI application.
     """
-    engine = engine_from_config(settings, 'sqlalchemy.')
+    started = time.monotonic()
+    engine = lass.common.database.engine_from_settings(settings)
     lass.model_base.DBSession.configure(bind=engine)
     lass.model_base.Base.metadata.bind = engine
     config = Configurator(settings=settings)
+    config.add_renderer(
+        'json_stream',
+        'lass.laconia.renderers.json_stream_factory'
+    )
     config.include('pyramid_zcml')
     config.load_zcml('config.global:configure.zcml')
-    return config.make_wsgi_app()
+    config.add_tween('lass.common.database.tween_factory')
+    config.add_tween(
+        'lass.common.page_cache.tween_factory',
+        over='lass.common.database.tween_factory'
+    )
+    config.add_tween(
+        'lass.common.query_counter.tween_factory',
+        under='lass.common.database.tween_factory'
+    )
+    lass.common.jobs.configure(settings)
+    lass.people.profiles.start_warmer(settings)
+    app = config.make_wsgi_app()
+    lass.common.warmup.warm(app, settings)
+    log.info('Started in %.2fs.', time.monotonic() - started)
+    return app
@@ -27,9 +27,40 @@ LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
 NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
-import requests
+import asyncio
+import collections
+import threading
+import time
 
 import lass.common.config
+import lass.common.lazy
+import lass.common.singleflight
+
+
+# These are only needed once the API is first used.
+requests = lass.common.lazy.lazy_import('requests')
+urllib3 = lass.common.lazy.lazy_import('urllib3')
+
+
+# Defaults for the optional tuning keys of the API configuration.
+#
+# 'timeout' is the connect and read timeout, in seconds, of each attempt;
+# 'retries' is the number of times a failed GET (a connection error, or a
+# status in RETRY_STATUSES) is retried, waiting 'backoff' * 2^n seconds
+# between attempts; 'pool-size' is the number of keep-alive connections
+# kept to the API; and 'cache-ttl' is how long, in seconds, a response is
+# reused for.
+DEFAULT_TIMEOUT = (3.05, 10)
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF = 0.2
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CACHE_TTL = 60
+
+# The HTTP statuses worth retrying a GET on.
+RETRY_STATUSES = (502, 503, 504)
+
+# The maximum number of responses kept in a client's cache.
+MAX_CACHED = 1000
 
 
 class Error(Exception):
@@ -46,31 +77,254 @@ class NotFound(Exception):
     pass
 
 
-def get(resource, config=None, **params):
-    """Sends a GET request to the URY API.
+class ResponseCache(object):
+    """A bounded, least-recently-used cache of API responses that expire
+    after a time to live.
+    """
+    def __init__(self, max_entries=MAX_CACHED):
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, now=None):
+        """Returns the unexpired response cached under 'key', or None."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, response = entry
+            if expires <= now:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return response
+
+    def put(self, key, response, ttl, now=None):
+        """Caches 'response' under 'key' for 'ttl' seconds."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.entries[key] = (now + ttl, response)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        """Empties the cache."""
+        with self.lock:
+            self.entries.clear()
+
+
+class Client(object):
+    """A client for the URY API that keeps its connections alive,
+    retries failed requests and caches responses.
+
+    A client is safe to share between threads.
+    """
+    def __init__(self, config):
+        """Creates a client.
+
+        Args:
+            config: The API configuration (see 'api_config').
+        """
+        self.config = config
+        self.timeout = config.get('timeout', DEFAULT_TIMEOUT)
+        if isinstance(self.timeout, list):
+            self.timeout = tuple(self.timeout)
+        self.cache_ttl = config.get('cache-ttl', DEFAULT_CACHE_TTL)
+        self.cache = ResponseCache()
+        self.fetches = lass.common.singleflight.Group()
+        self.session = session(config)
+
+    def get(self, resource, max_age=None, **params):
+        """Sends a GET request to the API, or reuses a cached response.
+
+        Concurrent requests for the same uncached response share a
+        single request to the API.
+
+        Args:
+            resource: The name of the resource in the API tree we wish to
+                fetch, as a partial URL.  (Example: "/user/101".)
+            max_age: The number of seconds a cached response may be reused
+                for; if 0, the API is always asked.  (Default: the
+                configured 'cache-ttl'.)
+            **params: The parameters to send.
+
+        Returns:
+            The API's response, as a direct translation of the JSON
+            received from the API.  This may be shared with other callers,
+            so MUST NOT be modified.
+
+        Raises:
+            NotFound, if the resource does not exist; Error, if the API
+            could not be contacted or raised any other 4xx or 5xx error.
+        """
+        max_age = self.cache_ttl if max_age is None else max_age
+        key = cache_key(resource, params)
+
+        response = self.cache.get(key) if max_age > 0 else None
+        if response is None:
+            response, _ = self.fetches.do(key, self.fetch, resource, params)
+            if max_age > 0:
+                self.cache.put(key, response, max_age)
+        return response
+
+    def fetch(self, resource, params):
+        """Sends a GET request to the API, bypassing the cache.
+
+        See 'get'.
+        """
+        payload = params_to_payload(params, self.config)
+        url = resource_to_url(resource, self.config)
+
+        try:
+            response = self.session.get(
+                url,
+                params=payload,
+                timeout=self.timeout
+            )
+        except requests.exceptions.RequestException as exc:
+            raise Error(
+                'Could not GET resource {} via {}.'.format(resource, url)
+            ) from exc
+        raise_api_error_if_failure(response, resource, url)
+
+        return response.json()
+
+    async def get_async(self, resource, max_age=None, **params):
+        """Like 'get', but runs in the event loop's default executor so
+        that several requests can be made at once.
+        """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            None,
+            lambda: self.get(resource, max_age, **params)
+        )
+
+    async def get_many(self, resources, max_age=None, **params):
+        """Sends GET requests for several resources at once.
+
+        Args:
+            resources: An iterable of resource names.
+            max_age: See 'get'.
+            **params: The parameters to send with every request.
+
+        Returns:
+            A list of the responses, in the order of 'resources'.  Where a
+            request failed, its exception is in place of the response.
+        """
+        return await asyncio.gather(
+            *(
+                self.get_async(resource, max_age, **params)
+                for resource in resources
+            ),
+            return_exceptions=True
+        )
+
+    def close(self):
+        """Closes the client's connections."""
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def client(config=None):
+    """Retrieves the shared client for an API configuration.
+
+    The client is replaced whenever a different configuration object is
+    asked for, such as when the site configuration file changes.  The old
+    client is not closed, as other threads may still be using it; it is
+    left for the garbage collector once they are done.
+
+    Args:
+        config: The API configuration (see 'api_config').
+
+    Returns:
+        A Client.
+    """
+    global _client
+
+    config = api_config(config)
+    with _client_lock:
+        if _client is None or _client.config is not config:
+            _client = Client(config)
+        return _client
+
+
+def get(resource, config=None, max_age=None, **params):
+    """Sends a GET request to the URY API, through the shared client.
 
     Args:
         resource: The name of the resource in the API tree we wish to
             fetch, as a partial URL.  (Example: "/user/101".)
         config: The configuration that contains information about where
             and how the API can be contacted.
+        max_age: See 'Client.get'.
 
     Returns:
         The API's response, as a direct translation of the JSON received
         from the API (thus this will usually be a dict).
 
     Raises:
-        APIError, if the API raises a 4xx or 5xx error.
+        NotFound, if the resource does not exist; Error, if the API could
+        not be contacted or raised any other 4xx or 5xx error.
     """
-    config = api_config(config)
+    return client(config).get(resource, max_age, **params)
 
-    payload = params_to_payload(params, config)
-    url = resource_to_url(resource, config)
 
-    response = requests.get(url, params=payload)
-    raise_api_error_if_failure(response, resource, url)
+def get_many(resources, config=None, max_age=None, **params):
+    """Sends GET requests for several resources to the URY API at once,
+    through the shared client.
 
-    return response.json()
+    This must not be called from inside a running event loop; there, await
+    'client(config).get_many' instead.
+
+    Returns:
+        See 'Client.get_many'.
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(
+            client(config).get_many(resources, max_age, **params)
+        )
+    finally:
+        loop.close()
+
+
+def session(config):
+    """Creates a keep-alive HTTP session for talking to the API.
+
+    Args:
+        config: The API configuration (see 'api_config').
+
+    Returns:
+        A requests Session with a connection pool and retry policy.
+    """
+    pool_size = config.get('pool-size', DEFAULT_POOL_SIZE)
+    retry = urllib3.util.retry.Retry(
+        total=config.get('retries', DEFAULT_RETRIES),
+        backoff_factor=config.get('backoff', DEFAULT_BACKOFF),
+        status_forcelist=RETRY_STATUSES,
+        raise_on_status=False
+    )
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=pool_size,
+        max_retries=retry
+    )
+
+    out_session = requests.Session()
+    out_session.mount('http://', adapter)
+    out_session.mount('https://', adapter)
+    return out_session
+
+
+def cache_key(resource, params):
+    """Creates the response cache key for a resource and its parameters.
+    """
+    return resource, tuple(sorted(params.items()))
 
 
 def api_config(config=None):
@@ -88,7 +342,9 @@ def api_config(config=None):
         A dictionary of API configuration.
     """
     if config is None:
-        out_config = lass.common.config.from_yaml('sitewide/website')['api']
+        out_config = lass.common.config.cached_from_yaml(
+            'sitewide/website'
+        )['api']
     else:
         out_config = config
     return out_config
@@ -0,0 +1,354 @@
+"""Shared machinery for the LASS benchmark harnesses.
+
+This module provides a throwaway database stand-in to benchmark against,
+a way to run LASS code against synthetic site configuration, and helpers
+for timing, summarising, recording and comparing benchmark results.
+
+The harnesses themselves live next to the code they measure (for
+example, 'lass.schedule.benchmarks').
+
+---
+
+Copyright (c) 2013, University Radio York.
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimer in the
+  documentation and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import contextlib
+import datetime
+import json
+import math
+import os
+import platform
+import statistics
+import time
+import unittest.mock
+
+import pytz
+import sqlalchemy
+import sqlalchemy.event
+import sqlalchemy.pool
+import sqlalchemy.schema
+import sqlalchemy.types
+import transaction
+
+import lass.common.config
+import lass.model_base
+
+
+# The environment variable from which the stand-in database URL is read.
+DATABASE_ENVIRON = 'LASS_BENCHMARK_DATABASE'
+
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=pytz.utc)
+
+
+class EpochDateTime(sqlalchemy.types.DateTime):
+    """A SQLite stand-in for timestamps that stores them as seconds since
+    the epoch.
+
+    SQLite has no date arithmetic, so storing timestamps (and intervals,
+    which SQLAlchemy emulates as timestamps relative to the epoch) as
+    numbers is the only way expressions such as 'Timeslot.finish'
+    ('start_time + duration') can work against it.  Naive datetimes are
+    taken to be UTC, and aware ones come back in UTC.
+    """
+    def bind_processor(self, dialect):
+        def process(value):
+            if value is None:
+                return None
+            if value.tzinfo is None:
+                value = value.replace(tzinfo=pytz.utc)
+            return (value - EPOCH).total_seconds()
+        return process
+
+    def result_processor(self, dialect, coltype):
+        def process(value):
+            if value is None:
+                return None
+            value = EPOCH + datetime.timedelta(seconds=value)
+            return value if self.timezone else value.replace(tzinfo=None)
+        return process
+
+
+def standin_engine(url=None):
+    """Creates an empty database containing the full LASS schema.
+
+    Args:
+        url: The URL of the database to use.  If None, the URL is taken
+            from the environment variable named in 'DATABASE_ENVIRON' or,
+            failing that, an in-memory SQLite database is used.  Any other
+            database MUST be a scratch database, as its tables will be
+            dropped when the stand-in is torn down.  (Default: None.)
+
+    Returns:
+        An engine connected to the stand-in.
+    """
+    import_models()
+
+    if url is None:
+        url = os.environ.get(DATABASE_ENVIRON, 'sqlite://')
+
+    schemata = {
+        table.schema
+        for table in lass.model_base.Base.metadata.sorted_tables
+        if table.schema
+    }
+
+    if url.startswith('sqlite'):
+        # One connection only, so every session sees the same in-memory
+        # database (and its attached schemata).
+        engine = sqlalchemy.create_engine(
+            url,
+            poolclass=sqlalchemy.pool.StaticPool,
+            connect_args={'check_same_thread': False}
+        )
+        colspecs = dict(engine.dialect.colspecs)
+        colspecs[sqlalchemy.types.DateTime] = EpochDateTime
+        engine.dialect.colspecs = colspecs
+
+        @sqlalchemy.event.listens_for(engine, 'connect')
+        def attach_schemata(dbapi_connection, _):
+            for schema in schemata:
+                dbapi_connection.execute(
+                    "ATTACH DATABASE ':memory:' AS {}".format(schema)
+                )
+    else:
+        engine = sqlalchemy.create_engine(url)
+        for schema in schemata:
+            try:
+                engine.execute(sqlalchemy.schema.CreateSchema(schema))
+            except sqlalchemy.exc.ProgrammingError:
+                # Assume this means the schema already exists
+                pass
+
+    lass.model_base.Base.metadata.create_all(engine)
+    return engine
+
+
+@contextlib.contextmanager
+def standin(url=None):
+    """Binds the LASS database session to a fresh stand-in database for
+    the duration of a 'with' block.
+
+    Yields:
+        The engine connected to the stand-in.
+    """
+    engine = standin_engine(url)
+    lass.model_base.DBSession.remove()
+    lass.model_base.DBSession.configure(bind=engine)
+    try:
+        yield engine
+    finally:
+        reset_session()
+        lass.model_base.Base.metadata.drop_all(engine)
+        engine.dispose()
+
+
+def import_models():
+    """Imports every model module, so the full schema is known."""
+    # None of these names are used: importing the modules is what counts,
+    # as it declares their tables on lass.model_base.Base.metadata for
+    # 'standin' to create.  Don't forget to add any new model modules here
+    import lass.credits.models
+    import lass.metadata.models
+    import lass.music.models
+    import lass.people.models
+    import lass.schedule.models
+    import lass.uryplayer.models
+    import lass.website.models
+
+
+def reset_session():
+    """Throws away the LASS database session and anything it has loaded,
+    so the next benchmark run starts cold.
+    """
+    transaction.abort()
+    lass.model_base.DBSession.remove()
+
+
+def row(model, **values):
+    """Makes a row for 'insert' from a model's attribute names and values.
+
+    This saves the synthetic data generators from having to know the
+    database column names behind each model attribute.
+    """
+    columns = sqlalchemy.inspect(model).columns
+    return {columns[name].key: value for name, value in values.items()}
+
+
+def insert(engine, model, rows):
+    """Bulk-inserts rows into a model's table.
+
+    Args:
+        engine: The engine to insert with.
+        model: The model whose table is being inserted into.
+        rows: A list of dicts mapping column names to values (see 'row').
+    """
+    if rows:
+        engine.execute(model.__table__.insert(), rows)
+
+
+@contextlib.contextmanager
+def site_config(configs):
+    """Serves configuration from a dict for the duration of a 'with' block.
+
+    Args:
+        configs: A dict mapping configuration paths (for example,
+            'sitewide/time') to their would-be parsed contents.  Paths not
+            in the dict are read from the real configuration as usual.
+    """
+    real = lass.common.config.from_yaml
+
+    def from_yaml(path):
+        return configs[path] if path in configs else real(path)
+
+    with unittest.mock.patch.multiple(
+        lass.common.config,
+        from_yaml=from_yaml,
+        cached_from_yaml=from_yaml
+    ):
+        yield
+
+
+class Timings(object):
+    """Collects timing samples for named benchmark stages."""
+    def __init__(self):
+        self.samples = {}
+
+    @contextlib.contextmanager
+    def time(self, stage):
+        """Times the body of a 'with' block as one sample for 'stage'."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples.setdefault(stage, []).append(
+                time.perf_counter() - started
+            )
+
+    def summary(self):
+        """Summarises the samples of each stage; see 'summarise'."""
+        return {
+            stage: summarise(samples)
+            for stage, samples in self.samples.items()
+        }
+
+
+def percentile(ordered, fraction):
+    """Returns the given percentile of an ordered list of samples, using the
+    nearest-rank method.
+    """
+    rank = max(math.ceil(fraction * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def summarise(samples):
+    """Summarises a list of timing samples.
+
+    Returns:
+        A dict containing the number of samples and the minimum, mean,
+        median (p50), 90th and 99th percentile and maximum times, in
+        milliseconds.
+    """
+    ordered = sorted(samples)
+    to_ms = lambda seconds: round(seconds * 1000, 3)
+    return {
+        'n': len(ordered),
+        'min': to_ms(ordered[0]),
+        'mean': to_ms(statistics.mean(ordered)),
+        'p50': to_ms(percentile(ordered, 0.5)),
+        'p90': to_ms(percentile(ordered, 0.9)),
+        'p99': to_ms(percentile(ordered, 0.99)),
+        'max': to_ms(ordered[-1])
+    }
+
+
+def record(path, benchmark, results, engine=None):
+    """Appends a set of benchmark results to a JSON-lines results file.
+
+    Args:
+        path: The path of the results file.
+        benchmark: The name of the benchmark that was run.
+        results: The (JSON-serialisable) results.
+        engine: The engine the benchmark ran against, if any, so that its
+            database can be noted alongside the results.  (Default: None.)
+    """
+    entry = {
+        'benchmark': benchmark,
+        'timestamp': datetime.datetime.now(pytz.utc).isoformat(),
+        'python': platform.python_version(),
+        'database': engine.dialect.name if engine is not None else None,
+        'results': results
+    }
+    with open(path, 'a') as results_file:
+        results_file.write(json.dumps(entry, sort_keys=True) + '\n')
+
+
+def last_recorded(path, benchmark):
+    """Retrieves the most recently recorded results for a benchmark.
+
+    Returns:
+        The results, or None if there are none recorded in 'path'.
+    """
+    results = None
+    try:
+        with open(path) as results_file:
+            for line in results_file:
+                entry = json.loads(line)
+                if entry['benchmark'] == benchmark:
+                    results = entry['results']
+    except IOError:
+        pass
+    return results
+
+
+def compare(baseline, current, tolerance=0.2, measure='p50'):
+    """Compares two sets of results, looking for regressions.
+
+    Both sets of results must map scale names to dicts mapping stage
+    names to the output of 'summarise'.
+
+    Args:
+        baseline: The results being compared against.
+        current: The new results.
+        tolerance: The fractional slowdown allowed before a stage counts as
+            regressed.  (Default: 0.2.)
+        measure: The summary measure to compare.  (Default: 'p50'.)
+
+    Returns:
+        A list of (scale, stage, baseline time, current time) tuples for
+        each regressed stage.
+    """
+    regressions = []
+    for scale, stages in sorted(current.items()):
+        for stage, summary in sorted(stages.items()):
+            try:
+                old = baseline[scale][stage][measure]
+            except KeyError:
+                continue
+            new = summary[measure]
+            if new > old * (1 + tolerance):
+                regressions.append((scale, stage, old, new))
+    return regressions
@@ -26,10 +26,19 @@ ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
 SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
+import os
+import threading
+
 import pyramid
 import yaml
 
 
+# Cache of parsed configuration files for 'cached_from_yaml', mapping
+# absolute paths to (modification time, parsed contents) tuples.
+_cache = {}
+_cache_lock = threading.Lock()
+
+
 def from_yaml(path):
     """Reads in a YAML configuration file, given its path.
     
@@ -41,10 +50,48 @@ def from_yaml(path):
     Returns:
         The processed contents of the configuration file (usually a dict).
     """
-    asset = 'config:{}.yml'.format(path)
-    full_path = pyramid.path.AssetResolver().resolve(asset).abspath()
-    
-    with open(full_path) as yaml_file:
+    with open(config_path(path)) as yaml_file:
         result = yaml.load(yaml_file)
 
     return result
+
+
+def cached_from_yaml(path):
+    """Reads in a YAML configuration file, reusing the last parse of the
+    file if it has not been modified since.
+
+    This is for configuration that is read on hot paths, such as on every
+    schedule request.  The same object is returned for as long as the file
+    is unchanged, so callers may use its identity to cache anything they
+    derive from it, and MUST NOT modify it.
+
+    Args:
+        path: The path of the configuration file; see 'from_yaml'.
+
+    Returns:
+        The processed contents of the configuration file (usually a dict).
+    """
+    full_path = config_path(path)
+    mtime = os.stat(full_path).st_mtime
+
+    with _cache_lock:
+        cached = _cache.get(full_path)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, from_yaml(path))
+        with _cache_lock:
+            _cache[full_path] = cached
+
+    return cached[1]
+
+
+def config_path(path):
+    """Resolves a configuration file path to an absolute filesystem path.
+
+    Args:
+        path: The path of the configuration file; see 'from_yaml'.
+
+    Returns:
+        The absolute path to the configuration file.
+    """
+    asset = 'config:{}.yml'.format(path)
+    return pyramid.path.AssetResolver().resolve(asset).abspath()
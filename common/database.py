@@ -0,0 +1,462 @@
+"""Database engine set-up and connection pool instrumentation.
+
+The website's engine is built from the Pyramid settings much as a bare
+'engine_from_config' would build it, but uses a connection pool that
+keeps count of checkouts, checkout waits and connection churn.  These
+counts are kept both for the whole process and for each request being
+served, so that pool saturation can be spotted under load rather than
+after the database has already fallen over.
+
+The pool is configured with the following settings (all optional):
+
+    lass.database.pool_size: The number of connections kept open in the
+        pool.  (Default: 5.)
+    lass.database.max_overflow: The number of connections that may be
+        opened on top of 'pool_size' when the pool is exhausted.
+        (Default: 10.)
+    lass.database.pool_recycle: The age, in seconds, after which a
+        connection is closed and reopened on checkout.  (Default: 3600.)
+    lass.database.pool_timeout: The number of seconds to wait for a
+        connection before giving up.  (Default: 30.)
+    lass.database.pre_ping: Whether to test connections for liveness on
+        checkout, replacing dead ones transparently.  (Default: true.)
+    lass.database.slow_checkout_ms: Requests that spend longer than this
+        many milliseconds waiting for connections are logged as warnings.
+        (Default: 100.)
+    lass.database.status_addresses: The client addresses, separated by
+        whitespace, allowed to see the pool summary at the
+        'database-status' route (see 'lass.views.database_status').
+        (Default: '127.0.0.1 ::1'.)
+
+The 'database-status' route is not part of the website itself, and needs
+adding to the site's route configuration to be used, for example:
+
+    <route name="database-status" pattern="/status/database" />
+
+---
+
+Copyright (c) 2013, University Radio York.
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimer in the
+  documentation and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import logging
+import threading
+import time
+
+import pyramid.settings
+import sqlalchemy
+import sqlalchemy.event
+import sqlalchemy.exc
+import sqlalchemy.orm.state
+import sqlalchemy.pool
+
+import lass.model_base
+
+
+log = logging.getLogger(__name__)
+
+
+SETTINGS_PREFIX = 'lass.database.'
+
+
+# The client addresses allowed to see the pool summary, if the settings
+# don't say otherwise.
+STATUS_ADDRESSES = ('127.0.0.1', '::1')
+
+
+# Pool settings, their types and their defaults.
+POOL_SETTINGS = (
+    ('pool_size', int, 5),
+    ('max_overflow', int, 10),
+    ('pool_recycle', int, 3600),
+    ('pool_timeout', int, 30)
+)
+
+
+class PoolStats(object):
+    """Process-wide counters describing the usage of the connection pool."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkout_wait = 0.0
+        self.max_checkout_wait = 0.0
+        self.timeouts = 0
+        self.invalidations = 0
+        self.disconnects = 0
+        self.queries = 0
+        self.checked_out = 0
+        self.peak_checked_out = 0
+
+    def add(self, **counts):
+        """Atomically adds to one or more of the counters."""
+        with self._lock:
+            for name, count in counts.items():
+                setattr(self, name, getattr(self, name) + count)
+            self.peak_checked_out = max(
+                self.peak_checked_out,
+                self.checked_out
+            )
+
+    def waited(self, seconds):
+        """Records a completed wait for a connection checkout."""
+        with self._lock:
+            self.checkout_wait += seconds
+            self.max_checkout_wait = max(self.max_checkout_wait, seconds)
+
+    def as_dict(self):
+        """Returns a snapshot of the counters as a dict."""
+        with self._lock:
+            return {
+                key: value
+                for key, value in vars(self).items()
+                if not key.startswith('_')
+            }
+
+
+class RequestStats(object):
+    """Counters describing the database usage of a single request.
+
+    'statements' and 'statement_time' are None unless something (usually
+    the 'lass.common.query_counter' tween) sets them to Counters, in which
+    case they are keyed on each raw statement run during the request.
+    """
+    def __init__(self):
+        self.checkouts = 0
+        self.checkout_wait = 0.0
+        self.queries = 0
+        self.query_time = 0.0
+        self.statements = None
+        self.statement_time = None
+
+    def record(self, statement, taken):
+        """Records a statement run in 'taken' seconds."""
+        self.queries += 1
+        self.query_time += taken
+        if self.statements is not None:
+            self.statements[statement] += 1
+            self.statement_time[statement] += taken
+
+
+# The process-wide statistics object.
+STATS = PoolStats()
+
+# The engine being instrumented, kept so its pool can be inspected.
+_engine = None
+
+# Holds the RequestStats for the request each thread is serving, if any.
+_local = threading.local()
+
+
+class InstrumentedQueuePool(sqlalchemy.pool.QueuePool):
+    """A QueuePool that measures how long each checkout waits for a
+    connection to become available.
+    """
+    def __init__(self, creator, pool_size=5, max_overflow=10, **kwargs):
+        super().__init__(
+            creator,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            **kwargs
+        )
+        # The number of connections allowed on top of 'pool_size'; if
+        # negative, there is no limit.
+        self.overflow_limit = max_overflow
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except sqlalchemy.exc.TimeoutError:
+            STATS.add(timeouts=1)
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            STATS.waited(waited)
+            request_stats = current_request_stats()
+            if request_stats is not None:
+                request_stats.checkout_wait += waited
+        return connection
+
+
+def engine_from_settings(settings, prefix='sqlalchemy.'):
+    """Creates an instrumented engine from a Pyramid settings dict.
+
+    Args:
+        settings: The Pyramid application settings.
+        prefix: The prefix of the settings that are passed directly into
+            SQLAlchemy.  (Default: 'sqlalchemy.'.)
+
+    Returns:
+        A SQLAlchemy engine using an 'InstrumentedQueuePool'.
+    """
+    engine = sqlalchemy.engine_from_config(
+        settings,
+        prefix,
+        poolclass=InstrumentedQueuePool,
+        **pool_options(settings)
+    )
+    instrument(
+        engine,
+        pre_ping=pyramid.settings.asbool(
+            settings.get(SETTINGS_PREFIX + 'pre_ping', True)
+        )
+    )
+    return engine
+
+
+def pool_options(settings):
+    """Reads the pool configuration out of the Pyramid settings.
+
+    Args:
+        settings: The Pyramid application settings.
+
+    Returns:
+        A dict of keyword arguments for 'create_engine'.
+    """
+    return {
+        name: convert(settings.get(SETTINGS_PREFIX + name, default))
+        for name, convert, default in POOL_SETTINGS
+    }
+
+
+def instrument(engine, pre_ping=True):
+    """Attaches the pool and query counters to an engine.
+
+    Args:
+        engine: The engine to instrument.
+        pre_ping: If True, connections are tested with a trivial query
+            on checkout; dead connections are discarded and replaced
+            before they reach the application.  (Default: True.)
+    """
+    global _engine
+    _engine = engine
+
+    def on_connect(*_):
+        STATS.add(connects=1)
+
+    def on_checkout(dbapi_connection, *_):
+        if pre_ping:
+            ping(dbapi_connection)
+        STATS.add(checkouts=1, checked_out=1)
+        request_stats = current_request_stats()
+        if request_stats is not None:
+            request_stats.checkouts += 1
+
+    def on_checkin(*_):
+        STATS.add(checked_out=-1)
+
+    def on_invalidate(*_):
+        STATS.add(invalidations=1)
+
+    def before_cursor_execute(conn, *_):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    def after_cursor_execute(conn, cursor, statement, *_):
+        taken = time.perf_counter() - conn.info['query_start'].pop()
+        STATS.add(queries=1)
+        request_stats = current_request_stats()
+        if request_stats is not None:
+            request_stats.record(statement, taken)
+
+    def handle_error(context):
+        # Statements that raise never reach 'after_cursor_execute', so
+        # their start times have to be dropped here.
+        connection = context.connection
+        starts = connection.info.get('query_start') if connection else None
+        if starts:
+            starts.pop()
+
+    sqlalchemy.event.listen(engine.pool, 'connect', on_connect)
+    sqlalchemy.event.listen(engine.pool, 'checkout', on_checkout)
+    sqlalchemy.event.listen(engine.pool, 'checkin', on_checkin)
+    sqlalchemy.event.listen(engine.pool, 'invalidate', on_invalidate)
+    sqlalchemy.event.listen(
+        engine,
+        'before_cursor_execute',
+        before_cursor_execute
+    )
+    sqlalchemy.event.listen(
+        engine,
+        'after_cursor_execute',
+        after_cursor_execute
+    )
+    sqlalchemy.event.listen(engine, 'handle_error', handle_error)
+
+
+def ping(dbapi_connection):
+    """Checks that a raw DBAPI connection is still alive.
+
+    Raises:
+        sqlalchemy.exc.DisconnectionError: The connection is dead; the
+            pool will discard it and retry the checkout on a fresh one.
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute('SELECT 1')
+    except Exception as exc:
+        STATS.add(disconnects=1)
+        raise sqlalchemy.exc.DisconnectionError() from exc
+    finally:
+        cursor.close()
+
+
+def current_request_stats():
+    """Returns the RequestStats of the request this thread is serving, or
+    None if it is not serving one.
+    """
+    return getattr(_local, 'stats', None)
+
+
+def summary():
+    """Summarises the state of the connection pool.
+
+    Returns:
+        A dict containing the process-wide counters along with the size,
+        current usage, capacity and saturation (the fraction of the
+        capacity currently checked out) of the pool.
+    """
+    result = STATS.as_dict()
+
+    pool = _engine.pool if _engine is not None else None
+    if isinstance(pool, InstrumentedQueuePool):
+        capacity = pool.size() + max(pool.overflow_limit, 0)
+        result.update(
+            {
+                'size': pool.size(),
+                'checked_in': pool.checkedin(),
+                'overflow': pool.overflow(),
+                'capacity': capacity,
+                'saturation': (
+                    result['checked_out'] / capacity if capacity else 0.0
+                )
+            }
+        )
+    return result
+
+
+def may_see_status(request):
+    """Checks whether a request comes from an address allowed to see the
+    pool summary; see 'lass.database.status_addresses'.
+    """
+    settings = request.registry.settings or {}
+    allowed = pyramid.settings.aslist(
+        settings.get(
+            SETTINGS_PREFIX + 'status_addresses',
+            ' '.join(STATUS_ADDRESSES)
+        )
+    )
+    return request.client_addr in allowed
+
+
+def tween_factory(handler, registry):
+    """Creates a Pyramid tween that tracks the database usage of each
+    request.
+
+    The RequestStats for the request are available to views as
+    'request.database_stats'.  One log line is emitted per request, at
+    warning level if the request spent too long waiting for connections
+    or the pool is saturated, and at debug level otherwise.
+    """
+    slow_checkout = int(
+        registry.settings.get(SETTINGS_PREFIX + 'slow_checkout_ms', 100)
+    ) / 1000
+
+    def tween(request):
+        stats = RequestStats()
+        request.database_stats = stats
+        _local.stats = stats
+        try:
+            return handler(request)
+        finally:
+            _local.stats = None
+            log_request(request, stats, slow_checkout)
+
+    return tween
+
+
+def log_request(request, stats, slow_checkout):
+    """Logs the database usage of a finished request."""
+    pool = summary()
+    saturated = pool.get('saturation', 0.0) >= 1.0
+    level = (
+        logging.WARNING
+        if saturated or stats.checkout_wait > slow_checkout
+        else logging.DEBUG
+    )
+    log.log(
+        level,
+        '%s: %d queries in %.1fms, %d checkouts waiting %.1fms; '
+        'pool %d/%s checked out%s',
+        request.path,
+        stats.queries,
+        stats.query_time * 1000,
+        stats.checkouts,
+        stats.checkout_wait * 1000,
+        pool['checked_out'],
+        pool.get('capacity', '?'),
+        ' (saturated)' if saturated else ''
+    )
+
+
+def query_key(query):
+    """Makes a key identifying a query, for 'lass.common.singleflight'.
+
+    Returns:
+        A tuple of the query's SQL and its sorted bound parameters;
+        queries with equal keys fetch the same rows.
+    """
+    compiled = query.statement.compile()
+    return (str(compiled), tuple(sorted(compiled.params.items())))
+
+
+def merge_instances(value):
+    """Moves the model instances in a query result, loaded by another
+    thread, into this thread's session.
+
+    Sessions (and the instances they load) must not be shared between
+    threads, so results shared by 'lass.common.singleflight.coalesce'
+    pass through this to get copies bound to the caller's own session.
+    The copies are made without going back to the database.
+
+    Args:
+        value: A model instance, or a list or tuple (possibly nested) of
+            them and other values, as returned by a query.  Other kinds
+            of container, such as query result rows, are not looked into.
+
+    Returns:
+        'value' with every model instance replaced by its copy in this
+        thread's session; other values are returned as they are.
+    """
+    state = sqlalchemy.inspect(value, raiseerr=False)
+    if isinstance(value, list):
+        merged = [merge_instances(item) for item in value]
+    elif type(value) is tuple:
+        merged = tuple(merge_instances(item) for item in value)
+    elif isinstance(state, sqlalchemy.orm.state.InstanceState):
+        merged = lass.model_base.DBSession.merge(value, load=False)
+    else:
+        merged = value
+    return merged
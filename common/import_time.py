@@ -0,0 +1,167 @@
+"""Measurement of how long the website takes to import.
+
+Worker start-up time matters when workers are spawned on demand, and
+most of it is spent importing modules.  'measure' imports a module in a
+fresh interpreter under Python's '-X importtime' and collects the time
+taken by every module imported along the way; 'python -m
+lass.scripts.import_time' prints a report of it.  Each run is repeated
+and the fastest time kept per module, after a first run that writes any
+bytecode, so that reports are comparable between runs and machines.
+
+The tests hold 'import lass' to BUDGET, and check that none of the
+DEFERRED modules, which are imported lazily (see 'lass.common.lazy'),
+are imported with it.
+
+---
+
+Copyright (c) 2013, University Radio York.
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimer in the
+  documentation and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import collections
+import os
+import subprocess
+import sys
+
+
+# The most 'import lass' should take in a fresh interpreter, in seconds.
+BUDGET = 3.0
+
+
+# Modules only imported on first use, and never by 'import lass'.
+DEFERRED = ('dateutil', 'feedparser', 'requests', 'urllib3')
+
+
+Timing = collections.namedtuple('Timing', ['own', 'cumulative'])
+
+
+def parse(lines):
+    """Parses the output of '-X importtime'.
+
+    Args:
+        lines: An iterable of the lines Python writes to standard error.
+
+    Returns:
+        An OrderedDict mapping module names, in the order they finished
+        importing, to their Timing in seconds.
+    """
+    timings = collections.OrderedDict()
+    for line in lines:
+        if not line.startswith('import time:'):
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        if not own.strip().isdigit():
+            # The header line.
+            continue
+        timings[name.strip()] = Timing(
+            own=int(own) / 1000000,
+            cumulative=int(cumulative) / 1000000
+        )
+    return timings
+
+
+def run(module, python=sys.executable):
+    """Imports a module in a fresh interpreter under '-X importtime'.
+
+    Returns:
+        The Timings of the import; see 'parse'.
+
+    Raises:
+        subprocess.CalledProcessError: if the import fails.
+    """
+    process = subprocess.run(
+        [python, '-X', 'importtime', '-c', 'import {}'.format(module)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        env=dict(os.environ, PYTHONWARNINGS='ignore'),
+        universal_newlines=True,
+        check=True
+    )
+    return parse(process.stderr.splitlines())
+
+
+def measure(module='lass', runs=3, python=sys.executable):
+    """Measures the import time of a module.
+
+    Args:
+        module: The name of the module to import.  (Default: 'lass'.)
+        runs: The number of timed runs.  (Default: 3.)
+        python: The Python interpreter to run.  (Default: this one.)
+
+    Returns:
+        An OrderedDict mapping the name of every module imported to its
+        fastest Timing across the runs.
+    """
+    # The first run compiles any stale bytecode, so isn't timed.
+    run(module, python)
+
+    fastest = collections.OrderedDict()
+    for _ in range(runs):
+        for name, timing in run(module, python).items():
+            best = fastest.get(name, timing)
+            fastest[name] = Timing(
+                own=min(best.own, timing.own),
+                cumulative=min(best.cumulative, timing.cumulative)
+            )
+    return fastest
+
+
+def report(timings, limit=20):
+    """Formats the slowest imports in a set of timings.
+
+    Args:
+        timings: The Timings, as returned by 'measure'.
+        limit: The number of modules to list.  (Default: 20.)
+
+    Returns:
+        A list of report lines, slowest (by time spent in the module
+        itself) first.
+    """
+    slowest = sorted(
+        timings.items(),
+        key=lambda item: item[1].own,
+        reverse=True
+    )[:limit]
+    return ['{:>9} {:>11}  {}'.format('own (ms)', 'total (ms)', 'module')] + [
+        '{:9.1f} {:11.1f}  {}'.format(
+            timing.own * 1000,
+            timing.cumulative * 1000,
+            name
+        )
+        for name, timing in slowest
+    ]
+
+
+def deferred_imports(timings, deferred=DEFERRED):
+    """Finds the lazily imported modules that were imported anyway.
+
+    Returns:
+        A sorted list of the names of the modules in 'deferred', or
+        submodules of them, that appear in 'timings'.
+    """
+    return sorted(
+        name for name in timings
+        if name.split('.')[0] in deferred
+    )
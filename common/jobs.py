@@ -0,0 +1,493 @@
+"""A small, durable job queue for work that need not hold up a request.
+
+Views enqueue jobs, such as delivering a listener message or subscribing
+a new member to their interests, and return at once; a worker process
+('lass.scripts.run_jobs') runs them.  Jobs are kept in a local SQLite
+file shared by the website and the worker, so they survive restarts of
+either.
+
+A job is a handler name and a JSON-serialisable dict of keyword
+arguments.  Handlers are registered with the 'handler' decorator, in
+modules the worker imports (see 'lass.scripts.run_jobs.JOB_MODULES'):
+
+    @lass.common.jobs.handler('schedule.message')
+    def deliver_message(timeslot_id, content):
+        ...
+
+    lass.common.jobs.enqueue('schedule.message', key='...', ...)
+
+A job whose handler raises is retried with exponential backoff, up to a
+maximum number of attempts, after which it is marked as failed and kept
+for inspection.  A job claimed by a worker that then dies is retried
+once its lease runs out.  Jobs may be given an idempotency key, in which
+case enqueueing a job with the key of a job that is already known does
+nothing.
+
+The queue is configured with these settings:
+
+    lass.jobs.path: The path of the SQLite file holding the queue.  If
+        unset, jobs are run inline when enqueued, as if there were no
+        queue.  (Default: unset.)
+    lass.jobs.max_attempts: The number of times a job is tried before it
+        is marked as failed.  (Default: 5.)
+
+---
+
+Copyright (c) 2013, University Radio York.
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimer in the
+  documentation and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import collections
+import contextlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+import traceback
+
+import transaction
+
+
+log = logging.getLogger(__name__)
+
+
+SETTINGS_PREFIX = 'lass.jobs.'
+
+# The default number of times a job is tried before it is marked as
+# failed.
+DEFAULT_MAX_ATTEMPTS = 5
+
+# The delay, in seconds, before a job's first retry; each further retry
+# waits twice as long as the last, up to MAX_BACKOFF.
+BASE_BACKOFF = 5
+MAX_BACKOFF = 60 * 60
+
+# The number of seconds a worker may spend on a job before the job is
+# presumed abandoned and given to another worker.
+LEASE_TIME = 5 * 60
+
+# The number of seconds for which finished jobs, and so their idempotency
+# keys, are kept.
+RETENTION = 24 * 60 * 60
+
+# The number of seconds to wait for another process's lock on the queue.
+LOCK_TIMEOUT = 10
+
+# Job states.
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+STATES = (QUEUED, RUNNING, DONE, FAILED)
+
+SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS job (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        idempotency_key TEXT UNIQUE,
+        state TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL,
+        run_at REAL NOT NULL,
+        created_at REAL NOT NULL,
+        finished_at REAL,
+        last_error TEXT
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS job_due ON job (state, run_at)'
+)
+
+
+# A job claimed from the queue.
+Job = collections.namedtuple('Job', 'id name payload attempts max_attempts')
+
+
+# Handlers, by name; see 'handler'.
+HANDLERS = {}
+
+
+def handler(name):
+    """Decorator registering a function as the handler for jobs called
+    'name'.
+
+    The function is called with the job's payload as keyword arguments.
+    """
+    def register(function):
+        HANDLERS[name] = function
+        return function
+    return register
+
+
+def backoff(attempts):
+    """Returns the number of seconds to wait before retrying a job that
+    has failed 'attempts' times.
+    """
+    return min(MAX_BACKOFF, BASE_BACKOFF * 2 ** (attempts - 1))
+
+
+class Queue(object):
+    """A job queue held in a SQLite file.
+
+    Each operation uses its own connection, so a Queue can be shared
+    between threads and, through the file, between processes.
+    """
+    def __init__(self, path, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.created = False
+        self.lock = threading.Lock()
+
+    def connect(self):
+        """Opens a connection to the queue, creating it if needed."""
+        connection = sqlite3.connect(
+            self.path,
+            timeout=LOCK_TIMEOUT,
+            isolation_level=None
+        )
+        with self.lock:
+            if not self.created:
+                connection.execute('PRAGMA journal_mode=WAL')
+                for statement in SCHEMA:
+                    connection.execute(statement)
+                self.created = True
+        return connection
+
+    def enqueue(self, name, payload, key=None, delay=0, now=None):
+        """Adds a job to the queue.
+
+        Args:
+            name: The name of the job's handler.
+            payload: A JSON-serialisable dict of keyword arguments for the
+                handler.
+            key: If given, the job's idempotency key.  (Default: None.)
+            delay: The number of seconds to wait before running the job.
+                (Default: 0.)
+            now: The current time; if None, it will be looked up.
+                (Default: None.)
+
+        Returns:
+            The ID of the job, or of the known job with the same key.
+        """
+        now = time.time() if now is None else now
+        connection = self.connect()
+        try:
+            cursor = connection.execute(
+                'INSERT OR IGNORE INTO job (name, payload, idempotency_key,'
+                ' state, max_attempts, run_at, created_at)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (
+                    name,
+                    json.dumps(payload),
+                    key,
+                    QUEUED,
+                    self.max_attempts,
+                    now + delay,
+                    now
+                )
+            )
+            if cursor.rowcount:
+                job_id = cursor.lastrowid
+            else:
+                (job_id,), = connection.execute(
+                    'SELECT id FROM job WHERE idempotency_key = ?',
+                    (key,)
+                ).fetchall()
+        finally:
+            connection.close()
+        return job_id
+
+    def claim(self, now=None):
+        """Takes the next due job off the queue, leasing it to the caller.
+
+        Jobs whose lease has run out are due again.
+
+        Returns:
+            A Job, or None if no job is due.
+        """
+        now = time.time() if now is None else now
+        connection = self.connect()
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            row = connection.execute(
+                'SELECT id, name, payload, attempts, max_attempts FROM job'
+                ' WHERE state IN (?, ?) AND run_at <= ?'
+                ' ORDER BY run_at, id LIMIT 1',
+                (QUEUED, RUNNING, now)
+            ).fetchone()
+            if row is not None:
+                connection.execute(
+                    'UPDATE job SET state = ?, attempts = attempts + 1,'
+                    ' run_at = ? WHERE id = ?',
+                    (RUNNING, now + LEASE_TIME, row[0])
+                )
+            connection.execute('COMMIT')
+        finally:
+            connection.close()
+
+        if row is None:
+            return None
+        job_id, name, payload, attempts, max_attempts = row
+        return Job(
+            job_id,
+            name,
+            json.loads(payload),
+            attempts + 1,
+            max_attempts
+        )
+
+    def complete(self, job, now=None):
+        """Marks a claimed job as done."""
+        self.finish(job.id, DONE, None, now)
+
+    def fail(self, job, error, now=None):
+        """Records the failure of a claimed job, scheduling a retry if it
+        has attempts left.
+
+        Returns:
+            True if the job will be retried; False otherwise.
+        """
+        now = time.time() if now is None else now
+        retry = job.attempts < job.max_attempts
+        if retry:
+            connection = self.connect()
+            try:
+                connection.execute(
+                    'UPDATE job SET state = ?, run_at = ?, last_error = ?'
+                    ' WHERE id = ?',
+                    (QUEUED, now + backoff(job.attempts), error, job.id)
+                )
+            finally:
+                connection.close()
+        else:
+            self.finish(job.id, FAILED, error, now)
+        return retry
+
+    def finish(self, job_id, state, error, now=None):
+        """Marks a job as finished, in the given state."""
+        now = time.time() if now is None else now
+        connection = self.connect()
+        try:
+            connection.execute(
+                'UPDATE job SET state = ?, finished_at = ?, last_error = ?'
+                ' WHERE id = ?',
+                (state, now, error, job_id)
+            )
+        finally:
+            connection.close()
+
+    def purge(self, retention=RETENTION, now=None):
+        """Deletes jobs that finished successfully more than 'retention'
+        seconds ago.
+
+        Returns:
+            The number of jobs deleted.
+        """
+        now = time.time() if now is None else now
+        connection = self.connect()
+        try:
+            cursor = connection.execute(
+                'DELETE FROM job WHERE state = ? AND finished_at < ?',
+                (DONE, now - retention)
+            )
+        finally:
+            connection.close()
+        return cursor.rowcount
+
+    def stats(self, now=None):
+        """Summarises the state of the queue.
+
+        Returns:
+            A dict mapping each job state to the number of jobs in it, plus
+            'oldest_queued', the number of seconds the longest-overdue job
+            has been waiting (0 if none are).
+        """
+        now = time.time() if now is None else now
+        connection = self.connect()
+        try:
+            counts = dict(
+                connection.execute(
+                    'SELECT state, COUNT(*) FROM job GROUP BY state'
+                ).fetchall()
+            )
+            (oldest,), = connection.execute(
+                'SELECT MIN(run_at) FROM job WHERE state = ?',
+                (QUEUED,)
+            ).fetchall()
+        finally:
+            connection.close()
+
+        out = {state: counts.get(state, 0) for state in STATES}
+        out['oldest_queued'] = max(0, now - oldest) if oldest else 0
+        return out
+
+
+class Worker(object):
+    """Runs jobs from a queue, keeping count of what it has done."""
+    def __init__(self, queue, handlers=HANDLERS):
+        self.queue = queue
+        self.handlers = handlers
+        self.counts = collections.Counter()
+        self.busy_time = 0.0
+
+    def run_one(self, now=None):
+        """Claims and runs the next due job.
+
+        Returns:
+            True if a job was run, successfully or not; False if no job
+            was due.
+        """
+        job = self.queue.claim(now)
+        if job is None:
+            return False
+
+        started = time.monotonic()
+        try:
+            self.handlers[job.name](**job.payload)
+        except Exception:
+            error = traceback.format_exc()
+            retry = self.queue.fail(job, error)
+            self.counts['retried' if retry else 'failed'] += 1
+            log.log(
+                logging.WARNING if retry else logging.ERROR,
+                'Job %d (%s) failed on attempt %d/%d%s:\n%s',
+                job.id,
+                job.name,
+                job.attempts,
+                job.max_attempts,
+                '' if retry else '; giving up',
+                error
+            )
+        else:
+            self.queue.complete(job)
+            self.counts['done'] += 1
+        finally:
+            self.busy_time += time.monotonic() - started
+        return True
+
+    def run_due(self, limit=None):
+        """Runs jobs until none are due.
+
+        Args:
+            limit: If given, the maximum number of jobs to run.
+                (Default: None.)
+
+        Returns:
+            The number of jobs run.
+        """
+        run = 0
+        while (limit is None or run < limit) and self.run_one():
+            run += 1
+        return run
+
+    def metrics(self):
+        """Returns this worker's counts merged with the queue's statistics.
+        """
+        return dict(
+            self.queue.stats(),
+            jobs_done=self.counts['done'],
+            jobs_retried=self.counts['retried'],
+            jobs_failed=self.counts['failed'],
+            busy_seconds=round(self.busy_time, 3)
+        )
+
+
+# The queue the website enqueues jobs on; see 'configure'.
+QUEUE = None
+
+
+def configure(settings):
+    """Sets up the shared queue from the Pyramid application settings.
+
+    Returns:
+        The queue, or None if jobs are to be run inline.
+    """
+    global QUEUE
+
+    path = settings.get(SETTINGS_PREFIX + 'path')
+    QUEUE = None if not path else Queue(
+        path,
+        int(
+            settings.get(
+                SETTINGS_PREFIX + 'max_attempts',
+                DEFAULT_MAX_ATTEMPTS
+            )
+        )
+    )
+    return QUEUE
+
+
+def enqueue(name, key=None, delay=0, **payload):
+    """Adds a job to the shared queue.
+
+    If the queue is not configured, the job is run at once instead, and
+    any exception its handler raises is raised here.
+
+    Args:
+        name: The name of the job's handler.
+        key: If given, the job's idempotency key.  (Default: None.)
+        delay: The number of seconds to wait before running the job.
+            (Default: 0.)
+        **payload: The keyword arguments for the handler, which must be
+            JSON-serialisable.
+
+    Returns:
+        The ID of the job, or None if it was run inline.
+    """
+    if QUEUE is None:
+        HANDLERS[name](**payload)
+        job_id = None
+    else:
+        job_id = QUEUE.enqueue(name, payload, key, delay)
+    return job_id
+
+
+@contextlib.contextmanager
+def job_transaction():
+    """Runs the body of a 'with' block in the right transaction for a job.
+
+    A job run by a worker gets a transaction of its own, committed at the
+    end of the block.  A job run inline (see 'enqueue') instead joins the
+    current transaction of the request that enqueued it, and is committed
+    along with it: starting a new transaction there would abort the
+    request's own, silently dropping its work.
+
+    Yields:
+        The transaction.
+    """
+    if is_deferred():
+        with transaction.manager as current:
+            yield current
+    else:
+        yield transaction.get()
+
+
+def is_deferred():
+    """Returns whether enqueued jobs are deferred to a worker, rather than
+    run inline.
+    """
+    return QUEUE is not None
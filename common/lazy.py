@@ -0,0 +1,80 @@
+"""Lazy imports of heavy, rarely used modules.
+
+Some dependencies (feedparser, requests, dateutil) take a noticeable
+share of a worker's start-up time to import, but are only used by a few
+views or jobs.  Modules import these with 'lazy_import', which returns a
+stand-in module that imports the real one the first time one of its
+attributes is used:
+
+    feedparser = lass.common.lazy.lazy_import('feedparser')
+
+Errors such as a missing dependency therefore surface on first use,
+rather than at import time.
+
+The stand-in is deliberately kept out of 'sys.modules'.  Pyramid's view
+decorators look through every loaded module for each view they
+register, which would trip a lazy module kept there (as with
+'importlib.util.LazyLoader') as soon as the views were imported.
+
+---
+
+Copyright (c) 2013, University Radio York.
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimer in the
+  documentation and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import importlib
+import sys
+import types
+
+
+class LazyModule(types.ModuleType):
+    """A stand-in for a module that has not been imported yet.
+
+    Attribute lookups are passed on to the real module, which is
+    imported on the first of them; the stand-in never caches anything
+    itself, so patching the real module (as tests do) still takes
+    effect through it.
+    """
+    def __getattr__(self, name):
+        return getattr(importlib.import_module(self.__name__), name)
+
+    def __repr__(self):
+        return '<lazy module {!r}>'.format(self.__name__)
+
+
+def lazy_import(name):
+    """Imports a module lazily.
+
+    Args:
+        name: The full name of the module, for example 'dateutil.parser'.
+
+    Returns:
+        The module, if it has already been imported; otherwise a
+        LazyModule standing in for it.
+    """
+    module = sys.modules.get(name)
+    if module is None:
+        module = LazyModule(name)
+    return module
@@ -0,0 +1,312 @@
+"""Full-page output caching.
+
+Most of the website's traffic is anonymous, and pages such as the
+schedule, the charts and the podcast lists are the same for everyone
+for minutes at a time.  This module provides a Pyramid tween that keeps
+rendered GET responses in memory, per host, path and query string, for
+as long as the site configuration says each route may be cached:
+
+    # sitewide/page_cache.yml
+    routes:
+        home: 30
+        schedule-thisweek: 60
+
+Routes not listed are never cached, nor are non-GET requests, requests
+with credentials or a session cookie, and responses that are not plain
+successes (errors, redirects, responses setting cookies or marked
+private).  When a popular page expires, concurrent requests for it are
+collapsed onto a single render (see 'lass.common.singleflight').
+Conditional requests whose If-None-Match matches a cached page's ETag
+are answered with 304 Not Modified.
+
+The tween is configured with these settings:
+
+    lass.page_cache.enabled: Whether to cache pages at all.
+        (Default: true.)
+    lass.page_cache.max_entries: The maximum number of pages to keep;
+        the least recently used are dropped first.  (Default: 1000.)
+    lass.page_cache.session_cookies: The names of the cookies, separated
+        by whitespace, that mark a request as belonging to a session.
+        (Default: 'session auth_tkt'.)
+
+---
+
+Copyright (c) 2013, University Radio York.
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimer in the
+  documentation and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import collections
+import logging
+import threading
+import time
+
+import pyramid.httpexceptions
+import pyramid.interfaces
+import pyramid.response
+import pyramid.settings
+
+import lass.common.config
+import lass.common.singleflight
+
+
+log = logging.getLogger(__name__)
+
+
+SETTINGS_PREFIX = 'lass.page_cache.'
+
+
+# The WSGI environ key that, if true, keeps a request out of the cache;
+# used for requests the website makes of itself (see 'lass.common.warmup').
+BYPASS = 'lass.page_cache.bypass'
+
+
+# The cookies that mark a request as part of a (possibly logged-in)
+# session, if the settings don't say otherwise.
+SESSION_COOKIES = ('session', 'auth_tkt')
+
+
+# Response headers that are worked out afresh for each response.
+UNCACHED_HEADERS = ('Content-Length', 'Date')
+
+
+Entry = collections.namedtuple(
+    'Entry',
+    ['expires', 'status', 'headerlist', 'body']
+)
+
+
+class PageCache(object):
+    """A bounded, least-recently-used store of rendered pages."""
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, now=None):
+        """Retrieves the unexpired entry for 'key', or None."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry.expires <= now:
+                    del self.entries[key]
+                    entry = None
+                else:
+                    self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        """Stores an entry, dropping the least recently used if full."""
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        """Drops every entry."""
+        with self.lock:
+            self.entries.clear()
+
+
+def route_ttls():
+    """Reads the per-route cache lifetimes from the site configuration.
+
+    Returns:
+        A dict mapping route names to lifetimes in seconds; empty if the
+        site has no page cache configuration.
+    """
+    try:
+        config = lass.common.config.cached_from_yaml('sitewide/page_cache')
+    except IOError:
+        config = None
+    return (config or {}).get('routes') or {}
+
+
+def route_name(request, registry):
+    """Works out the name of the route a request will match.
+
+    Tweens run before routing, so this asks the route mapper directly.
+
+    Returns:
+        The route name, or None if no route matches.
+    """
+    mapper = registry.queryUtility(pyramid.interfaces.IRoutesMapper)
+    info = mapper(request) if mapper is not None else None
+    route = info['route'] if info else None
+    return route.name if route is not None else None
+
+
+def is_cacheable_request(request, session_cookies=SESSION_COOKIES):
+    """Checks whether a request may be answered from, or stored in, the
+    page cache.
+
+    Args:
+        request: The request.
+        session_cookies: The names of the cookies that mark a request as
+            belonging to a session.  (Default: SESSION_COOKIES.)
+    """
+    return (
+        request.method == 'GET' and
+        not request.environ.get(BYPASS) and
+        request.authorization is None and
+        not any(name in request.cookies for name in session_cookies)
+    )
+
+
+def cache_key(request):
+    """Makes the page cache key of a request.
+
+    Pages contain absolute URLs, so the scheme and host are part of the
+    key as well as the path and query string.
+    """
+    return request.host_url + request.path_qs
+
+
+def entry_for(response, ttl, now=None):
+    """Makes a cache entry from a response, if it may be cached.
+
+    Returns:
+        The Entry, or None if the response is not cacheable.
+    """
+    cache_control = response.cache_control
+    cacheable = (
+        response.status_int == 200 and
+        'Set-Cookie' not in response.headers and
+        not cache_control.private and
+        not cache_control.no_store
+    )
+
+    entry = None
+    if cacheable:
+        now = time.monotonic() if now is None else now
+        entry = Entry(
+            expires=now + ttl,
+            status=response.status,
+            headerlist=tuple(
+                (name, value) for name, value in response.headerlist
+                if name not in UNCACHED_HEADERS
+            ),
+            body=response.body
+        )
+    return entry
+
+
+def response_for(entry, state):
+    """Makes a fresh response from a cache entry.
+
+    Args:
+        entry: The cache entry.
+        state: The value to give the 'X-Page-Cache' header, for example
+            'hit'.
+    """
+    response = pyramid.response.Response(
+        status=entry.status,
+        headerlist=list(entry.headerlist),
+        body=entry.body
+    )
+    response.headers['X-Page-Cache'] = state
+    return response
+
+
+def respond(request, entry, state):
+    """Answers a request from a cache entry.
+
+    Args:
+        request: The request being answered.
+        entry: The cache entry.
+        state: The value to give the 'X-Page-Cache' header; see
+            'response_for'.
+
+    Returns:
+        A 304 Not Modified response if the request's If-None-Match
+        matches the entry's ETag, or the full response otherwise.
+    """
+    response = response_for(entry, state)
+    if response.etag is not None and response.etag in request.if_none_match:
+        response = pyramid.httpexceptions.HTTPNotModified(
+            headers={
+                name: response.headers[name]
+                for name in ('ETag', 'Cache-Control', 'X-Page-Cache')
+                if name in response.headers
+            }
+        )
+    return response
+
+
+def tween_factory(handler, registry):
+    """Creates the page-caching tween.
+
+    If 'lass.page_cache.enabled' is false, the tween is left out of the
+    chain entirely.
+    """
+    settings = registry.settings or {}
+    enabled = settings.get(SETTINGS_PREFIX + 'enabled', True)
+    if not pyramid.settings.asbool(enabled):
+        return handler
+
+    cache = PageCache(
+        int(settings.get(SETTINGS_PREFIX + 'max_entries', 1000))
+    )
+    session_cookies = pyramid.settings.aslist(
+        settings.get(
+            SETTINGS_PREFIX + 'session_cookies',
+            ' '.join(SESSION_COOKIES)
+        )
+    )
+    renders = lass.common.singleflight.Group()
+
+    def render(request, ttl):
+        response = handler(request)
+        return response, entry_for(response, ttl)
+
+    def tween(request):
+        ttl = None
+        if is_cacheable_request(request, session_cookies):
+            ttl = route_ttls().get(route_name(request, registry))
+        if not ttl:
+            return handler(request)
+
+        key = cache_key(request)
+        entry = cache.get(key)
+        if entry is not None:
+            return respond(request, entry, 'hit')
+
+        (response, entry), shared = renders.do(key, render, request, ttl)
+        if entry is None:
+            # Uncacheable, so the leader's response can't be shared with
+            # anyone else; they have to render their own.
+            if shared:
+                response = handler(request)
+        else:
+            if shared:
+                response = respond(request, entry, 'shared')
+            else:
+                cache.put(key, entry)
+                response.headers['X-Page-Cache'] = 'miss'
+        return response
+
+    tween.cache = cache
+    return tween
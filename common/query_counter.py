@@ -0,0 +1,240 @@
+"""Per-request SQL statement counting and N+1 query detection.
+
+This module provides a Pyramid tween that groups the SQL statements run
+during a request by their normalised form.  Statements that are run many
+times over within one request almost always come from lazy relationships
+being walked one object at a time (the "N+1 queries" problem), so these
+are reported as N+1 suspects alongside the request's timings.
+
+The tween sits inside the 'lass.common.database' tween, which does the
+actual statement capturing, and is configured with these settings:
+
+    lass.query_counter.enabled: Whether to group statements at all.
+        (Default: false.)
+    lass.query_counter.threshold: The number of runs of one statement
+        in one request at which it becomes an N+1 suspect.  (Default: 5.)
+    lass.query_counter.budget: The maximum number of statements any view
+        should run, or 0 for no limit.  (Default: 0.)
+    lass.query_counter.budget.ROUTE: A budget for the view on the named
+        route, overriding the above.
+    lass.query_counter.strict: If true, exceeding the budget raises
+        'QueryBudgetExceeded' instead of logging a warning; this is
+        intended for test runs.  (Default: false.)
+
+---
+
+Copyright (c) 2013, University Radio York.
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimer in the
+  documentation and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import collections
+import logging
+import re
+import time
+
+import pyramid.settings
+
+
+log = logging.getLogger(__name__)
+
+
+SETTINGS_PREFIX = 'lass.query_counter.'
+
+
+# Substitutions, in order, that reduce a SQL statement to a normal form in
+# which statements differing only in their parameters are identical.
+NORMALISATIONS = (
+    # String literals
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    # Bind parameters in the various DBAPI styles
+    (re.compile(r'%\(\w+\)s|%s|:\w+|\$\d+'), '?'),
+    # Numeric literals not part of an identifier
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    # Expanded IN-lists and VALUES tuples
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)'), '(?...)'),
+    # Whitespace
+    (re.compile(r'\s+'), ' ')
+)
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised, in strict mode, when a view runs more statements than its
+    query budget allows.
+    """
+    pass
+
+
+def normalise(statement):
+    """Reduces a SQL statement to a normal form that strips out literals
+    and bind parameters.
+
+    Args:
+        statement: The SQL statement, as sent to the DBAPI.
+
+    Returns:
+        The normalised statement.
+    """
+    for pattern, replacement in NORMALISATIONS:
+        statement = pattern.sub(replacement, statement)
+    return statement.strip()
+
+
+def group(statements, statement_time):
+    """Groups raw statement counts and times by normalised statement.
+
+    Args:
+        statements: A Counter mapping raw statements to run counts.
+        statement_time: A Counter mapping raw statements to the total
+            time, in seconds, spent running them.
+
+    Returns:
+        A list of (normalised statement, count, total time) tuples, in
+        descending order of count.
+    """
+    counts = collections.Counter()
+    times = collections.Counter()
+    for statement, count in statements.items():
+        key = normalise(statement)
+        counts[key] += count
+        times[key] += statement_time[statement]
+
+    return [
+        (statement, count, times[statement])
+        for statement, count in counts.most_common()
+    ]
+
+
+def suspects(grouped, threshold):
+    """Picks out the N+1 suspects from a list of grouped statements.
+
+    Args:
+        grouped: The result of 'group'.
+        threshold: The number of runs at which a statement is suspect.
+
+    Returns:
+        The entries in 'grouped' run at least 'threshold' times.
+    """
+    return [entry for entry in grouped if entry[1] >= threshold]
+
+
+def budget_for(settings, route_name):
+    """Finds the query budget for a route, or 0 if there is none."""
+    default = settings.get(SETTINGS_PREFIX + 'budget', 0)
+    if route_name is not None:
+        default = settings.get(
+            '{}budget.{}'.format(SETTINGS_PREFIX, route_name),
+            default
+        )
+    return int(default)
+
+
+def view_name(request):
+    """Returns a name identifying the view a request was routed to."""
+    route = getattr(request, 'matched_route', None)
+    return route.name if route is not None else request.path
+
+
+def tween_factory(handler, registry):
+    """Creates the statement-counting tween.
+
+    If 'lass.query_counter.enabled' is not set, the tween is left out of
+    the chain entirely.
+    """
+    settings = registry.settings
+    if not pyramid.settings.asbool(settings.get(SETTINGS_PREFIX + 'enabled')):
+        return handler
+
+    threshold = int(settings.get(SETTINGS_PREFIX + 'threshold', 5))
+    strict = pyramid.settings.asbool(settings.get(SETTINGS_PREFIX + 'strict'))
+
+    def tween(request):
+        stats = getattr(request, 'database_stats', None)
+        if stats is None:
+            # The database tween isn't above us, so nothing is captured.
+            return handler(request)
+
+        stats.statements = collections.Counter()
+        stats.statement_time = collections.Counter()
+
+        started = time.perf_counter()
+        response = handler(request)
+        taken = time.perf_counter() - started
+
+        check(
+            request,
+            stats,
+            taken,
+            threshold,
+            budget_for(settings, view_name(request)),
+            strict
+        )
+        return response
+
+    return tween
+
+
+def check(request, stats, taken, threshold, budget, strict):
+    """Reports on the statements run by a finished request.
+
+    Args:
+        request: The finished request.
+        stats: The request's 'lass.common.database.RequestStats'.
+        taken: The time, in seconds, the request took to handle.
+        threshold: The N+1 suspect threshold.
+        budget: The query budget for the request's view, or 0 for none.
+        strict: If True, raise instead of warning on a blown budget.
+
+    Raises:
+        QueryBudgetExceeded: if 'strict' is set and the budget is blown.
+    """
+    name = view_name(request)
+    grouped = group(stats.statements, stats.statement_time)
+
+    log.info(
+        '%s: %.1fms total, %d statements (%d distinct) in %.1fms',
+        name,
+        taken * 1000,
+        stats.queries,
+        len(grouped),
+        stats.query_time * 1000
+    )
+    for statement, count, statement_time in suspects(grouped, threshold):
+        log.warning(
+            '%s: possible N+1 query, run %d times in %.1fms: %s',
+            name,
+            count,
+            statement_time * 1000,
+            statement
+        )
+
+    if budget and stats.queries > budget:
+        message = '{} ran {} statements, over its budget of {}.'.format(
+            name,
+            stats.queries,
+            budget
+        )
+        if strict:
+            raise QueryBudgetExceeded(message)
+        log.warning(message)
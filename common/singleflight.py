@@ -0,0 +1,146 @@
+"""Duplicate call suppression ("single flight").
+
+When many threads want the same expensive result at once (for example,
+when a popular cached page expires), a Group lets only the first of them
+compute it; the others wait for, and share, its result.
+
+The 'coalesce' decorator applies this to every call of a function, such
+as a popular database query that dozens of concurrent requests would
+otherwise each run at once.
+
+---
+
+Copyright (c) 2013, University Radio York.
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimer in the
+  documentation and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import functools
+import threading
+
+
+class Call(object):
+    """A call in flight, which waiting threads can share the result of."""
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class Group(object):
+    """A set of keyed calls in which each key has at most one call in
+    flight at a time.
+    """
+    def __init__(self):
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def do(self, key, function, *args, **kwargs):
+        """Calls 'function' unless a call for 'key' is already in flight,
+        in which case this waits for that call and shares its outcome.
+
+        Args:
+            key: The (hashable) key identifying the call.
+            function: The function to call.
+            *args: Positional arguments for 'function'.
+            **kwargs: Keyword arguments for 'function'.
+
+        Returns:
+            A tuple of the result of the call and a boolean that is True if
+            the result was shared with (that is, computed by) another
+            caller.
+
+        Raises:
+            Anything 'function' raises; a shared call's exception is raised
+            in every caller that waited on it.
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = Call()
+
+        if leader:
+            try:
+                call.result = function(*args, **kwargs)
+            except BaseException as error:
+                call.error = error
+                raise
+            finally:
+                with self.lock:
+                    del self.calls[key]
+                call.done.set()
+        else:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+
+        return call.result, not leader
+
+    def in_flight(self):
+        """Returns the number of calls currently in flight."""
+        with self.lock:
+            return len(self.calls)
+
+
+def coalesce(key, adopt=None):
+    """Decorator making concurrent calls to a function share one call.
+
+    Calls are only shared while one is in flight: nothing is cached, so
+    a call made after the last one finished runs the function again.
+
+    Args:
+        key: A function taking the decorated function's arguments and
+            returning the (hashable) key of the call; calls with equal
+            keys are shared.  Arguments left out of the key, such as the
+            current time, are taken from whichever caller went first.
+        adopt: If given, a function through which results computed by
+            another caller are passed before being returned, for example
+            to move database instances into the caller's own session (see
+            'lass.common.database.merge_instances').  (Default: None.)
+
+    Returns:
+        The decorator.  The Group of the decorated function is available
+        as its 'flights' attribute.
+    """
+    def decorator(function):
+        flights = Group()
+
+        @functools.wraps(function)
+        def coalesced(*args, **kwargs):
+            result, shared = flights.do(
+                key(*args, **kwargs),
+                function,
+                *args,
+                **kwargs
+            )
+            if shared and adopt is not None:
+                result = adopt(result)
+            return result
+
+        coalesced.flights = flights
+        return coalesced
+    return decorator
@@ -27,12 +27,43 @@ LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
 NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
+import collections
+import contextlib
 import datetime
 import functools
+import http.server
 import itertools
+import json
+import os
+import pyramid.config
+import pyramid.request
+import pyramid.response
+import pyramid.testing
 import pytz
+import socketserver
+import sqlalchemy.exc
+import tempfile
+import threading
+import time
+import unittest.mock
 
+import lass.common.api
+import lass.common.benchmark
+import lass.common.config
+import lass.common.database
+import lass.common.import_time
+import lass.common.jobs
+import lass.common.lazy
 import lass.common.mixins
+import lass.common.page_cache
+import lass.common.query_counter
+import lass.common.singleflight
+import lass.common.view_helpers
+import lass.common.warmup
+import lass.model_base
+import lass.people.models
+import lass.schedule.models
+import lass.uryplayer.models
 
 
 aware = functools.partial(datetime.datetime, tzinfo=pytz.utc)
@@ -160,3 +191,874 @@ def test_transient_not_finished_by():
                     transient.effective_to
                 )
             )
+
+
+def test_database_pool_options():
+    """Tests 'lass.common.database.pool_options'."""
+    # Unset options should take their defaults...
+    defaults = lass.common.database.pool_options({})
+    for name, _, default in lass.common.database.POOL_SETTINGS:
+        assert defaults[name] == default, 'Bad default for {}.'.format(name)
+
+    # ...and set ones should be converted from the settings strings.
+    options = lass.common.database.pool_options(
+        {'lass.database.pool_size': '20', 'lass.database.pool_recycle': '60'}
+    )
+    assert options['pool_size'] == 20, 'pool_size not read.'
+    assert options['pool_recycle'] == 60, 'pool_recycle not read.'
+
+
+def test_database_request_stats():
+    """Tests that the database tween counts queries per request."""
+    engine = lass.common.database.engine_from_settings(
+        {'sqlalchemy.url': 'sqlite://'}
+    )
+    registry = unittest.mock.Mock(settings={})
+
+    def handler(request):
+        for _ in range(3):
+            engine.execute('SELECT 1')
+        return request.database_stats
+
+    tween = lass.common.database.tween_factory(handler, registry)
+    stats = tween(unittest.mock.Mock(path='/test'))
+
+    assert stats.queries == 3, 'Expected 3 queries, got {}.'.format(
+        stats.queries
+    )
+    assert stats.checkouts == 3, 'Expected 3 checkouts, got {}.'.format(
+        stats.checkouts
+    )
+    assert lass.common.database.current_request_stats() is None, (
+        'Request stats outlived the request.'
+    )
+
+    summary = lass.common.database.summary()
+    assert summary['checked_out'] == 0, 'Connections were leaked.'
+    assert 0 <= summary['saturation'] <= 1, 'Saturation out of range.'
+    assert summary['capacity'] == 15, 'Capacity ignores the settings.'
+
+    # Failed statements don't leave their start times behind.
+    with engine.connect() as connection:
+        try:
+            connection.execute('SELECT * FROM no_such_table')
+        except sqlalchemy.exc.OperationalError:
+            pass
+        else:
+            assert False, 'Statement should have failed.'
+        assert connection.info['query_start'] == []
+
+
+def test_database_may_see_status():
+    """Tests 'lass.common.database.may_see_status'."""
+    def request(address, **settings):
+        return unittest.mock.Mock(
+            client_addr=address,
+            registry=unittest.mock.Mock(settings=settings)
+        )
+
+    may_see_status = lass.common.database.may_see_status
+    assert may_see_status(request('127.0.0.1'))
+    assert not may_see_status(request('192.0.2.1'))
+    assert may_see_status(
+        request(
+            '192.0.2.1',
+            **{'lass.database.status_addresses': '192.0.2.1 192.0.2.2'}
+        )
+    )
+
+
+def test_query_counter_normalise():
+    """Tests 'lass.common.query_counter.normalise'."""
+    normalise = lass.common.query_counter.normalise
+
+    # Statements differing only in parameters should normalise the same.
+    assert normalise(
+        'SELECT a FROM b WHERE b.id = %(id_1)s'
+    ) == normalise(
+        'SELECT a FROM b\n  WHERE b.id = 42'
+    ), 'Parameters and literals not normalised.'
+
+    assert normalise(
+        "SELECT a FROM b WHERE b.name = 'horse'"
+    ) == normalise(
+        "SELECT a FROM b WHERE b.name = 'it''s a camel'"
+    ), 'String literals not normalised.'
+
+    # IN-lists of any length should collapse.
+    assert normalise(
+        'SELECT a FROM b WHERE b.id IN (?, ?)'
+    ) == normalise(
+        'SELECT a FROM b WHERE b.id IN (:id_1, :id_2, :id_3)'
+    ), 'IN-lists not collapsed.'
+
+    # Identifiers containing digits should be left alone.
+    assert 'table_2' in normalise('SELECT * FROM table_2'), (
+        'Identifier mangled.'
+    )
+
+
+def test_query_counter_suspects():
+    """Tests N+1 detection in 'lass.common.query_counter'."""
+    lazy_load = 'SELECT * FROM show_type WHERE show_type_id = {}'
+    statements = collections.Counter(
+        {lazy_load.format(i): 1 for i in range(6)}
+    )
+    statements['SELECT * FROM show'] = 1
+    times = collections.Counter({statement: 0.001 for statement in statements})
+
+    grouped = lass.common.query_counter.group(statements, times)
+    assert len(grouped) == 2, 'Expected 2 distinct statements.'
+
+    suspects = lass.common.query_counter.suspects(grouped, 5)
+    assert len(suspects) == 1, 'Expected exactly 1 N+1 suspect.'
+    assert suspects[0][1] == 6, 'Suspect count wrong.'
+
+
+def test_query_counter_budget():
+    """Tests that strict mode enforces the query budget."""
+    engine = lass.common.database.engine_from_settings(
+        {'sqlalchemy.url': 'sqlite://'}
+    )
+    registry = unittest.mock.Mock(
+        settings={
+            'lass.query_counter.enabled': 'true',
+            'lass.query_counter.strict': 'true',
+            'lass.query_counter.budget': '5',
+            'lass.query_counter.budget.greedy': '2'
+        }
+    )
+
+    def handler(request):
+        for _ in range(3):
+            engine.execute('SELECT 1')
+        return 'OK'
+
+    tween = lass.common.database.tween_factory(
+        lass.common.query_counter.tween_factory(handler, registry),
+        registry
+    )
+
+    def request(route_name):
+        request = unittest.mock.Mock(path='/test')
+        request.matched_route.name = route_name
+        return request
+
+    assert tween(request('frugal')) == 'OK', 'Budget wrongly enforced.'
+    try:
+        tween(request('greedy'))
+    except lass.common.query_counter.QueryBudgetExceeded:
+        pass
+    else:
+        assert False, 'Per-route budget not enforced.'
+
+
+#
+# lass.common.config
+#
+
+
+def test_config_cached_from_yaml():
+    """Tests 'lass.common.config.cached_from_yaml'."""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'test.yml')
+        open(path, 'w').close()
+
+        with unittest.mock.patch(
+            'lass.common.config.config_path',
+            return_value=path
+        ), unittest.mock.patch(
+            'lass.common.config.from_yaml',
+            side_effect=lambda _: {'a': 1}
+        ) as from_yaml:
+            first = lass.common.config.cached_from_yaml('test')
+            assert first == {'a': 1}
+            # Unchanged files should not be re-read.
+            assert lass.common.config.cached_from_yaml('test') is first
+            assert from_yaml.call_count == 1
+
+            os.utime(path, (0, 0))
+
+            second = lass.common.config.cached_from_yaml('test')
+            assert second is not first
+            assert lass.common.config.cached_from_yaml('test') is second
+            assert from_yaml.call_count == 2
+
+
+#
+# lass.common.view_helpers
+#
+
+
+def test_view_helpers_detail_conditional():
+    """Tests that detail views answer revalidations with 304s, and that
+    their versions change when their metadata does.
+    """
+    Podcast = lass.uryplayer.models.Podcast
+    row = lass.common.benchmark.row
+    now = datetime.datetime.now(pytz.utc)
+
+    def get(etag=None):
+        request = pyramid.request.Request.blank(
+            '/podcasts/1',
+            headers={'If-None-Match': etag} if etag else {}
+        )
+        request.matchdict = {'podcastid': '1'}
+        request.registry = registry
+        return request, lass.common.view_helpers.detail(
+            request,
+            id_name='podcastid',
+            source=Podcast,
+            target_name='podcast'
+        )
+
+    def add_title(title_id, title, effective_from=None):
+        if effective_from is None:
+            effective_from = now - datetime.timedelta(days=title_id)
+        lass.common.benchmark.insert(
+            engine,
+            lass.uryplayer.models.PodcastText,
+            [
+                row(
+                    lass.uryplayer.models.PodcastText,
+                    id=title_id,
+                    subject_id=1,
+                    key_id=1,
+                    value=title,
+                    effective_from=effective_from,
+                    owner_id=1,
+                    approver_id=1
+                )
+            ]
+        )
+
+    registry = pyramid.testing.setUp().registry
+    try:
+        with lass.common.benchmark.standin() as engine:
+            lass.common.benchmark.insert(engine, lass.people.models.Person, [
+                row(lass.people.models.Person, id=1)
+            ])
+            lass.common.benchmark.insert(engine, Podcast, [
+                row(Podcast, id=1, file='a.mp3', submitted_at=now, owner_id=1)
+            ])
+            lass.common.benchmark.insert(
+                engine,
+                lass.metadata.models.Key,
+                [
+                    row(
+                        lass.metadata.models.Key,
+                        id=1,
+                        name='title',
+                        description='title',
+                        allow_multiple=False,
+                        searchable=False
+                    )
+                ]
+            )
+            add_title(1, 'First')
+
+            request, context = get()
+            assert context['page_title'] == 'First'
+            etag = request.response.headers['ETag']
+            assert 'max-age' in request.response.headers['Cache-Control']
+
+            _, response = get(etag)
+            assert response.status_int == 304
+            assert response.headers['ETag'] == etag
+
+            lass.common.benchmark.reset_session()
+            add_title(2, 'Second')
+            _, context = get(etag)
+            assert not isinstance(context, pyramid.response.Response)
+
+            # Versions change when metadata takes effect, even though the
+            # database doesn't.
+            later = now + datetime.timedelta(days=1)
+            add_title(3, 'Third', effective_from=later)
+            tokens = {
+                lass.common.view_helpers.version_token(Podcast, 1, now=when)
+                for when in (now, later - datetime.timedelta(seconds=1))
+            }
+            assert len(tokens) == 1
+            assert lass.common.view_helpers.version_token(
+                Podcast,
+                1,
+                now=later + datetime.timedelta(seconds=1)
+            ) not in tokens
+    finally:
+        pyramid.testing.tearDown()
+
+
+#
+# lass.common.api
+#
+
+
+class StubAPIServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """A local stand-in for the URY API.
+
+    'responses' maps paths to lists of (status, delay, body) tuples, which
+    are served in turn, the last being repeated.
+    """
+    daemon_threads = True
+
+    def __init__(self, responses):
+        super().__init__(('127.0.0.1', 0), StubAPIHandler)
+        self.responses = {
+            path: list(queue) for path, queue in responses.items()
+        }
+        self.requests = []
+        self.lock = threading.Lock()
+
+    @property
+    def connections(self):
+        """The number of distinct connections requests arrived on."""
+        return len({port for _, port in self.requests})
+
+
+class StubAPIHandler(http.server.BaseHTTPRequestHandler):
+    """Request handler for 'StubAPIServer'."""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        path = self.path.partition('?')[0]
+        with self.server.lock:
+            self.server.requests.append((path, self.client_address[1]))
+            queue = self.server.responses.get(path, [(404, 0, None)])
+            status, delay, body = (
+                queue.pop(0) if len(queue) > 1 else queue[0]
+            )
+        time.sleep(delay)
+
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@contextlib.contextmanager
+def stub_api(responses, **config):
+    """Runs a stub API server, yielding it and an API configuration for
+    it.
+    """
+    server = StubAPIServer(responses)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server, dict(
+            {
+                'api-root': 'http://127.0.0.1:{}'.format(
+                    server.server_address[1]
+                ),
+                'param-api-key': 'api_key',
+                'api-key': 'test',
+                'backoff': 0
+            },
+            **config
+        )
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_api_client():
+    """Tests connection reuse, caching, retries and errors in the API
+    client.
+    """
+    ok = (200, 0, {'payload': 'ok'})
+    with stub_api(
+        {
+            '/User/1': [ok],
+            '/User/2': [ok],
+            '/flaky': [(503, 0, None), (502, 0, None), ok],
+            '/down': [(503, 0, None)],
+            '/slow': [(200, 1, None)]
+        },
+        timeout=0.3,
+        retries=2
+    ) as (server, config):
+        client = lass.common.api.Client(config)
+
+        assert client.get('User/1') == {'payload': 'ok'}
+        assert client.get('User/1') == {'payload': 'ok'}
+        assert client.get('User/1', max_age=0) == {'payload': 'ok'}
+        assert client.get('User/2') == {'payload': 'ok'}
+        # One request is cached; the rest share one connection.
+        assert len(server.requests) == 3
+        assert server.connections == 1
+
+        # Transient failures are retried; persistent ones are not hidden.
+        assert client.get('flaky') == {'payload': 'ok'}
+        for resource, error in (
+            ('down', lass.common.api.Error),
+            ('nowhere', lass.common.api.NotFound),
+            ('slow', lass.common.api.Error)
+        ):
+            try:
+                client.get(resource)
+            except error:
+                pass
+            else:
+                assert False, 'No {} for {}.'.format(error, resource)
+        assert [path for path, _ in server.requests].count('/down') == 3
+
+        client.close()
+
+
+def test_api_get_many():
+    """Tests that the API client fans requests out concurrently."""
+    responses = {
+        '/User/{}'.format(i): [(200, 0.2, {'id': i})] for i in range(8)
+    }
+    with stub_api(responses) as (server, config):
+        started = time.monotonic()
+        results = lass.common.api.get_many(
+            ['User/{}'.format(i) for i in range(8)] + ['nowhere'],
+            config
+        )
+        elapsed = time.monotonic() - started
+
+    assert results[:8] == [{'id': i} for i in range(8)]
+    assert isinstance(results[8], lass.common.api.NotFound)
+    assert elapsed < 1, 'Requests were not made concurrently.'
+    assert lass.common.api.client(config) is lass.common.api.client(config)
+
+
+def test_api_client_replaced():
+    """Tests that replacing the shared API client leaves the old one
+    working for any threads still using it.
+    """
+    with stub_api({'/User/1': [(200, 0, {'id': 1})]}) as (server, config):
+        old = lass.common.api.client(config)
+        assert old.get('User/1') == {'id': 1}
+
+        new = lass.common.api.client(dict(config))
+        assert new is not old
+        assert old.get('User/1') == {'id': 1}
+        assert old.get('User/1', max_age=0) == {'id': 1}
+        # The cached response was kept, and the connection left open.
+        assert len(server.requests) == 2
+        assert server.connections == 1
+
+
+#
+# lass.common.jobs
+#
+
+
+def test_jobs_queue():
+    """Tests enqueueing, claiming, retrying and idempotency in the job
+    queue.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        queue = lass.common.jobs.Queue(
+            os.path.join(directory, 'jobs.sqlite'),
+            max_attempts=2
+        )
+        first = queue.enqueue('a', {'x': 1}, key='k', now=100)
+        assert queue.enqueue('a', {'x': 2}, key='k', now=100) == first
+        second = queue.enqueue('b', {}, delay=3, now=100)
+        assert queue.stats(now=101)[lass.common.jobs.QUEUED] == 2
+
+        job = queue.claim(now=101)
+        assert job == (first, 'a', {'x': 1}, 1, 2)
+        assert queue.claim(now=101) is None  # 'b' is not due yet.
+
+        # The first failure is retried after a backoff; the second isn't.
+        assert queue.fail(job, 'oops', now=101)
+        retry_at = 101 + lass.common.jobs.backoff(1)
+        assert queue.claim(now=retry_at - 1).id == second
+        job = queue.claim(now=retry_at)
+        assert job.id == first and job.attempts == 2
+        assert not queue.fail(job, 'oops again', now=retry_at)
+        assert queue.claim(now=retry_at) is None
+
+        # Abandoned jobs are claimed again once their lease runs out.
+        assert queue.claim(
+            now=retry_at - 1 + lass.common.jobs.LEASE_TIME
+        ).id == second
+
+        stats = queue.stats(now=retry_at)
+        assert stats[lass.common.jobs.FAILED] == 1
+        assert stats[lass.common.jobs.RUNNING] == 1
+        assert stats['oldest_queued'] == 0
+
+
+def test_jobs_worker():
+    """Tests running jobs with a Worker, and running them inline."""
+    done = []
+
+    def ok(value):
+        done.append(value)
+
+    def broken():
+        raise ValueError
+
+    handlers = {'ok': ok, 'broken': broken}
+    with tempfile.TemporaryDirectory() as directory:
+        queue = lass.common.jobs.Queue(os.path.join(directory, 'jobs'))
+        for value in range(3):
+            queue.enqueue('ok', {'value': value})
+        queue.enqueue('broken', {})
+
+        worker = lass.common.jobs.Worker(queue, handlers)
+        assert worker.run_due() == 4
+        assert done == [0, 1, 2]
+        metrics = worker.metrics()
+        assert metrics['jobs_done'] == 3 and metrics['jobs_retried'] == 1
+        assert metrics[lass.common.jobs.QUEUED] == 1
+        assert queue.purge(retention=0, now=time.time() + 1) == 3
+
+    with unittest.mock.patch.dict(lass.common.jobs.HANDLERS, handlers):
+        assert lass.common.jobs.configure({}) is None
+        assert lass.common.jobs.enqueue('ok', value=3) is None
+    assert done == [0, 1, 2, 3]
+
+
+#
+# lass.common.singleflight
+#
+
+
+def test_singleflight_group():
+    """Tests that concurrent calls in a singleflight Group collapse."""
+    group = lass.common.singleflight.Group()
+    release = threading.Event()
+    calls = []
+    results = []
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return 'done'
+
+    def worker():
+        results.append(group.do('key', slow))
+
+    threads = [threading.Thread(target=worker) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    while not calls:
+        time.sleep(0.01)
+    time.sleep(0.05)  # Let the others pile up behind the first call.
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert sorted(results) == [('done', False)] + [('done', True)] * 4
+    assert group.in_flight() == 0
+
+    # Errors propagate, and don't wedge the key.
+    def broken():
+        raise ValueError
+
+    try:
+        group.do('key', broken)
+    except ValueError:
+        pass
+    else:
+        assert False, 'Error was swallowed.'
+    assert group.do('key', lambda: 1) == (1, False)
+
+
+#
+# lass.common.page_cache
+#
+
+
+def test_singleflight_coalesce():
+    """Tests the singleflight 'coalesce' decorator."""
+    release = threading.Event()
+    calls = []
+    results = []
+
+    @lass.common.singleflight.coalesce(
+        key=lambda name, now: name,
+        adopt=lambda result: ('adopted', result)
+    )
+    def slow(name, now):
+        calls.append((name, now))
+        release.wait(5)
+        return name
+
+    threads = [
+        threading.Thread(target=lambda i=i: results.append(slow('a', i)))
+        for i in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    while not calls:
+        time.sleep(0.01)
+    time.sleep(0.05)  # Let the others pile up behind the first call.
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    # Only the key matters, so the other calls shared the first's 'now'.
+    assert len(calls) == 1
+    assert sorted(results, key=str) == [('adopted', 'a')] * 3 + ['a']
+    assert slow.flights.in_flight() == 0
+
+    # Nothing is kept once the call has finished.
+    assert slow('a', 9) == 'a'
+    assert calls[-1] == ('a', 9)
+
+
+def test_database_merge_instances():
+    """Tests 'lass.common.database.merge_instances'."""
+    Person = lass.people.models.Person
+    with lass.common.benchmark.standin() as engine:
+        lass.common.benchmark.insert(engine, Person, [
+            lass.common.benchmark.row(Person, id=1)
+        ])
+
+        # Load the person in another thread, and so another session.
+        loaded = []
+        thread = threading.Thread(
+            target=lambda: loaded.append(
+                lass.model_base.DBSession.query(Person).get(1)
+            )
+        )
+        thread.start()
+        thread.join()
+        person = loaded[0]
+        assert person not in lass.model_base.DBSession
+
+        merged = lass.common.database.merge_instances([[1, person], (person,)])
+        assert merged[0][0] == 1
+        copy = merged[0][1]
+        assert copy is not person
+        assert copy is merged[1][0]
+        assert copy in lass.model_base.DBSession
+        assert copy.id == 1
+
+
+def test_page_cache():
+    """Tests the page cache tween."""
+    config = pyramid.testing.setUp()
+    config.add_route('cached', '/cached')
+    config.add_route('uncached', '/uncached')
+    config.commit()
+    renders = []
+
+    def handler(request):
+        renders.append(request.path_qs)
+        response = pyramid.response.Response(
+            'page {}'.format(len(renders))
+        )
+        if 'cookie' in request.params:
+            response.set_cookie('a', 'b')
+        return response
+
+    def get(path, method='GET', **headers):
+        return tween(
+            pyramid.request.Request.blank(path, method=method, headers=headers)
+        )
+
+    try:
+        with unittest.mock.patch(
+            'lass.common.page_cache.route_ttls',
+            return_value={'cached': 60}
+        ):
+            tween = lass.common.page_cache.tween_factory(
+                handler,
+                config.registry
+            )
+
+            first = get('/cached')
+            assert first.headers['X-Page-Cache'] == 'miss'
+            second = get('/cached')
+            assert second.headers['X-Page-Cache'] == 'hit'
+            assert second.body == first.body
+            assert renders == ['/cached']
+
+            # Query strings are cached separately.
+            assert get('/cached?page=2').body == b'page 2'
+
+            # These should all go straight through.
+            get('/uncached')
+            get('/uncached')
+            get('/cached', method='POST')
+            get('/cached?cookie=1')
+            get('/cached?cookie=1')
+            assert len(renders) == 7
+
+            # Expired pages are rendered again.
+            key = 'http://localhost/cached'
+            tween.cache.entries[key] = (
+                tween.cache.entries[key]._replace(expires=0)
+            )
+            assert get('/cached').body == b'page 8'
+
+            # Pages are cached per scheme and host.
+            other = get('https://example.org/cached')
+            assert other.headers['X-Page-Cache'] == 'miss'
+            assert other.body == b'page 9'
+            assert get('/cached').body == b'page 8'
+
+            # Session cookies bypass the cache.
+            assert get('/cached', Cookie='session=abc').body == b'page 10'
+            assert get('/cached', Cookie='other=abc').body == b'page 8'
+
+            # Cached pages answer conditional requests.
+            tween.cache.entries[key] = tween.cache.entries[key]._replace(
+                headerlist=tween.cache.entries[key].headerlist + (
+                    ('ETag', '"v1"'),
+                )
+            )
+            assert get('/cached', **{'If-None-Match': '"v1"'}).status_int == 304
+            assert get('/cached', **{'If-None-Match': '"v0"'}).body == (
+                b'page 8'
+            )
+    finally:
+        pyramid.testing.tearDown()
+
+
+def test_page_cache_lru():
+    """Tests that the page cache drops the least recently used pages."""
+    cache = lass.common.page_cache.PageCache(max_entries=2)
+    entry = lass.common.page_cache.Entry(
+        expires=time.monotonic() + 60,
+        status='200 OK',
+        headerlist=(),
+        body=b''
+    )
+    cache.put('a', entry)
+    cache.put('b', entry)
+    cache.get('a')
+    cache.put('c', entry)
+
+    assert list(cache.entries) == ['a', 'c']
+
+
+#
+# lass.common.warmup
+#
+
+
+def test_warmup():
+    """Tests 'lass.common.warmup.warm'."""
+    config = pyramid.config.Configurator()
+    config.add_route('home', '/')
+    config.add_route('detail', '/detail/{id}')
+    rendered = []
+    bypassed = []
+
+    def view(request):
+        rendered.append(request.path)
+        bypassed.append(request.environ.get(lass.common.page_cache.BYPASS))
+        return pyramid.response.Response(request.host_url)
+
+    config.add_view(view, route_name='home')
+    app = config.make_wsgi_app()
+
+    ShowType = lass.schedule.models.ShowType
+    row = lass.common.benchmark.row
+    with lass.common.benchmark.standin() as engine:
+        lass.common.benchmark.insert(engine, ShowType, [
+            row(
+                ShowType,
+                id=type_id,
+                name=name,
+                description=name,
+                is_public=True,
+                is_collapsible=False,
+                can_be_messaged=False
+            )
+            for type_id, name in ((1, 'show'), (2, 'sustainer'))
+        ])
+        assert lass.common.warmup.warm_queries([ShowType]) == 2
+
+        with unittest.mock.patch(
+            'lass.common.warmup.load_config',
+            return_value=0
+        ):
+            timings = lass.common.warmup.warm(
+                app,
+                {'lass.warmup.routes': 'home missing'}
+            )
+        assert list(timings) == ['mappers', 'config', 'queries', 'pages']
+        assert rendered == ['/']
+        # Without a public base URL, pages stay out of the page cache.
+        assert bypassed == [True]
+
+        # Routes with parameters can't be warmed, but don't stop startup.
+        timings = lass.common.warmup.warm(
+            app,
+            {'lass.warmup.routes': 'detail home'}
+        )
+        assert 'pages' in timings
+        assert rendered == ['/']
+
+    assert lass.common.warmup.render_pages(
+        app,
+        ['home'],
+        base_url='https://example.org'
+    ) == {'home': '200 OK'}
+    assert bypassed[-1] is None
+    assert lass.common.warmup.warm(app, {'lass.warmup.enabled': 'false'}) == {}
+
+
+#
+# lass.common.lazy
+#
+
+
+def test_lazy_import():
+    """Tests 'lass.common.lazy.lazy_import'."""
+    assert lass.common.lazy.lazy_import('json') is json
+
+    lazy = lass.common.lazy.lazy_import('lass.common.tests_missing')
+    assert isinstance(lazy, lass.common.lazy.LazyModule)
+    try:
+        lazy.anything
+    except ImportError:
+        pass
+    else:
+        assert False, 'Lazy import of a missing module succeeded.'
+
+    # Lazy modules pass lookups on to the real module, patches and all.
+    lazy = lass.common.lazy.LazyModule('json')
+    assert lazy.dumps([]) == '[]'
+    with unittest.mock.patch('json.dumps', return_value='patched'):
+        assert lazy.dumps([]) == 'patched'
+
+
+#
+# lass.common.import_time
+#
+
+
+def test_import_time_parse():
+    """Tests 'lass.common.import_time.parse'."""
+    timings = lass.common.import_time.parse([
+        'import time: self [us] | cumulative | imported package',
+        'import time:       100 |        100 |     requests.compat',
+        'import time:      2000 |       2100 |   requests',
+        'something else'
+    ])
+    assert list(timings) == ['requests.compat', 'requests']
+    assert timings['requests'] == lass.common.import_time.Timing(
+        own=0.002,
+        cumulative=0.0021
+    )
+    assert lass.common.import_time.deferred_imports(timings) == [
+        'requests',
+        'requests.compat'
+    ]
+    assert len(lass.common.import_time.report(timings, limit=1)) == 2
+
+
+def test_import_budget():
+    """Tests that importing the website stays within its start-up budget,
+    and leaves the lazily imported modules alone.
+    """
+    timings = lass.common.import_time.measure('lass', runs=1)
+    assert lass.common.import_time.deferred_imports(timings) == []
+    assert timings['lass'].cumulative < lass.common.import_time.BUDGET
@@ -28,10 +28,14 @@ NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
+import hashlib
+
 import pyramid
 import sqlalchemy
 
 import lass.common.media_list
+import lass.common.mixins
+import lass.common.time
 import lass.model_base
 import lass.metadata.models
 import lass.metadata.query
@@ -167,12 +171,18 @@ def truth(*_):
     return True
 
 
+# How long, in seconds, clients may reuse a detail page before checking
+# whether it has changed.
+DETAIL_MAX_AGE = 60
+
+
 def detail(request,
     id_name,
     source,
     target_name='item',
     constraint=truth,
-    query_options=()
+    query_options=(),
+    version_sources=()
 ):
     """Implements a generic item detail view function.
 
@@ -181,6 +191,11 @@ def detail(request,
     set as such in the relationship configuration or via
     'query_options'.
 
+    Detail views are conditional: the response carries an ETag derived
+    from the item's version (see 'version_token'), and if the client
+    already has that version, it gets a 304 Not Modified before any
+    eager loading, annotation or rendering happens.
+
     Args:
         request: The request that triggered the calling view.
         id_name: The name of the matchdict key in which the primary key
@@ -195,9 +210,12 @@ def detail(request,
         query_options: An optional set of query options to use when
             creating the query, for example joinedload/eagerload
             directives.   (Default: )
+        version_sources: Any extra sources for the item's version; see
+            'version_token'.  (Default: ())
 
     Returns:
-        A dict suitable for returning from a rendered detail view.
+        A dict suitable for returning from a rendered detail view, or a
+        304 Not Modified response.
     """
     item_id_str = request.matchdict[id_name]
     try:
@@ -207,17 +225,30 @@ def detail(request,
             'Invalid ID: {}.'.format(item_id_str)
         )
 
+    not_found = pyramid.exceptions.NotFound(
+        'Could not get details for any item with ID {}.'.format(item_id)
+    )
+
+    # Check the constraint before anything else, so that the existence of
+    # hidden items can't be probed through their versions.
+    item = lass.model_base.DBSession.query(source).get(item_id)
+    if not (item and constraint(item)):
+        raise not_found
+
+    token = version_token(source, item_id, version_sources)
+    response = conditional(request, token)
+    if response is not None:
+        return response
+
     query = lass.model_base.DBSession.query(source)
     with_credits = lass.credits.query.add_to_query(query)
     with_options = with_credits.options(*query_options)
 
-    item = with_options.get(item_id)
-    if not (item and constraint(item)):
-        raise pyramid.exceptions.NotFound(
-            'Could not get details for any item with ID {}.'.format(
-                item_id
-            )
-        )
+    # The item is already in the session, so make sure the eager loads
+    # above actually happen.
+    item = with_options.populate_existing().get(item_id)
+    if item is None:
+        raise not_found
 
     # Slap some metadata on the item, if possible.
     if hasattr(item.__class__, 'annotate'):
@@ -227,3 +258,171 @@ def detail(request,
         'page_title': ((item.text['title']) + ['Untitled'])[0],
         target_name: item
     }
+
+
+def conditional(request, token, max_age=DETAIL_MAX_AGE):
+    """Makes a response conditional on a version token.
+
+    The ETag and Cache-Control headers are set on the request's response.
+
+    Args:
+        request: The request being responded to.
+        token: The version token of the resource being requested.
+        max_age: How long, in seconds, the client may reuse the response
+            without revalidating it.  (Default: DETAIL_MAX_AGE.)
+
+    Returns:
+        A 304 Not Modified response if the client already has this version,
+        or None if the view should carry on and render the resource.
+    """
+    response = request.response
+    response.etag = token
+    response.cache_control = 'public, max-age={}'.format(max_age)
+
+    not_modified = None
+    if token in request.if_none_match:
+        not_modified = pyramid.httpexceptions.HTTPNotModified(
+            headers={
+                'ETag': response.headers['ETag'],
+                'Cache-Control': response.headers['Cache-Control']
+            }
+        )
+    return not_modified
+
+
+def version_token(model, item_id, extra_sources=(), now=None):
+    """Works out a token that changes whenever the given item does.
+
+    The token is derived from the item's ID, its submission date (if it
+    has one), and the latest effective dates, number of rows and number
+    of rows active now of each kind of metadata and credit attached to
+    it.  Because every page shows what is on air, the token also changes
+    whenever a show starts or finishes (see 'schedule_version').  These
+    are all fetched in one query.
+
+    Args:
+        model: The model of the item.
+        item_id: The primary key value of the item.
+        extra_sources: Any further things the item's page depends on, as
+            functions taking the item ID and the current time and
+            returning a SELECT with four columns, in the manner of
+            'attached_version'.  (Default: ().)
+        now: The current time; if None, it will be looked up.
+            (Default: None.)
+
+    Returns:
+        The version token, as a string.
+    """
+    if now is None:
+        now = lass.common.time.aware_now()
+
+    sources = [subject_version(model, item_id), schedule_version(now)] + [
+        attached_version(attached, item_id, now)
+        for attached in attached_models(model)
+    ] + [source(item_id, now) for source in extra_sources]
+
+    rows = lass.model_base.DBSession.execute(
+        sqlalchemy.union_all(*sources)
+    ).fetchall()
+
+    fingerprint = repr((model.__name__, item_id, [tuple(row) for row in rows]))
+    return hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()
+
+
+def subject_version(model, item_id):
+    """Selects the version information of an item itself."""
+    submitted_at = getattr(model, 'submitted_at', None)
+    null = sqlalchemy.null()
+    return sqlalchemy.select([
+        sqlalchemy.cast(
+            submitted_at if submitted_at is not None else null,
+            sqlalchemy.DateTime(timezone=True)
+        ).label('latest_from'),
+        sqlalchemy.cast(null, sqlalchemy.DateTime(timezone=True)).label(
+            'latest_to'
+        ),
+        sqlalchemy.func.count().label('rows'),
+        sqlalchemy.literal(0).label('active')
+    ]).select_from(model.__table__).where(model.id == item_id)
+
+
+def schedule_version(now):
+    """Selects the state of the schedule at 'now': when the latest show
+    to start began and finishes, and when the next show starts.
+
+    This changes whenever a show starts or finishes, and so with the
+    now/next box on every page.
+    """
+    # Imported here, as the schedule views import this module.
+    import lass.schedule.models
+
+    Timeslot = lass.schedule.models.Timeslot
+    latest = sqlalchemy.select([
+        Timeslot.start,
+        Timeslot.finish.label('finish')
+    ]).where(
+        Timeslot.start <= now
+    ).order_by(
+        sqlalchemy.desc(Timeslot.start)
+    ).limit(1).alias('latest')
+    following = sqlalchemy.select([sqlalchemy.func.min(Timeslot.start)]).where(
+        Timeslot.start > now
+    ).as_scalar()
+    return sqlalchemy.select([
+        sqlalchemy.cast(following, sqlalchemy.DateTime(timezone=True)).label(
+            'latest_from'
+        ),
+        sqlalchemy.cast(
+            sqlalchemy.func.max(latest.c.finish),
+            sqlalchemy.DateTime(timezone=True)
+        ).label('latest_to'),
+        sqlalchemy.func.count().label('rows'),
+        sqlalchemy.func.count(
+            sqlalchemy.case([(latest.c.finish > now, 1)])
+        ).label('active')
+    ]).select_from(latest)
+
+
+def attached_version(attached, item_id, now):
+    """Selects the version information of one kind of attachable (such as
+    text metadata or credits) attached to an item.
+
+    As well as the latest effective dates and the number of rows, this
+    counts how many are active at 'now', so that the version changes when
+    an item of metadata takes or loses effect.
+    """
+    return sqlalchemy.select([
+        sqlalchemy.func.max(attached.effective_from).label('latest_from'),
+        sqlalchemy.func.max(attached.effective_to).label('latest_to'),
+        sqlalchemy.func.count().label('rows'),
+        sqlalchemy.func.sum(
+            sqlalchemy.case(
+                [(lass.common.mixins.Transient.active_on(now, attached), 1)],
+                else_=0
+            )
+        ).label('active')
+    ]).where(attached.subject_id == item_id)
+
+
+def attached_models(model):
+    """Finds the models of everything attached to a model that affects its
+    detail page: its text and image metadata and its credits.
+    """
+    # The attachable relationships are backrefs, which only appear once
+    # the mappers are configured.
+    sqlalchemy.orm.configure_mappers()
+
+    relationships = (
+        getattr(model, name, None)
+        for name in ('text_entries', 'image_entries', 'credits')
+    )
+    return [
+        lass.metadata.query.relationship_to_model(relationship)
+        for relationship in relationships
+        # Some models (for example, timeslots) compute their credits in
+        # Python rather than through a relationship.
+        if isinstance(
+            getattr(relationship, 'property', None),
+            sqlalchemy.orm.RelationshipProperty
+        )
+    ]
@@ -0,0 +1,254 @@
+"""Warming of a worker's caches before it starts serving requests.
+
+A freshly started worker has to parse its configuration, configure the
+SQLAlchemy mappers, compile its SQL and templates and build the schedule
+before it can answer anything, and without warming the first visitors
+after a deploy or worker recycle pay for all of it.  'warm' does this work
+up front, from 'lass.main', in these steps:
+
+- 'mappers': configures every SQLAlchemy mapper, so that backreferences
+  exist before any query needs them;
+- 'config': parses the configuration files read on hot paths;
+- 'queries': queries the small reference tables (show types, terms,
+  credit types and so on), which opens a database connection and
+  compiles their queries; the rows themselves are not kept;
+- 'pages': renders a few popular pages through the application itself.
+  By default these are the home page, which builds the now/next
+  schedule, banners, charts and the other home page boxes, and this
+  week's schedule.
+
+Rendered pages contain absolute URLs, so they only go into the page
+cache (see 'lass.common.page_cache') if the public base URL of the site
+is configured; otherwise they warm everything but the page cache.
+
+A step that fails is logged and skipped: a cold worker is better than
+none.  Warming is configured with these settings:
+
+    lass.warmup.enabled: If false, nothing is warmed.  (Default: true.)
+    lass.warmup.routes: The names of the routes to render, separated by
+        whitespace; they must not take any parameters.  (Default:
+        'home schedule-thisweek'.)
+    lass.warmup.base_url: The scheme and host visitors use, for example
+        'https://ury.org.uk'.  If set, pages are rendered as if for this
+        host and kept in the page cache.  (Default: unset.)
+
+---
+
+Copyright (c) 2013, University Radio York.
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimer in the
+  documentation and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import collections
+import logging
+import time
+
+import pyramid.request
+import pyramid.settings
+import sqlalchemy.orm
+import transaction
+
+import lass.common.config
+import lass.common.page_cache
+import lass.model_base
+
+
+log = logging.getLogger(__name__)
+
+
+SETTINGS_PREFIX = 'lass.warmup.'
+
+
+# The routes rendered if the settings don't say otherwise.
+DEFAULT_ROUTES = ('home', 'schedule-thisweek')
+
+
+# Configuration files read on hot paths through 'cached_from_yaml'.
+CONFIG_FILES = (
+    'sitewide/website',
+    'sitewide/blocks',
+    'sitewide/page_cache',
+    'sitewide/service',
+    'sitewide/filler'
+)
+
+
+def configure_mappers():
+    """Configures every SQLAlchemy mapper.
+
+    Returns:
+        None.
+    """
+    sqlalchemy.orm.configure_mappers()
+
+
+def load_config(paths=CONFIG_FILES):
+    """Parses configuration files into the configuration cache.
+
+    Files that don't exist are skipped; not every site has them all.
+
+    Returns:
+        The number of files loaded.
+    """
+    loaded = 0
+    for path in paths:
+        try:
+            lass.common.config.cached_from_yaml(path)
+        except IOError:
+            log.debug('No configuration file %s to warm.', path)
+        else:
+            loaded += 1
+    return loaded
+
+
+def reference_models():
+    """Lists the small tables that most pages refer to."""
+    # Imported here, so that importing this module (and so 'lass') does
+    # not load every model.
+    import lass.credits.models
+    import lass.metadata.models
+    import lass.schedule.models
+    import lass.website.models
+
+    return (
+        lass.schedule.models.ShowType,
+        lass.schedule.models.Term,
+        lass.credits.models.CreditType,
+        lass.metadata.models.Key,
+        lass.website.models.BannerType
+    )
+
+
+def warm_queries(models=None):
+    """Queries every row of the given tables, to open a database
+    connection and compile the queries.
+
+    The rows are thrown away with the session afterwards; this warms the
+    connection pool and SQLAlchemy's compiled statement cache, not any
+    cache of the rows.
+
+    Args:
+        models: The models to query.  (Default: 'reference_models()'.)
+
+    Returns:
+        The number of rows fetched.
+    """
+    if models is None:
+        models = reference_models()
+
+    loaded = 0
+    try:
+        with transaction.manager:
+            for model in models:
+                loaded += len(lass.model_base.DBSession.query(model).all())
+    finally:
+        lass.model_base.DBSession.remove()
+    return loaded
+
+
+def render_pages(app, routes=DEFAULT_ROUTES, base_url=None):
+    """Renders pages through the whole application, tweens included.
+
+    Args:
+        app: The Pyramid WSGI application.
+        routes: The names of the routes to render.
+        base_url: The scheme and host to render the pages for.  If None,
+            the pages are rendered for a placeholder host, and so kept
+            out of the page cache.  (Default: None.)
+
+    Returns:
+        A dict mapping each route name rendered to its response status.
+    """
+    statuses = collections.OrderedDict()
+    try:
+        for name in routes:
+            route = app.routes_mapper.get_route(name)
+            if route is None:
+                log.warning('Cannot warm unknown route %s.', name)
+                continue
+
+            request = pyramid.request.Request.blank(
+                route.generate({}),
+                base_url=base_url
+            )
+            if base_url is None:
+                request.environ[lass.common.page_cache.BYPASS] = True
+            statuses[name] = request.get_response(app).status
+    finally:
+        # Don't hand the startup thread's session on to request handling.
+        lass.model_base.DBSession.remove()
+    return statuses
+
+
+def timed(name, function, *args):
+    """Runs one warming step, logging how long it took.
+
+    Returns:
+        The time taken, in seconds.  Failures are logged, not raised.
+    """
+    started = time.monotonic()
+    try:
+        result = function(*args)
+    except Exception:
+        log.exception('Warming step %s failed.', name)
+    else:
+        log.debug('Warming step %s: %s', name, result)
+    return time.monotonic() - started
+
+
+def warm(app, settings):
+    """Warms the worker's caches.
+
+    Args:
+        app: The Pyramid WSGI application.
+        settings: The Pyramid application settings.
+
+    Returns:
+        An OrderedDict mapping the name of each step run to the time it
+        took, in seconds; empty if warming is turned off.
+    """
+    timings = collections.OrderedDict()
+    enabled = settings.get(SETTINGS_PREFIX + 'enabled', True)
+    if pyramid.settings.asbool(enabled):
+        routes = pyramid.settings.aslist(
+            settings.get(SETTINGS_PREFIX + 'routes', ' '.join(DEFAULT_ROUTES))
+        )
+        base_url = settings.get(SETTINGS_PREFIX + 'base_url') or None
+        for name, function, args in (
+            ('mappers', configure_mappers, ()),
+            ('config', load_config, ()),
+            ('queries', warm_queries, ()),
+            ('pages', render_pages, (app, routes, base_url))
+        ):
+            timings[name] = timed(name, function, *args)
+
+        log.info(
+            'Warmed caches in %.2fs (%s).',
+            sum(timings.values()),
+            ', '.join(
+                '{} {:.2f}s'.format(name, taken)
+                for name, taken in timings.items()
+            )
+        )
+    return timings
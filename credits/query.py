@@ -29,6 +29,9 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 import sqlalchemy
 
+import lass.common.mixins
+import lass.model_base
+
 
 def add_to_query(query, through=('credits',)):
     """Given a query on a model, load credits into that query.
@@ -61,3 +64,76 @@ def add_to_query(query, through=('credits',)):
         new_query = query
 
     return new_query
+
+
+def credit_model(model):
+    """Finds the model holding the credits of another model.
+
+    Returns:
+        The credit model, or None if 'model' has no credits relationship.
+    """
+    # The credits relationships are backrefs, which only appear once the
+    # mappers are configured.
+    sqlalchemy.orm.configure_mappers()
+
+    credits = getattr(model, 'credits', None)
+    if isinstance(
+        getattr(credits, 'property', None),
+        sqlalchemy.orm.RelationshipProperty
+    ):
+        credit = credits.property.mapper.class_
+    else:
+        credit = None
+    return credit
+
+
+def query(model, subject_ids, date, *types):
+    """Constructs a query for the credits of many items at once.
+
+    Args:
+        model: The model of the items, which must have credits (see
+            'credit_model').
+        subject_ids: The IDs of the items.
+        date: The datetime on which the credits must be active.
+        *types: The names of the credit types to retrieve.  If none are
+            given, credits of every type are retrieved.
+
+    Returns:
+        A query returning (subject ID, credit type name, person ID, person
+        name) tuples, ordered by subject, then credit type, then name.
+    """
+    # Imported here, as the models import this module indirectly.
+    import lass.credits.models
+    import lass.people.models
+
+    Person = lass.people.models.Person
+    CreditType = lass.credits.models.CreditType
+    credit = credit_model(model)
+
+    credits = lass.model_base.DBSession.query(
+        credit.subject_id.label('subject_id'),
+        CreditType.name.label('type'),
+        Person.id.label('person_id'),
+        (Person.first_name + ' ' + Person.last_name).label('person_name')
+    ).select_from(
+        credit
+    ).join(
+        CreditType,
+        credit.credit_type_id == CreditType.id
+    ).join(
+        Person,
+        credit.person_id == Person.id
+    ).filter(
+        credit.subject_id.in_(subject_ids) &
+        lass.common.mixins.Transient.active_on(date, credit)
+    )
+
+    if types:
+        credits = credits.filter(CreditType.name.in_(types))
+
+    return credits.order_by(
+        sqlalchemy.asc(credit.subject_id),
+        sqlalchemy.asc(CreditType.name),
+        sqlalchemy.asc(Person.last_name),
+        sqlalchemy.asc(Person.first_name)
+    )
@@ -0,0 +1,188 @@
+"""Streaming JSON rendering for the laconia API.
+
+API views can return a great many rows (for example, the metadata of a
+long list of items), so rather than building the whole response in
+memory, views return a 'Rows' object naming a query, and the
+'json_stream' renderer runs the query and writes the response out as the
+rows arrive.
+
+Two output formats are available, picked with the 'format' GET parameter:
+
+    nested (the default): The same shape as 'lass.metadata.query.run',
+        that is, an object mapping subject IDs to objects mapping keys to
+        lists of values.  Rows MUST be ordered by subject and key for
+        this to work.
+    columns: A compact table, with the column names given once:
+        {"columns": ["subject_id", "key", "value"], "rows": [[...], ...]}.
+
+---
+
+Copyright (c) 2013, University Radio York.
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimer in the
+  documentation and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import itertools
+import json
+
+import lass.model_base
+
+
+# Roughly how many bytes to gather up before sending them on.
+CHUNK_SIZE = 8192
+
+# How many rows to fetch from the database at a time.
+BATCH_SIZE = 500
+
+FORMATS = ('nested', 'columns')
+
+
+class Rows(object):
+    """A query whose results a view wants rendered by 'json_stream'."""
+    def __init__(self, query, columns):
+        """Initialises the Rows.
+
+        Args:
+            query: A SQLAlchemy ORM query or Core selectable.  The first
+                column must be the subject ID and the second the key; the
+                rest make up the value.
+            columns: The names of the query's columns.
+        """
+        self.query = query
+        self.columns = tuple(columns)
+
+    def fetch(self):
+        """Runs the query, yielding its rows without holding them all.
+
+        The query runs on its own connection, as the response is written
+        out after the request's transaction has finished.
+        """
+        statement = getattr(self.query, 'statement', self.query)
+        connection = lass.model_base.DBSession.get_bind().connect()
+        try:
+            result = connection.execution_options(
+                stream_results=True
+            ).execute(statement)
+            while True:
+                batch = result.fetchmany(BATCH_SIZE)
+                if not batch:
+                    break
+                yield from batch
+        finally:
+            connection.close()
+
+
+def encode(value):
+    """Encodes a value as JSON."""
+    return json.dumps(value, default=str, separators=(',', ':'))
+
+
+def value_of(row, columns):
+    """Extracts the value part of a row: a single value if there is only
+    one value column, or an object of the value columns otherwise.
+    """
+    if len(row) == 3:
+        value = row[2]
+    else:
+        value = dict(zip(columns[2:], row[2:]))
+    return value
+
+
+def nested(rows, columns):
+    """Writes rows out in the nested format, a piece at a time.
+
+    Duplicate values under the same subject and key are dropped, as in
+    'lass.metadata.query.bulk_group'.
+    """
+    yield '{'
+    for i, (subject, subject_rows) in enumerate(
+        itertools.groupby(rows, lambda row: row[0])
+    ):
+        yield '{}{}:{{'.format(',' if i else '', encode(str(subject)))
+        for j, (key, key_rows) in enumerate(
+            itertools.groupby(subject_rows, lambda row: row[1])
+        ):
+            values = []
+            for row in key_rows:
+                value = value_of(row, columns)
+                if value not in values:
+                    values.append(value)
+            yield '{}{}:{}'.format(
+                ',' if j else '',
+                encode(key),
+                encode(values)
+            )
+        yield '}'
+    yield '}'
+
+
+def table(rows, columns):
+    """Writes rows out in the compact columns format, a piece at a time."""
+    yield '{{"columns":{},"rows":['.format(encode(list(columns)))
+    for i, row in enumerate(rows):
+        yield '{}{}'.format(',' if i else '', encode(list(row)))
+    yield ']}'
+
+
+WRITERS = {'nested': nested, 'columns': table}
+
+
+def chunked(pieces, size=CHUNK_SIZE):
+    """Gathers small strings into encoded chunks of around 'size' bytes."""
+    buffer = []
+    buffered = 0
+    for piece in pieces:
+        buffer.append(piece)
+        buffered += len(piece)
+        if buffered >= size:
+            yield ''.join(buffer).encode('utf-8')
+            buffer = []
+            buffered = 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+def json_stream_factory(info):
+    """Creates the 'json_stream' renderer.
+
+    Views using this renderer may return either a 'Rows' object, which is
+    streamed, or anything else, which is rendered as plain JSON.
+    """
+    def render(value, system):
+        request = system['request']
+        request.response.content_type = 'application/json'
+
+        if not isinstance(value, Rows):
+            return encode(value)
+
+        format = request.params.get('format', 'nested')
+        if format not in WRITERS:
+            format = 'nested'
+        request.response.app_iter = chunked(
+            WRITERS[format](value.fetch(), value.columns)
+        )
+        # The body is already set up, so tell Pyramid to leave it alone.
+        return None
+
+    return render
@@ -0,0 +1,154 @@
+"""Nose tests for the Laconia submodule.
+
+---
+
+Copyright (c) 2013, University Radio York.
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimer in the
+  documentation and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import json
+
+import pyramid.request
+import pyramid.testing
+
+import lass.common.benchmark
+import lass.laconia.renderers
+import lass.metadata.benchmarks
+import lass.metadata.query
+import lass.model_base
+import lass.uryplayer.models
+
+
+TEST_ROWS = [
+    (1, 'description', 'own'),
+    (1, 'title', 'own'),
+    (1, 'title', 'package'),
+    (1, 'title', 'own'),
+    (2, 'title', 'package')
+]
+
+
+def render(writer, rows, columns):
+    return json.loads(''.join(writer(iter(rows), columns)))
+
+
+#
+# lass.laconia.renderers
+#
+
+
+def test_renderers_nested():
+    """Tests that the nested format matches 'bulk_group'."""
+    columns = ('subject_id', 'key', 'value')
+    expected = {
+        str(subject): keys
+        for subject, keys in lass.metadata.query.bulk_group(TEST_ROWS).items()
+    }
+
+    assert render(lass.laconia.renderers.nested, TEST_ROWS, columns) == (
+        expected
+    )
+    assert render(lass.laconia.renderers.nested, [], columns) == {}
+
+    # More than one value column gives objects.
+    credits = [(1, 'presenter', 5, 'A Person')]
+    assert render(
+        lass.laconia.renderers.nested,
+        credits,
+        ('subject_id', 'type', 'person_id', 'person_name')
+    ) == {'1': {'presenter': [{'person_id': 5, 'person_name': 'A Person'}]}}
+
+
+def test_renderers_columns():
+    """Tests the compact columns format."""
+    columns = ('subject_id', 'key', 'value')
+    assert render(lass.laconia.renderers.table, TEST_ROWS, columns) == {
+        'columns': list(columns),
+        'rows': [list(row) for row in TEST_ROWS]
+    }
+
+
+def test_renderers_chunked():
+    """Tests that 'chunked' gathers pieces without losing any."""
+    pieces = ['ab'] * 10
+    chunks = list(lass.laconia.renderers.chunked(pieces, size=5))
+
+    assert b''.join(chunks) == b'ab' * 10
+    assert len(chunks) == 4
+
+
+def test_json_stream():
+    """Tests the json_stream renderer end to end."""
+    Podcast = lass.uryplayer.models.Podcast
+    registry = pyramid.testing.setUp().registry
+    renderer = lass.laconia.renderers.json_stream_factory(None)
+
+    def get(value, query_string=''):
+        request = pyramid.request.Request.blank('/?' + query_string)
+        request.registry = registry
+        assert renderer(value, {'request': request}) is None
+        return json.loads(request.response.body.decode('utf-8'))
+
+    try:
+        with lass.common.benchmark.standin() as engine:
+            generator = lass.metadata.benchmarks.Generator(
+                engine,
+                subjects=5,
+                keys=2,
+                history=2
+            )
+            generator.populate()
+            podcasts = lass.model_base.DBSession.query(Podcast).all()
+            now = generator.now
+
+            def rows():
+                return lass.laconia.renderers.Rows(
+                    lass.metadata.query.query(
+                        podcasts,
+                        'text',
+                        now,
+                        Podcast.meta_sources(),
+                        'title',
+                        'description'
+                    ),
+                    ('subject_id', 'key', 'value')
+                )
+
+            expected = Podcast.bulk_meta(
+                podcasts,
+                'text',
+                'title',
+                'description',
+                date=now
+            )
+            assert get(rows()) == {
+                str(subject): keys for subject, keys in expected.items()
+            }
+
+            table = get(rows(), 'format=columns')
+            assert table['columns'] == ['subject_id', 'key', 'value']
+            assert len(table['rows']) == 5 * 2 * 2
+    finally:
+        pyramid.testing.tearDown()
@@ -1,10 +1,18 @@
 import importlib
 
-import dateutil
 import pyramid
 
+import lass.common.lazy
+import lass.common.time
+import lass.credits.query
+import lass.laconia.renderers
+import lass.metadata.query
 import lass.model_base
 
+
+dateutil_parser = lass.common.lazy.lazy_import('dateutil.parser')
+
+
 def model_from_matchdict(md):
     """Extracts a model from a matchdict containing keys 'package' and
     'model'.
@@ -35,10 +43,14 @@ def items_from_matchdict(md, model):
 
     'ids' is a '+'-delimited string listing the primary keys to retrieve.
     """
-    subject_keys = [int(key) for key in md['ids'].split('+') if key]
+    try:
+        subject_keys = [int(key) for key in md['ids'].split('+') if key]
+    except ValueError:
+        raise pyramid.exceptions.NotFound('Invalid ID list.')
+
     items = lass.model_base.DBSession.query(model).filter(
         model.id.in_(subject_keys)
-    )
+    ).all()
     if not items:
         raise pyramid.exceptions.NotFound(
             'No such {}(s).'.format(md['model'])
@@ -55,41 +67,58 @@ def date_from_matchdict(md):
     return (
         None
         if md['date'].lower() == 'now'
-        else dateutil.parser.parse(md['date'])
+        else dateutil_parser.parse(md['date'])
     )
 
 
 @pyramid.view.view_config(
     route_name='laconia-credits',
-    renderer='json'
+    renderer='json_stream'
 )
 def credits(request):
-    """A view that outputs the result of a credit query."""
+    """A view that outputs the result of a credit query.
+
+    Each credit is given as an object with keys 'person_id' and
+    'person_name'.
+    """
     md = request.matchdict
     model = model_from_matchdict(md)
+    if lass.credits.query.credit_model(model) is None:
+        raise pyramid.exceptions.NotFound(
+            '{} does not have credits.'.format(md['model'])
+        )
     items = items_from_matchdict(md, model)
-    date = date_from_matchdict(md)
-    return model.bulk_credits(
-        items,
-        *(s for s in md['types'].split('+') if s),
-        date=date
+    date = date_from_matchdict(md) or lass.common.time.aware_now()
+
+    return lass.laconia.renderers.Rows(
+        lass.credits.query.query(
+            model,
+            [item.id for item in items],
+            date,
+            *(s for s in md['types'].split('+') if s)
+        ),
+        ('subject_id', 'type', 'person_id', 'person_name')
     )
 
 
 @pyramid.view.view_config(
     route_name='laconia-metadata',
-    renderer='json'
+    renderer='json_stream'
 )
 def metadata(request):
     """A view that outputs the result of a metadata query."""
     md = request.matchdict
     model = model_from_matchdict(md)
     items = items_from_matchdict(md, model)
-    date = date_from_matchdict(md)
-
-    return model.bulk_meta(
-        items,
-        md['type'],
-        *(s for s in md['keys'].split('+') if s),
-        date=date
+    date = date_from_matchdict(md) or lass.common.time.aware_now()
+
+    return lass.laconia.renderers.Rows(
+        lass.metadata.query.query(
+            items,
+            md['type'],
+            date,
+            model.meta_sources(),
+            *(s for s in md['keys'].split('+') if s)
+        ),
+        ('subject_id', 'key', 'value')
     )
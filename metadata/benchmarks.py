@@ -0,0 +1,413 @@
+"""Benchmarks for metadata lookup and search.
+
+This harness fills a stand-in database (see 'lass.common.benchmark') with
+N podcasts, each carrying K keys of textual metadata with H historical
+versions apiece, both directly ('own' metadata) and through a metadata
+package ('package' metadata).  It then times:
+
+    bulk_meta: The whole of 'MetadataSubject.bulk_meta' on every subject;
+    query: Just the database side of that ('lass.metadata.query.query');
+    bulk_group: Just the grouping side ('lass.metadata.query.bulk_group');
+    search_*: 'lass.metadata.query.search' for terms matching all, a tenth,
+        a hundredth and none of the subjects.
+
+Alongside the timings, it reports how many rows each stage pulled out of
+the database, which is usually the first thing to look at when a stage
+gets slower.
+
+Run 'python -m lass.metadata.benchmarks --help' for usage.
+
+---
+
+Copyright (c) 2013, University Radio York.
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimer in the
+  documentation and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import argparse
+import datetime
+import itertools
+import sys
+
+import lass.common.benchmark
+import lass.common.time
+import lass.metadata.models
+import lass.metadata.query
+import lass.model_base
+import lass.people.models
+import lass.uryplayer.models
+
+
+# Search terms, by the fraction of subjects whose current title they match.
+SEARCH_TERMS = (
+    ('search_all', 'podcast'),
+    ('search_tenth', 'zebra'),
+    ('search_hundredth', 'quokka'),
+    ('search_none', 'nonesuch')
+)
+
+
+STAGES = ('bulk_meta', 'query', 'bulk_group') + tuple(
+    stage for stage, _ in SEARCH_TERMS
+)
+
+
+BASE_KEYS = ('title', 'description', 'tag')
+
+
+def key_names(count):
+    """Returns the names of the first 'count' synthetic metadata keys."""
+    return list(BASE_KEYS[:count]) + [
+        'key{}'.format(i) for i in range(len(BASE_KEYS), count)
+    ]
+
+
+def scale_name(subjects, keys, history):
+    """Names a benchmark scale after its dimensions."""
+    return '{}x{}x{}'.format(subjects, keys, history)
+
+
+class Generator(object):
+    """Generates synthetic podcasts with metadata histories."""
+    def __init__(self, engine, subjects, keys, history, packages=10):
+        """Initialises the Generator.
+
+        Args:
+            engine: The stand-in engine to populate.
+            subjects: The number of podcasts (N) to generate.
+            keys: The number of metadata keys (K) per podcast.
+            history: The number of versions (H) of each key, of which only
+                the last is current.
+            packages: The number of metadata packages the podcasts are
+                shared out between.  (Default: 10.)
+        """
+        self.engine = engine
+        self.subjects = subjects
+        self.keys = key_names(keys)
+        self.history = history
+        self.packages = packages
+        self.now = lass.common.time.aware_now()
+        self.ids = itertools.count(1)
+        self.counts = {}
+
+    def insert(self, model, rows):
+        """Inserts rows, keeping count of how many of each model exist."""
+        lass.common.benchmark.insert(self.engine, model, rows)
+        name = model.__name__
+        self.counts[name] = self.counts.get(name, 0) + len(rows)
+
+    def row(self, model, **values):
+        """Makes a row for an ownable, approvable model with a fresh ID."""
+        return lass.common.benchmark.row(
+            model,
+            id=next(self.ids),
+            owner_id=1,
+            approver_id=1,
+            **values
+        )
+
+    def populate(self):
+        """Populates the stand-in database.
+
+        Returns:
+            A dict mapping model names to the number of rows generated.
+        """
+        self.insert(
+            lass.people.models.Person,
+            [
+                lass.common.benchmark.row(
+                    lass.people.models.Person,
+                    id=1,
+                    first_name='Benchmark',
+                    last_name='User'
+                )
+            ]
+        )
+
+        self.key_ids = {name: next(self.ids) for name in self.keys}
+        self.insert(
+            lass.metadata.models.Key,
+            [
+                lass.common.benchmark.row(
+                    lass.metadata.models.Key,
+                    id=key_id,
+                    name=name,
+                    description=name,
+                    allow_multiple=(name == 'tag'),
+                    searchable=(name == 'title'),
+                    plural=name + 's'
+                )
+                for name, key_id in self.key_ids.items()
+            ]
+        )
+
+        package_ids = [next(self.ids) for _ in range(self.packages)]
+        self.insert(
+            lass.metadata.models.Package,
+            [
+                lass.common.benchmark.row(
+                    lass.metadata.models.Package,
+                    id=package_id,
+                    name='package{}'.format(package_id),
+                    description='Benchmark package',
+                    weight=0
+                )
+                for package_id in package_ids
+            ]
+        )
+        self.insert(
+            lass.metadata.models.PackageText,
+            [
+                entry
+                for package_id in package_ids
+                for key in self.keys
+                for entry in self.history_rows(
+                    lass.metadata.models.PackageText,
+                    package_id,
+                    key,
+                    'Package {} {}'.format(package_id, key)
+                )
+            ]
+        )
+
+        podcasts, texts, entries = [], [], []
+        for i in range(self.subjects):
+            podcast_id = next(self.ids)
+            podcasts.append(
+                lass.common.benchmark.row(
+                    lass.uryplayer.models.Podcast,
+                    id=podcast_id,
+                    file='podcast{}.mp3'.format(podcast_id),
+                    submitted_at=self.now,
+                    owner_id=1
+                )
+            )
+            for key in self.keys:
+                texts.extend(
+                    self.history_rows(
+                        lass.uryplayer.models.PodcastText,
+                        podcast_id,
+                        key,
+                        self.value(i, key)
+                    )
+                )
+            entries.append(
+                self.row(
+                    lass.uryplayer.models.PodcastPackageEntry,
+                    subject_id=podcast_id,
+                    package_id=package_ids[i % len(package_ids)],
+                    effective_from=self.now - datetime.timedelta(days=1000),
+                    effective_to=None
+                )
+            )
+
+        self.insert(lass.uryplayer.models.Podcast, podcasts)
+        self.insert(lass.uryplayer.models.PodcastText, texts)
+        self.insert(lass.uryplayer.models.PodcastPackageEntry, entries)
+        return self.counts
+
+    def value(self, i, key):
+        """Makes the current value of a key for the i-th podcast.
+
+        Titles carry the words in 'SEARCH_TERMS' at the advertised rates.
+        """
+        words = ['Podcast', str(i), key]
+        if key == 'title':
+            if i % 10 == 0:
+                words.append('zebra')
+            if i % 100 == 0:
+                words.append('quokka')
+        return ' '.join(words)
+
+    def history_rows(self, model, subject_id, key, current):
+        """Makes 'history' versions of one key of one subject, each
+        superseding the last and ending with 'current'.
+        """
+        days = [
+            self.now - datetime.timedelta(days=100 * (self.history - v))
+            for v in range(self.history)
+        ]
+        return [
+            self.row(
+                model,
+                subject_id=subject_id,
+                key_id=self.key_ids[key],
+                value=(
+                    current if v == self.history - 1
+                    else 'Old {} version {}'.format(key, v)
+                ),
+                effective_from=start,
+                effective_to=days[v + 1] if v + 1 < self.history else None
+            )
+            for v, start in enumerate(days)
+        ]
+
+
+def run_lookups(subjects, keys, timings, rows):
+    """Runs each metadata lookup stage once, timing it.
+
+    Args:
+        subjects: The podcasts whose metadata should be looked up.
+        keys: The metadata key names to look up.
+        timings: The 'lass.common.benchmark.Timings' to record times in.
+        rows: A dict in which to store the number of rows each stage
+            pulled out of the database.
+    """
+    Podcast = lass.uryplayer.models.Podcast
+    now = lass.common.time.aware_now()
+
+    with timings.time('bulk_meta'):
+        Podcast.bulk_meta(subjects, 'text', *keys, date=now)
+
+    with timings.time('query'):
+        tuples = lass.metadata.query.query(
+            subjects,
+            'text',
+            now,
+            Podcast.meta_sources(),
+            *keys
+        ).all()
+    rows['query'] = rows['bulk_meta'] = len(tuples)
+
+    with timings.time('bulk_group'):
+        lass.metadata.query.bulk_group(tuples)
+    rows['bulk_group'] = 0
+
+    for stage, term in SEARCH_TERMS:
+        with timings.time(stage):
+            found = lass.metadata.query.search(
+                term,
+                ['title'],
+                Podcast,
+                now=now
+            ).all()
+        rows[stage] = len(found)
+
+    lass.common.benchmark.reset_session()
+
+
+def benchmark(subjects=1000, keys=5, history=3, repeat=5, url=None):
+    """Runs the metadata benchmark.
+
+    Args:
+        subjects: The number of podcasts (N).  (Default: 1000.)
+        keys: The number of metadata keys per podcast (K).  (Default: 5.)
+        history: The number of versions of each key (H).  (Default: 3.)
+        repeat: The number of times to run each stage.  (Default: 5.)
+        url: The URL of the stand-in database; see
+            'lass.common.benchmark.standin_engine'.  (Default: None.)
+
+    Returns:
+        A tuple of the results, which map the scale name (see
+        'scale_name') to the summarised timings of each stage, and a dict
+        containing the number of rows generated and the number of rows
+        each stage transferred.
+    """
+    scale = scale_name(subjects, keys, history)
+    timings = lass.common.benchmark.Timings()
+    info = {'rows': {}, 'transferred': {}}
+
+    with lass.common.benchmark.standin(url) as engine:
+        generator = Generator(engine, subjects, keys, history)
+        info['rows'] = generator.populate()
+
+        for _ in range(repeat):
+            podcasts = lass.model_base.DBSession.query(
+                lass.uryplayer.models.Podcast
+            ).order_by(lass.uryplayer.models.Podcast.id).all()
+            run_lookups(podcasts, generator.keys, timings, info['transferred'])
+
+    return {scale: timings.summary()}, info
+
+
+def main(argv=sys.argv):
+    parser = argparse.ArgumentParser(
+        prog='lass.metadata.benchmarks',
+        description='Benchmarks metadata lookup and search.'
+    )
+    parser.add_argument('--subjects', '-n', type=int, default=1000)
+    parser.add_argument('--keys', '-k', type=int, default=5)
+    parser.add_argument('--history', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument(
+        '--database',
+        help='the stand-in database URL (default: in-memory SQLite)'
+    )
+    parser.add_argument(
+        '--output',
+        help='a JSON-lines file to record the results in'
+    )
+    parser.add_argument(
+        '--baseline',
+        help='a results file to compare against for regressions'
+    )
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args(argv[1:])
+
+    baseline = (
+        lass.common.benchmark.last_recorded(args.baseline, 'metadata')
+        if args.baseline
+        else None
+    )
+
+    results, info = benchmark(
+        args.subjects,
+        args.keys,
+        args.history,
+        args.repeat,
+        args.database
+    )
+
+    for scale, stages in results.items():
+        print('{} (subjects x keys x history):'.format(scale))
+        for stage in STAGES:
+            print(
+                '    {:<17} p50 {p50:>10.3f}ms  p90 {p90:>10.3f}ms'
+                '  p99 {p99:>10.3f}ms  {rows:>8} rows'.format(
+                    stage,
+                    rows=info['transferred'][stage],
+                    **stages[stage]
+                )
+            )
+
+    if args.output:
+        lass.common.benchmark.record(args.output, 'metadata', results)
+
+    regressions = (
+        lass.common.benchmark.compare(baseline, results, args.tolerance)
+        if baseline
+        else []
+    )
+    for scale, stage, old, new in regressions:
+        print('REGRESSION: {} {}: {:.3f}ms -> {:.3f}ms'.format(
+            scale,
+            stage,
+            old,
+            new
+        ))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""Layered views of metadata, for metadata inheritance.
+
+Timeslots inherit the metadata of their shows (and seasons that of
+theirs): where both have values for a key, the timeslot's come first,
+followed by the show's.  Rather than copying the show's metadata into
+every timeslot, a LayeredMetadata looks keys up through the timeslot's
+own metadata and then the show's, so the show's metadata is held once
+however many timeslots share it.
+
+---
+
+Copyright (c) 2013, University Radio York.
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimer in the
+  documentation and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import collections.abc
+import itertools
+
+
+class LayeredMetadata(collections.abc.MutableMapping):
+    """A metadata dict (mapping keys to lists of values) layered over
+    other, shared metadata dicts.
+
+    Looking a key up gives the values for it in every layer, in layer
+    order; if only one layer has the key, its list is returned as is and
+    must not be modified.  Changes are written to the first layer only,
+    which belongs to the view, so the shared layers are never changed.
+    """
+    def __init__(self, own, *parents):
+        """Initialises the LayeredMetadata.
+
+        Args:
+            own: The metadata dict that changes are written to.  If this is
+                itself a LayeredMetadata, its first layer is used, so that
+                layering metadata again does not repeat its parents.
+            *parents: The shared metadata dicts, highest priority first.
+        """
+        if isinstance(own, LayeredMetadata):
+            own = own.layers[0]
+        self.layers = (own,) + tuple(
+            layer for layer in parents if layer is not None
+        )
+
+    def __getitem__(self, key):
+        found = [layer[key] for layer in self.layers if key in layer]
+        if not found:
+            raise KeyError(key)
+        return found[0] if len(found) == 1 else list(
+            itertools.chain.from_iterable(found)
+        )
+
+    def __setitem__(self, key, value):
+        self.layers[0][key] = value
+
+    def __delitem__(self, key):
+        # Keys in the shared layers can't be removed without changing them.
+        del self.layers[0][key]
+
+    def __contains__(self, key):
+        return any(key in layer for layer in self.layers)
+
+    def __iter__(self):
+        seen = set()
+        for layer in self.layers:
+            for key in layer:
+                if key not in seen:
+                    seen.add(key)
+                    yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return 'LayeredMetadata({!r})'.format(dict(self))
@@ -211,7 +211,7 @@ class PackageEntry(Attachable):
     model.
     """
     __abstract__ = True
-    backref = 'podcast_entries'
+    backref = 'package_entries'
 
     @sqlalchemy.ext.declarative.declared_attr
     def package_id(cls):
@@ -32,12 +32,34 @@ import collections
 import functools
 import itertools
 import sqlalchemy
+import sqlalchemy.orm
 
 import lass.credits.query
+import lass.common.database
+import lass.common.singleflight
 import lass.common.time
 import lass.metadata.models
 
 
+# The subjects of a metadata query given as a model and a list of IDs,
+# rather than as a list of model instances.  The source functions accept
+# either, so that metadata can be found for read-only records of a model
+# (see 'lass.schedule.records') without loading the model instances.
+SubjectIDs = collections.namedtuple('SubjectIDs', 'model ids')
+
+
+def subject_ids(subjects):
+    """Converts the subjects of a metadata query into a SubjectIDs."""
+    if isinstance(subjects, SubjectIDs):
+        out = subjects
+    else:
+        out = SubjectIDs(
+            subjects[0].__class__,
+            [subject.id for subject in subjects]
+        )
+    return out
+
+
 def relationship(model, type):
     """Returns the model's relationship to a given attached metadata
     type, or None if none exists.
@@ -54,13 +76,14 @@ def own(subjects, meta_type, priority):
     """Queries for all metadata attached to a given set of subjects, for
     a given type of metadata.
     """
-    meta_entries = relationship(subjects[0].__class__, meta_type)
+    model, ids = subject_ids(subjects)
+    meta_entries = relationship(model, meta_type)
 
     if meta_entries is not None:
         meta_model = relationship_to_model(meta_entries)
 
         query = all_metadata(meta_model, priority).filter(
-            meta_model.subject_id.in_([subject.id for subject in subjects])
+            meta_model.subject_id.in_(ids)
         )
     else:
         query = None
@@ -72,19 +95,28 @@ def package(subjects, meta_type, priority):
     a given type of metadata and indirected through the metadata package
     layer.
     """
-    package_entries = relationship(subjects[0].__class__, 'package')
+    model, ids = subject_ids(subjects)
+    package_entries = relationship(model, 'package')
     package_meta_entries = relationship(lass.metadata.models.Package, meta_type)
 
     if package_entries is not None and package_meta_entries is not None:
         package_entry_model = relationship_to_model(package_entries)
         meta_model = relationship_to_model(package_meta_entries)
 
+        # The entry, not the package metadata, carries the subject ID, so
+        # we need to join through it explicitly.
         query = all_metadata(meta_model, priority).join(
-            package_entry_model.package,
+            package_entry_model,
+            package_entry_model.package_id == meta_model.subject_id
         ).filter(
-            package_entry_model.subject_id.in_(
-                [subject.id for subject in subjects]
-            )
+            package_entry_model.subject_id.in_(ids)
+        ).with_entities(
+            lass.metadata.models.Key.name.label('key'),
+            meta_model.value.label('value'),
+            meta_model.effective_from.label('effective_from'),
+            meta_model.effective_to.label('effective_to'),
+            package_entry_model.subject_id.label('subject_id'),
+            sqlalchemy.literal(priority).label('priority')
         )
     else:
         query = None
@@ -123,6 +155,36 @@ def all_metadata(meta_model, priority):
 
 
 def run(subjects, meta_type, date, sources, *keys):
+    """Runs a metadata query and groups its results.
+
+    Args:
+        subjects: The list of subjects whose metadata is wanted.  These
+            must all be of the same model.  They may instead be given as a
+            SubjectIDs.
+        meta_type: The metadata type to fetch, for example 'text' or
+            'image'.
+        date: The datetime on which the metadata must be active.
+        sources: The list of metadata source functions (see 'own' and
+            'package'), in priority order.
+        *keys: The names of the metadata keys to fetch.
+
+    Returns:
+        A dict mapping subject IDs to dicts mapping key names to lists of
+        values, highest priority first.
+    """
+    return bulk_group(query(subjects, meta_type, date, sources, *keys))
+
+
+def query(subjects, meta_type, date, sources, *keys):
+    """Constructs the query behind 'run', without grouping its results.
+
+    This is separated out mainly so that the database side of a metadata
+    lookup can be measured on its own; see 'run' for the arguments.
+
+    Returns:
+        A query returning (subject ID, key name, value) tuples, ordered by
+        subject ID, then key, then priority and recency.
+    """
     # Metadata is currently held in a relational database.
     # It would be spiffing to change this
     first, *rest = itertools.filterfalse(
@@ -135,20 +197,18 @@ def run(subjects, meta_type, date, sources, *keys):
 
     union = first.union(*rest).subquery()
 
-    return bulk_group(
-        lass.model_base.DBSession.query(
-            union.c.subject_id,
-            union.c.key,
-            union.c.value
-        ).filter(
-            (union.c.key.in_(keys)) &
-            (lass.common.mixins.Transient.active_on(date, union.c))
-        ).order_by(
-            sqlalchemy.asc(union.c.subject_id),
-            sqlalchemy.asc(union.c.key),
-            sqlalchemy.asc(union.c.priority),
-            sqlalchemy.desc(union.c.effective_from)
-        )
+    return lass.model_base.DBSession.query(
+        union.c.subject_id,
+        union.c.key,
+        union.c.value
+    ).filter(
+        (union.c.key.in_(keys)) &
+        (lass.common.mixins.Transient.active_on(date, union.c))
+    ).order_by(
+        sqlalchemy.asc(union.c.subject_id),
+        sqlalchemy.asc(union.c.key),
+        sqlalchemy.asc(union.c.priority),
+        sqlalchemy.desc(union.c.effective_from)
     )
 
 
@@ -222,9 +282,10 @@ def search(term, keys, model, now=None, order='alpha'):
     if now is None:
         now = lass.common.time.aware_now()
 
-    # This is needed to force the backreferences on model that point to its
-    # metadata to appear.  Any less hacky way of doing this is much appreciated.
-    _ = model()
+    # The backreferences on model that point to its metadata only appear
+    # once the mappers are configured.  'lass.main' does this at startup,
+    # so this is usually a no-op.
+    sqlalchemy.orm.configure_mappers()
 
     meta = relationship_to_model(model.text_entries)
 
@@ -252,10 +313,15 @@ def search(term, keys, model, now=None, order='alpha'):
     return query
 
 
+@lass.common.singleflight.coalesce(
+    key=lambda: (),
+    adopt=lass.common.database.merge_instances
+)
 def searchable_keys():
     """Finds all metadata keys that should be available for searching.
 
-    This function costs one database query per run.
+    This function costs one database query per run, which concurrent
+    callers share.
 
     Returns:
         A list of metadata keys, in alphabetical order by their plural
@@ -0,0 +1,157 @@
+"""Nose tests for the Metadata submodule.
+
+---
+
+Copyright (c) 2013, University Radio York.
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimer in the
+  documentation and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import lass.common.benchmark
+import lass.metadata.benchmarks
+import lass.metadata.layers
+import lass.metadata.query
+import lass.model_base
+import lass.uryplayer.models
+
+
+#
+# lass.metadata.query
+#
+
+
+def test_bulk_group():
+    """Tests 'lass.metadata.query.bulk_group'."""
+    assert lass.metadata.query.bulk_group([]) == {}
+
+    tuples = [
+        (1, 'description', 'own'),
+        (1, 'title', 'own'),
+        (1, 'title', 'package'),
+        (1, 'title', 'own'),
+        (2, 'title', 'package')
+    ]
+    assert lass.metadata.query.bulk_group(tuples) == {
+        1: {'description': ['own'], 'title': ['own', 'package']},
+        2: {'title': ['package']}
+    }
+    assert lass.metadata.query.bulk_group(tuples, levels=1) == {
+        1: [
+            ('description', 'own'),
+            ('title', 'own'),
+            ('title', 'package')
+        ],
+        2: [('title', 'package')]
+    }
+
+
+def test_run_own_and_package():
+    """Tests that 'lass.metadata.query.run' pulls in current metadata
+    from both the subject and its package, subject first.
+    """
+    Podcast = lass.uryplayer.models.Podcast
+
+    with lass.common.benchmark.standin() as engine:
+        generator = lass.metadata.benchmarks.Generator(
+            engine,
+            subjects=20,
+            keys=2,
+            history=3,
+            packages=2
+        )
+        generator.populate()
+
+        podcasts = lass.model_base.DBSession.query(Podcast).all()
+        meta = Podcast.bulk_meta(podcasts, 'text', 'title', 'description')
+
+        assert len(meta) == 20
+        first = meta[podcasts[0].id]
+        assert first['title'][0] == generator.value(0, 'title')
+        assert first['title'][1].startswith('Package ')
+        # Superseded versions should never turn up.
+        assert not any(
+            value.startswith('Old ')
+            for keys in meta.values()
+            for values in keys.values()
+            for value in values
+        )
+
+
+#
+# lass.metadata.layers
+#
+
+
+def test_layered_metadata():
+    """Tests 'lass.metadata.layers.LayeredMetadata'."""
+    show = {'title': ['Show'], 'description': ['About the show']}
+    own = {'title': ['Episode']}
+    layered = lass.metadata.layers.LayeredMetadata(own, show, None)
+
+    assert layered['title'] == ['Episode', 'Show']
+    assert layered['description'] is show['description']
+    assert 'description' in layered
+    assert 'summary' not in layered
+    assert sorted(layered) == ['description', 'title']
+    assert len(layered) == 2
+
+    # Writes only ever go to the view's own layer.
+    layered['description'] = ['Custom']
+    assert layered['description'] == ['Custom', 'About the show']
+    assert show == {'title': ['Show'], 'description': ['About the show']}
+    del layered['title']
+    assert layered['title'] == ['Show']
+    assert own == {'description': ['Custom']}
+
+    # Re-layering a view doesn't repeat its parents.
+    again = lass.metadata.layers.LayeredMetadata(layered, show)
+    assert again.layers == (own, show)
+
+
+#
+# lass.metadata.benchmarks
+#
+
+
+def test_benchmark_smoke():
+    """Runs the metadata benchmark once at a small scale, checking the
+    number of rows each stage transfers.
+    """
+    results, info = lass.metadata.benchmarks.benchmark(
+        subjects=100,
+        keys=3,
+        history=2,
+        repeat=1
+    )
+
+    stages = results[lass.metadata.benchmarks.scale_name(100, 3, 2)]
+    assert set(stages) == set(lass.metadata.benchmarks.STAGES)
+
+    transferred = info['transferred']
+    # One own and one package row per subject and key.
+    assert transferred['query'] == 100 * 3 * 2
+    assert transferred['search_all'] == 100
+    assert transferred['search_tenth'] == 10
+    assert transferred['search_hundredth'] == 1
+    assert transferred['search_none'] == 0
@@ -0,0 +1,430 @@
+"""Most-played tracks and artists, from the track listings.
+
+Years of track listings are far too many to aggregate on every request,
+so plays are rolled up into weekly per-show counts ('PlayRollup'), and
+the most-played lists for a week, a term or a show are sums over those.
+The rollup is incremental: 'update' carries on from the last track
+listing it processed (recorded in 'RollupProgress'), so it never scans
+history twice.
+
+Listings are only rolled up once they have settled (see SETTLE_TIME), so
+that tracklist corrections made during and shortly after a show are taken
+into account; listings deleted after being rolled up are not subtracted.
+
+---
+
+Copyright (c) 2013, University Radio York.
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimer in the
+  documentation and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import collections
+import datetime
+import functools
+import itertools
+import logging
+
+import sqlalchemy
+import transaction
+
+import lass.common.time
+import lass.model_base
+import lass.music.models
+import lass.schedule.models
+
+
+log = logging.getLogger(__name__)
+
+
+# The kinds of item most-played lists can be made of.
+KINDS = ('track', 'artist')
+
+# The name of the rollup's entry in 'RollupProgress'.
+PROGRESS_NAME = 'plays'
+
+# How many track listings to roll up at a time.
+BATCH_SIZE = 5000
+
+# How long after being played a track listing is rolled up.
+SETTLE_TIME = datetime.timedelta(hours=6)
+
+# The default length of a most-played list.
+DEFAULT_LIMIT = 20
+
+
+Played = collections.namedtuple(
+    'Played',
+    'kind artist title track_id plays'
+)
+Played.__doc__ = """One entry of a most-played list.
+
+'title' is None for artists; 'track_id' is the library track of the entry,
+if any of its plays came from the library.
+"""
+
+
+#
+# Rolling up
+#
+
+
+def new_plays(after_id, limit):
+    """Constructs a query for the track listings after a given one.
+
+    Both tracks from the record library and tracks entered by hand are
+    selected; deleted and omitted tracklist entries are not.
+
+    Args:
+        after_id: The audiologid of the last listing already processed.
+        limit: The maximum number of listings to select.
+
+    Returns:
+        A query returning (listing ID, played at, show ID, track ID, title,
+        artist) tuples, in listing order.  The show ID is None for listings
+        outside a timeslot, as is the track ID for tracks not in the
+        library.
+    """
+    music = lass.music.models
+    Timeslot = lass.schedule.models.Timeslot
+    Season = lass.schedule.models.Season
+
+    def listings(*columns):
+        return lass.model_base.DBSession.query(
+            music.TrackListing.id.label('listing_id'),
+            music.TrackListing.timestart.label('played_at'),
+            Season.show_id.label('show_id'),
+            *columns
+        ).select_from(
+            music.TrackListing
+        ).outerjoin(
+            Timeslot,
+            Timeslot.id == music.TrackListing.timeslotid
+        ).outerjoin(
+            Season,
+            Season.id == Timeslot.season_id
+        ).filter(
+            (music.TrackListing.id > after_id) &
+            (
+                (music.TrackListing.state_id == None) |
+                (~music.TrackListing.state_id.in_(['o', 'd']))
+            )
+        )
+
+    in_library = listings(
+        music.Track.id.label('track_id'),
+        music.Track.title.label('title'),
+        music.Track.artist.label('artist')
+    ).join(
+        music.TrackListingLibraryTrack,
+        music.TrackListingLibraryTrack.audiologid == music.TrackListing.id
+    ).join(
+        music.Track,
+        music.Track.id == music.TrackListingLibraryTrack.trackid
+    )
+
+    out_library = listings(
+        sqlalchemy.cast(sqlalchemy.null(), sqlalchemy.Integer).label(
+            'track_id'
+        ),
+        music.TrackListingCustomTrack.track.label('title'),
+        music.TrackListingCustomTrack.artist.label('artist')
+    ).join(
+        music.TrackListingCustomTrack,
+        music.TrackListingCustomTrack.audiologid == music.TrackListing.id
+    )
+
+    return in_library.union_all(out_library).order_by(
+        sqlalchemy.asc('listing_id')
+    ).limit(limit)
+
+
+def normalise(value):
+    """Normalises an artist or title, so variations in case and spacing
+    count as the same thing.
+    """
+    return ' '.join((value or '').split()).casefold()
+
+
+def items(play):
+    """Works out the (kind, item key, artist, title) of everything a play
+    counts towards.
+    """
+    artist_key = normalise(play.artist)
+    track_key = '\t'.join((artist_key, normalise(play.title)))
+    return (
+        ('track', track_key, play.artist, play.title),
+        ('artist', artist_key, play.artist, None)
+    )
+
+
+def local_time(played_at, time_context):
+    """Converts the time of a track listing to aware local time.
+
+    Listing times without a timezone are taken to be local already.
+    """
+    if played_at.tzinfo is None:
+        return time_context.timezone.localize(played_at)
+    return time_context.localise(played_at)
+
+
+def week_of(when, time_context):
+    """Returns the Monday of the schedule week an aware datetime is in."""
+    date = time_context.schedule_date_of(when)
+    return date - datetime.timedelta(days=date.weekday())
+
+
+def tally(plays, time_context):
+    """Counts plays by week, show, kind and item.
+
+    Args:
+        plays: An iterable of rows from 'new_plays'.
+        time_context: The TimeContext used to work out weeks.
+
+    Returns:
+        A dict mapping (week, show ID, kind, item key) tuples to
+        [artist, title, track ID, plays] lists.
+    """
+    counts = {}
+    for play in plays:
+        week = week_of(local_time(play.played_at, time_context), time_context)
+        for kind, key, artist, title in items(play):
+            count = counts.setdefault(
+                (week, play.show_id, kind, key),
+                [artist, title, None, 0]
+            )
+            count[2] = count[2] or play.track_id
+            count[3] += 1
+    return counts
+
+
+def apply(counts):
+    """Adds tallied plays (see 'tally') to the rollup, in the current
+    transaction.
+    """
+    PlayRollup = lass.music.models.PlayRollup
+    if not counts:
+        return
+
+    weeks = {week for week, _, _, _ in counts}
+    keys = {key for _, _, _, key in counts}
+    existing = {
+        (rollup.week, rollup.show_id, rollup.kind, rollup.item_key): rollup
+        for rollup in lass.model_base.DBSession.query(PlayRollup).filter(
+            PlayRollup.week.in_(weeks) &
+            PlayRollup.item_key.in_(keys)
+        ).all()
+    }
+
+    for (week, show_id, kind, key), count in counts.items():
+        artist, title, track_id, plays = count
+        rollup = existing.get((week, show_id, kind, key))
+        if rollup is None:
+            lass.model_base.DBSession.add(
+                PlayRollup(
+                    week=week,
+                    show_id=show_id,
+                    kind=kind,
+                    item_key=key,
+                    artist=artist,
+                    title=title,
+                    trackid=track_id,
+                    plays=plays
+                )
+            )
+        else:
+            rollup.plays += plays
+            rollup.trackid = rollup.trackid or track_id
+
+
+def update(batch_size=BATCH_SIZE, now=None, time_context=None):
+    """Rolls up one batch of the track listings made since the last update.
+
+    Each batch is rolled up and recorded as processed in one transaction,
+    so an interrupted update loses nothing and counts nothing twice.
+
+    Args:
+        batch_size: The maximum number of listings to roll up.
+            (Default: BATCH_SIZE.)
+        now: The current aware datetime; listings made within SETTLE_TIME of
+            it are left for later.  If None, the current time is used.
+            (Default: None.)
+        time_context: The TimeContext used to work out weeks.  If None, the
+            site configuration is used.  (Default: None.)
+
+    Returns:
+        The number of listings rolled up; if this is less than
+        'batch_size', the rollup has caught up.
+    """
+    if now is None:
+        now = lass.common.time.aware_now()
+    if time_context is None:
+        time_context = lass.common.time.context_from_config()
+    settled_before = now - SETTLE_TIME
+
+    with transaction.manager:
+        session = lass.model_base.DBSession
+        progress = session.query(lass.music.models.RollupProgress).get(
+            PROGRESS_NAME
+        )
+        if progress is None:
+            progress = lass.music.models.RollupProgress(
+                name=PROGRESS_NAME,
+                last_audiologid=0
+            )
+            session.add(progress)
+
+        # Stop at the first unsettled listing, rather than skipping it, so
+        # that everything before the recorded listing has been processed.
+        plays = list(
+            itertools.takewhile(
+                lambda play: (
+                    local_time(play.played_at, time_context) < settled_before
+                ),
+                new_plays(progress.last_audiologid, batch_size)
+            )
+        )
+        if plays:
+            apply(tally(plays, time_context))
+            progress.last_audiologid = plays[-1].listing_id
+            progress.updated_at = now
+
+    log.info('Rolled up %d track listings.', len(plays))
+    return len(plays)
+
+
+def catch_up(batch_size=BATCH_SIZE, now=None, time_context=None):
+    """Rolls up every settled track listing not yet rolled up.
+
+    Returns:
+        The number of listings rolled up.
+    """
+    total = 0
+    while True:
+        count = update(batch_size, now, time_context)
+        total += count
+        if count < batch_size:
+            return total
+
+
+#
+# Querying
+#
+
+
+def generation():
+    """Returns a value that changes whenever the rollup does."""
+    progress = lass.model_base.DBSession.query(
+        lass.music.models.RollupProgress.last_audiologid
+    ).filter(
+        lass.music.models.RollupProgress.name == PROGRESS_NAME
+    ).scalar()
+    return progress or 0
+
+
+def most_played(
+    kind,
+    first_week=None,
+    last_week=None,
+    show_id=None,
+    limit=DEFAULT_LIMIT
+):
+    """Works out the most played tracks or artists.
+
+    Results are cached for as long as the rollup is unchanged.
+
+    Args:
+        kind: One of 'KINDS'.
+        first_week: If given, the Monday of the first week to count plays
+            from.  (Default: None.)
+        last_week: If given, the Monday of the last week to count plays
+            from.  (Default: None.)
+        show_id: If given, only plays on this show are counted.
+            (Default: None.)
+        limit: The maximum number of entries to return.
+            (Default: DEFAULT_LIMIT.)
+
+    Returns:
+        A tuple of Played, most played first.
+    """
+    if kind not in KINDS:
+        raise ValueError('No such kind of item: {}.'.format(kind))
+    return cached_most_played(
+        generation(),
+        kind,
+        first_week,
+        last_week,
+        show_id,
+        limit
+    )
+
+
+@functools.lru_cache(maxsize=256)
+def cached_most_played(_, kind, first_week, last_week, show_id, limit):
+    """Works out most-played lists for 'most_played'.
+
+    The first argument is the rollup generation (see 'generation'), which
+    is only there to stop results outliving the rollup they came from.
+    """
+    PlayRollup = lass.music.models.PlayRollup
+    plays = sqlalchemy.func.sum(PlayRollup.plays)
+
+    conditions = [PlayRollup.kind == kind]
+    if first_week is not None:
+        conditions.append(PlayRollup.week >= first_week)
+    if last_week is not None:
+        conditions.append(PlayRollup.week <= last_week)
+    if show_id is not None:
+        conditions.append(PlayRollup.show_id == show_id)
+
+    rows = lass.model_base.DBSession.query(
+        sqlalchemy.func.max(PlayRollup.artist),
+        sqlalchemy.func.max(PlayRollup.title),
+        sqlalchemy.func.max(PlayRollup.trackid),
+        plays
+    ).filter(
+        sqlalchemy.and_(*conditions)
+    ).group_by(
+        PlayRollup.item_key
+    ).order_by(
+        sqlalchemy.desc(plays),
+        sqlalchemy.asc(PlayRollup.item_key)
+    ).limit(limit)
+
+    return tuple(
+        Played(kind, artist, title, track_id, count)
+        for artist, title, track_id, count in rows
+    )
+
+
+def term_weeks(term, time_context):
+    """Returns the Mondays of the first and last weeks of a term; the last
+    is None if the term has no finish.
+    """
+    return (
+        week_of(term.start, time_context),
+        None if term.finish is None else week_of(
+            term.finish - datetime.timedelta(seconds=1),
+            time_context
+        )
+    )
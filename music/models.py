@@ -40,6 +40,8 @@ import sqlalchemy
 
 import lass.model_base
 import lass.common
+import lass.common.database
+import lass.common.singleflight
 import lass.people.models
 
 
@@ -321,6 +323,55 @@ class TrackListingCustomTrack(TracklistModel):
     length = sqlalchemy.Column(sqlalchemy.DateTime)
 
 
+class PlayRollup(TracklistModel):
+    """A count of the plays of one track or artist on one show in one week.
+
+    These are maintained incrementally from the track listings by
+    'lass.music.analytics', and are what its most-played lists are worked
+    out from.
+    """
+    __tablename__ = 'play_rollup'
+    __table_args__ = (
+        sqlalchemy.UniqueConstraint('week', 'show_id', 'kind', 'item_key'),
+        TracklistModel.__table_args__
+    )
+
+    id = sqlalchemy.Column(
+        'play_rollup_id',
+        sqlalchemy.Integer,
+        primary_key=True,
+        nullable=False
+    )
+    # The Monday of the (schedule) week of the plays.
+    week = sqlalchemy.Column(sqlalchemy.Date, nullable=False)
+    # Will cause circular dependencies if the target is not a string.
+    # NULL for plays outside any scheduled show.
+    show_id = sqlalchemy.Column(sqlalchemy.ForeignKey('schedule.show.show_id'))
+    # 'track' or 'artist'.
+    kind = sqlalchemy.Column(sqlalchemy.String(6), nullable=False)
+    # The normalised artist (and title, for tracks) the plays are of.
+    item_key = sqlalchemy.Column(sqlalchemy.Text, nullable=False)
+    artist = sqlalchemy.Column(sqlalchemy.Text, nullable=False)
+    title = sqlalchemy.Column(sqlalchemy.Text)
+    # The library track, if any play came from the library.
+    trackid = sqlalchemy.Column(sqlalchemy.ForeignKey(Track.id))
+    plays = sqlalchemy.Column(sqlalchemy.Integer, nullable=False)
+
+
+class RollupProgress(TracklistModel):
+    """How far through the track listings a rollup has got."""
+    __tablename__ = 'rollup_progress'
+
+    name = sqlalchemy.Column(sqlalchemy.String(50), primary_key=True)
+    # The last track listing to be rolled up.
+    last_audiologid = sqlalchemy.Column(
+        sqlalchemy.Integer,
+        nullable=False,
+        server_default='0'
+    )
+    updated_at = sqlalchemy.Column(sqlalchemy.DateTime(timezone=True))
+
+
 #
 # Music
 #
@@ -345,6 +396,10 @@ class Chart(lass.common.mixins.Type, MusicModel):
     releases = sqlalchemy.orm.relationship('ChartRelease', backref='chart')
 
     @classmethod
+    @lass.common.singleflight.coalesce(
+        key=lambda cls, chart_name, on_date=None: (chart_name, on_date),
+        adopt=lass.common.database.merge_instances
+    )
     def latest(cls, chart_name, on_date=None):
         """Retrieves the latest chart with a given name.
 
@@ -360,6 +415,8 @@ class Chart(lass.common.mixins.Type, MusicModel):
             on_date: The datetime for which the latest (relatively speaking)
                 chart is sought.  If None, use the current datetime.
                 (Default: None.)
+
+        Concurrent requests for the current chart share one query.
         """
         if on_date is None:
             on_date = lass.common.time.aware_now()
@@ -456,3 +513,52 @@ class ChartRow(MusicModel):
     trackid = sqlalchemy.Column(sqlalchemy.ForeignKey(Track.id))
     track = sqlalchemy.orm.relationship(Track, lazy='joined')
     # Backref 'release' from ChartRelease.rows
+
+
+#
+# Library search index
+#
+
+
+class SearchToken(MusicModel):
+    """An occurrence of a normalised word in the artist, title or record
+    title of a library track.
+
+    These are maintained by 'lass.music.search'.
+    """
+    __tablename__ = 'search_token'
+
+    # The primary key doubles as the index searches go through: equality
+    # and prefix (range) matches on the token.
+    token = sqlalchemy.Column(sqlalchemy.String(64), primary_key=True)
+    trackid = sqlalchemy.Column(
+        sqlalchemy.ForeignKey(Track.id),
+        primary_key=True
+    )
+    # 'artist', 'title' or 'record'.
+    field = sqlalchemy.Column(sqlalchemy.String(6), primary_key=True)
+
+
+class SearchTrigram(MusicModel):
+    """A trigram of a word in the search vocabulary, used to find words
+    resembling misspelt search terms.
+    """
+    __tablename__ = 'search_trigram'
+
+    trigram = sqlalchemy.Column(sqlalchemy.String(3), primary_key=True)
+    token = sqlalchemy.Column(sqlalchemy.String(64), primary_key=True)
+
+
+class SearchIndexState(MusicModel):
+    """How far the library search index has got."""
+    __tablename__ = 'search_index_state'
+
+    name = sqlalchemy.Column(sqlalchemy.String(50), primary_key=True)
+    # The highest track ID indexed.
+    last_trackid = sqlalchemy.Column(
+        sqlalchemy.Integer,
+        nullable=False,
+        server_default='0'
+    )
+    # When the index was last updated; records edited since are reindexed.
+    indexed_at = sqlalchemy.Column(sqlalchemy.DateTime(timezone=True))
@@ -0,0 +1,496 @@
+"""Ranked, typo-tolerant search over the music library.
+
+The artists, titles and record titles of library tracks are broken into
+normalised words (lower case, accents and punctuation removed), which are
+stored as an inverted index ('SearchToken').  A search looks each of its
+words up in the index, also matching words it is a prefix of and, if the
+word is not in the index at all, the closest words in the vocabulary by
+trigram similarity ('SearchTrigram').  Tracks are then ranked by how well
+they match each search word, weighted by where the match was.
+
+Every lookup goes through a primary key index, so searches stay fast on
+libraries of hundreds of thousands of tracks.  Run
+'python -m lass.scripts.index_library' to build and update the index.
+
+---
+
+Copyright (c) 2013, University Radio York.
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimer in the
+  documentation and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import logging
+import re
+import unicodedata
+
+import sqlalchemy
+import transaction
+import zope.sqlalchemy
+
+import lass.common.time
+import lass.model_base
+import lass.music.models
+
+
+log = logging.getLogger(__name__)
+
+
+# How much a match in each field counts towards a track's rank.
+FIELD_WEIGHTS = {'title': 1.0, 'artist': 1.0, 'record': 0.5}
+
+# How much each kind of match of a search word counts; fuzzy matches
+# count this much times their similarity.
+EXACT_WEIGHT = 1.0
+PREFIX_WEIGHT = 0.75
+FUZZY_WEIGHT = 0.6
+
+# The least trigram similarity a word may have to be a fuzzy match (the
+# same default as pg_trgm).
+MIN_SIMILARITY = 0.3
+
+# How many indexed words a search word may be expanded into.
+MAX_PREFIX_MATCHES = 50
+MAX_FUZZY_MATCHES = 5
+
+# Words are truncated to this length, that of 'SearchToken.token'.
+MAX_TOKEN_LENGTH = 64
+
+# How many tracks to index at a time.
+BATCH_SIZE = 2000
+
+# How many values to put in one IN clause; SQLite allows at most 999
+# parameters in a statement.
+CHUNK_SIZE = 500
+
+# The name of the index's entry in 'SearchIndexState'.
+STATE_NAME = 'library'
+
+SEPARATORS = re.compile(r'[\W_]+')
+
+
+#
+# Normalisation
+#
+
+
+def fold(text):
+    """Lower-cases a string and removes its accents."""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ''.join(
+        character
+        for character in decomposed
+        if not unicodedata.combining(character)
+    ).casefold()
+
+
+def tokens(text):
+    """Breaks a string into normalised words, in order."""
+    return [
+        word[:MAX_TOKEN_LENGTH]
+        for word in SEPARATORS.split(fold(text))
+        if word
+    ]
+
+
+def trigrams(token):
+    """Returns the set of trigrams of a word, padded in the same way as
+    PostgreSQL's pg_trgm so that the starts of words count for more.
+    """
+    padded = '  {} '.format(token)
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def chunks(values, size=CHUNK_SIZE):
+    """Splits a list into lists of at most 'size' values."""
+    values = list(values)
+    return [values[i:i + size] for i in range(0, len(values), size)]
+
+
+#
+# Indexing
+#
+
+
+def track_rows(condition):
+    """Constructs a query for the searchable text of library tracks.
+
+    Args:
+        condition: A filter selecting the tracks to return.
+
+    Returns:
+        A query returning (track ID, title, artist, record title) tuples,
+        in track ID order.
+    """
+    Track = lass.music.models.Track
+    Record = lass.music.models.Record
+    return lass.model_base.DBSession.query(
+        Track.id,
+        Track.title,
+        Track.artist,
+        Record.title
+    ).join(
+        Record,
+        Record.id == Track.recordid
+    ).filter(
+        condition
+    ).order_by(
+        sqlalchemy.asc(Track.id)
+    )
+
+
+def postings(rows):
+    """Works out the index entries of tracks.
+
+    Args:
+        rows: An iterable of rows from 'track_rows'.
+
+    Returns:
+        A set of (token, track ID, field) tuples.
+    """
+    return {
+        (token, track_id, field)
+        for track_id, title, artist, record in rows
+        for field, text in (
+            ('title', title),
+            ('artist', artist),
+            ('record', record)
+        )
+        for token in tokens(text)
+    }
+
+
+def index(rows, replace=True):
+    """Indexes tracks, in the current transaction.
+
+    Args:
+        rows: A list of rows from 'track_rows'.
+        replace: Whether the tracks may already be indexed, in which case
+            their old index entries are removed first.  Removal is not
+            helped by the index, so new tracks should pass False.
+            (Default: True.)
+    """
+    session = lass.model_base.DBSession
+    SearchToken = lass.music.models.SearchToken
+    SearchTrigram = lass.music.models.SearchTrigram
+
+    for track_ids in chunks(row[0] for row in rows) if replace else ():
+        session.execute(
+            SearchToken.__table__.delete().where(
+                SearchToken.__table__.c.trackid.in_(track_ids)
+            )
+        )
+
+    entries = postings(rows)
+    if entries:
+        session.execute(
+            SearchToken.__table__.insert(),
+            [
+                {'token': token, 'trackid': track_id, 'field': field}
+                for token, track_id, field in entries
+            ]
+        )
+
+    # Add any words new to the vocabulary to the trigram index.
+    words = {token for token, _, _ in entries}
+    for chunk in chunks(words):
+        words.difference_update(
+            token
+            for token, in session.query(SearchTrigram.token).filter(
+                SearchTrigram.token.in_(chunk)
+            ).distinct()
+        )
+    if words:
+        session.execute(
+            SearchTrigram.__table__.insert(),
+            [
+                {'trigram': trigram, 'token': token}
+                for token in words
+                for trigram in trigrams(token)
+            ]
+        )
+
+    # The session can't see changes made through 'execute' by itself, and
+    # would roll them back.
+    zope.sqlalchemy.mark_changed(session())
+
+
+def update(batch_size=BATCH_SIZE, now=None):
+    """Brings the search index up to date.
+
+    Tracks added since the last update are indexed, as are all tracks on
+    records edited since the last update.  Each batch of tracks is
+    indexed in its own transaction.
+
+    Args:
+        batch_size: The number of tracks to index at a time.
+            (Default: BATCH_SIZE.)
+        now: The aware datetime to record as the time of the update.  If
+            None, the current time is used.  (Default: None.)
+
+    Returns:
+        The number of tracks indexed.
+    """
+    Track = lass.music.models.Track
+    Record = lass.music.models.Record
+    SearchIndexState = lass.music.models.SearchIndexState
+    session = lass.model_base.DBSession
+
+    if now is None:
+        now = lass.common.time.aware_now()
+
+    with transaction.manager:
+        state = session.query(SearchIndexState).get(STATE_NAME)
+        last_trackid = state.last_trackid if state else 0
+        indexed_at = state.indexed_at if state else None
+
+    edited = (
+        (Track.id <= last_trackid) & (Record.datetime_lastedit > indexed_at)
+        if indexed_at is not None
+        else sqlalchemy.false()
+    )
+
+    phases = (
+        # Edited tracks are reindexed; new ones are indexed for the first
+        # time, and advance the state.
+        (edited, True),
+        (Track.id > last_trackid, False)
+    )
+
+    total = 0
+    for condition, replace in phases:
+        after_id = 0
+        while True:
+            with transaction.manager:
+                rows = track_rows(
+                    condition & (Track.id > after_id)
+                ).limit(batch_size).all()
+                index(rows, replace)
+                if rows and not replace:
+                    set_state(last_trackid=rows[-1][0])
+            total += len(rows)
+            if len(rows) < batch_size:
+                break
+            after_id = rows[-1][0]
+
+    with transaction.manager:
+        set_state(indexed_at=now)
+
+    log.info('Indexed %d library tracks.', total)
+    return total
+
+
+def set_state(**values):
+    """Updates the index's 'SearchIndexState', in the current transaction.
+    """
+    session = lass.model_base.DBSession
+    state = session.query(lass.music.models.SearchIndexState).get(STATE_NAME)
+    if state is None:
+        state = lass.music.models.SearchIndexState(
+            name=STATE_NAME,
+            last_trackid=0
+        )
+        session.add(state)
+    for name, value in values.items():
+        setattr(state, name, value)
+
+
+def rebuild(batch_size=BATCH_SIZE, now=None):
+    """Throws the search index away and builds it again from scratch.
+
+    Returns:
+        The number of tracks indexed.
+    """
+    models = lass.music.models
+    with transaction.manager:
+        for model in (
+            models.SearchToken,
+            models.SearchTrigram,
+            models.SearchIndexState
+        ):
+            lass.model_base.DBSession.execute(model.__table__.delete())
+        zope.sqlalchemy.mark_changed(lass.model_base.DBSession())
+    return update(batch_size, now)
+
+
+#
+# Searching
+#
+
+
+def matches(word):
+    """Finds the indexed words a search word matches.
+
+    Args:
+        word: A normalised search word.
+
+    Returns:
+        A dict mapping each matching indexed word to the weight of the
+        match; empty if nothing matches.
+    """
+    SearchToken = lass.music.models.SearchToken
+    session = lass.model_base.DBSession
+
+    # The range lets the index answer the prefix match whatever the
+    # collation; the LIKE makes sure it is exact.  Tokens never contain
+    # LIKE wildcards.
+    successor = word[:-1] + chr(ord(word[-1]) + 1)
+    prefixed = session.query(SearchToken.token).filter(
+        (SearchToken.token >= word) &
+        (SearchToken.token < successor) &
+        SearchToken.token.like(word + '%')
+    ).distinct().order_by(
+        sqlalchemy.asc(SearchToken.token)
+    ).limit(MAX_PREFIX_MATCHES)
+
+    found = {
+        token: EXACT_WEIGHT if token == word else PREFIX_WEIGHT
+        for token, in prefixed
+    }
+    if word not in found:
+        found.update(fuzzy_matches(word))
+    return found
+
+
+def fuzzy_matches(word):
+    """Finds the indexed words most similar to a search word.
+
+    Similarity is the Jaccard similarity of the words' trigram sets, as in
+    PostgreSQL's pg_trgm.
+
+    Returns:
+        A dict mapping up to MAX_FUZZY_MATCHES words at least
+        MIN_SIMILARITY similar to 'word' to their fuzzy match weights.
+    """
+    SearchTrigram = lass.music.models.SearchTrigram
+    word_trigrams = trigrams(word)
+    shared = sqlalchemy.func.count(SearchTrigram.trigram)
+
+    # A word can only be similar enough if it shares enough trigrams.
+    candidates = lass.model_base.DBSession.query(
+        SearchTrigram.token,
+        shared
+    ).filter(
+        SearchTrigram.trigram.in_(word_trigrams)
+    ).group_by(
+        SearchTrigram.token
+    ).having(
+        shared >= MIN_SIMILARITY * len(word_trigrams)
+    ).order_by(
+        sqlalchemy.desc(shared)
+    ).limit(
+        MAX_FUZZY_MATCHES * 10
+    )
+
+    similar = sorted(
+        (
+            (count / (len(word_trigrams) + len(trigrams(token)) - count), token)
+            for token, count in candidates
+        ),
+        reverse=True
+    )
+    return {
+        token: FUZZY_WEIGHT * similarity
+        for similarity, token in similar[:MAX_FUZZY_MATCHES]
+        if similarity >= MIN_SIMILARITY
+    }
+
+
+def search(text):
+    """Constructs a ranked library search query.
+
+    Each word of 'text' contributes the weight of its best match in each
+    track (see 'matches' and FIELD_WEIGHTS), so tracks matching more of
+    the search, and matching it better, come first.
+
+    Args:
+        text: The search string.
+
+    Returns:
+        A query returning library tracks, best match first, suitable for
+        'lass.common.view_helpers.media_list'; or None if 'text' has no
+        words in it.
+    """
+    SearchToken = lass.music.models.SearchToken
+    Track = lass.music.models.Track
+
+    words = list(dict.fromkeys(tokens(text)))
+    if not words:
+        return None
+
+    field_weight = sqlalchemy.case(
+        [
+            (SearchToken.field == field, weight)
+            for field, weight in FIELD_WEIGHTS.items()
+        ],
+        else_=0
+    )
+
+    word_scores = []
+    for word in words:
+        found = matches(word)
+        if found:
+            match_weight = sqlalchemy.case(
+                [
+                    (SearchToken.token == token, weight)
+                    for token, weight in found.items()
+                ],
+                else_=0
+            )
+            word_scores.append(
+                sqlalchemy.select([
+                    SearchToken.trackid.label('trackid'),
+                    sqlalchemy.func.max(match_weight * field_weight).label(
+                        'score'
+                    )
+                ]).where(
+                    SearchToken.token.in_(list(found))
+                ).group_by(
+                    SearchToken.trackid
+                )
+            )
+
+    if not word_scores:
+        # Nothing matches, but the caller still wants a query.
+        return lass.model_base.DBSession.query(Track).filter(
+            sqlalchemy.false()
+        )
+
+    scores = sqlalchemy.union_all(*word_scores).alias('word_scores')
+    ranked = sqlalchemy.select([
+        scores.c.trackid,
+        sqlalchemy.func.sum(scores.c.score).label('score')
+    ]).group_by(
+        scores.c.trackid
+    ).alias('ranked')
+
+    return lass.model_base.DBSession.query(
+        Track
+    ).join(
+        ranked,
+        ranked.c.trackid == Track.id
+    ).order_by(
+        sqlalchemy.desc(ranked.c.score),
+        sqlalchemy.asc(Track.title),
+        sqlalchemy.asc(Track.id)
+    )
@@ -0,0 +1,397 @@
+"""Nose tests for the Music submodule.
+
+---
+
+Copyright (c) 2013, University Radio York.
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimer in the
+  documentation and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import datetime
+import functools
+
+import pyramid.exceptions
+import pyramid.testing
+import pytz
+
+import lass.common.benchmark
+import lass.common.time
+import lass.model_base
+import lass.music.analytics
+import lass.music.models
+import lass.music.search
+import lass.music.views
+import lass.people.models
+import lass.schedule.benchmarks
+import lass.schedule.models
+import lass.schedule.terms
+
+
+#
+# lass.music.analytics
+#
+
+
+TIME_CONTEXT = lass.common.time.TimeContext(
+    timezone='Europe/London',
+    second_year_terms=['spring', 'summer'],
+    schedule_start_time=3
+)
+
+
+def populate_plays(engine):
+    """Fills a stand-in database with a show and a few weeks of plays."""
+    music = lass.music.models
+    schedule = lass.schedule.models
+    row = lass.common.benchmark.row
+    insert = functools.partial(lass.common.benchmark.insert, engine)
+    start = datetime.datetime(2013, 10, 7, 9, tzinfo=pytz.utc)
+
+    insert(lass.people.models.Person, [row(lass.people.models.Person, id=1)])
+    insert(schedule.Show, [row(
+        schedule.Show,
+        id=1,
+        type_id=1,
+        submitted_at=start,
+        owner_id=1
+    )])
+    insert(schedule.Season, [row(
+        schedule.Season,
+        id=1,
+        show_id=1,
+        term_id=1,
+        submitted_at=start,
+        owner_id=1
+    )])
+    insert(schedule.Timeslot, [row(
+        schedule.Timeslot,
+        id=1,
+        season_id=1,
+        start=start,
+        duration=datetime.timedelta(hours=1),
+        owner_id=1,
+        approver_id=1
+    )])
+    insert(music.Record, [row(
+        music.Record,
+        id=1,
+        status_id='o',
+        medium_id='c',
+        format_id='a',
+        memberid_add=1,
+        title='Record',
+        artist='Artist X',
+        recordlabel='Label',
+        dateadded=start,
+        shelfnumber=1,
+        shelfletter='A'
+    )])
+    insert(music.Track, [row(
+        music.Track,
+        id=1,
+        clean='y',
+        recordid=1,
+        artist='Artist X',
+        digitised=True,
+        lastfm_verified=False,
+        genre='p',
+        intro=datetime.time(0, 0, 10),
+        length=datetime.time(0, 3),
+        number=1,
+        title='Song A'
+    )])
+    add_plays(engine, [
+        # (listing ID, timeslot ID, days after start, artist, title, state)
+        (1, 1, 0, 'Artist X', 'Song A', None),
+        (2, 1, 0, 'artist  x', 'song a', None),
+        (3, None, 1, 'Artist X', 'Song B', None),
+        (4, 1, 0, 'Artist Y', 'Song C', 'd'),
+        (5, 1, 7, None, None, None),
+        # Not settled by the time of the first update; holds up the next.
+        (6, None, 25, 'Artist Z', 'Song D', None),
+        (7, None, 1, 'Artist Z', 'Song E', None)
+    ])
+    insert(music.TrackListingLibraryTrack, [row(
+        music.TrackListingLibraryTrack,
+        audiologid=5,
+        recordid=1,
+        trackid=1
+    )])
+
+
+def add_plays(engine, plays):
+    """Adds track listings of tracks not in the library."""
+    music = lass.music.models
+    row = lass.common.benchmark.row
+    start = datetime.datetime(2013, 10, 7, 10)
+
+    lass.common.benchmark.insert(engine, music.TrackListing, [
+        row(
+            music.TrackListing,
+            id=listing_id,
+            source_id='b',
+            state_id=state_id,
+            timeslotid=timeslot_id,
+            timestart=start + datetime.timedelta(days=days)
+        )
+        for listing_id, timeslot_id, days, _, _, state_id in plays
+    ])
+    lass.common.benchmark.insert(engine, music.TrackListingCustomTrack, [
+        row(
+            music.TrackListingCustomTrack,
+            audiologid=listing_id,
+            artist=artist,
+            track=title
+        )
+        for listing_id, _, _, artist, title, _ in plays
+        if artist is not None
+    ])
+
+
+def test_analytics_rollup():
+    """Tests that plays are rolled up incrementally into the right weeks
+    and shows, and that most-played lists follow the rollup.
+    """
+    analytics = lass.music.analytics
+    first_week = datetime.date(2013, 10, 7)
+    now = datetime.datetime(2013, 11, 1, 1, tzinfo=pytz.utc)
+    catch_up = functools.partial(
+        analytics.catch_up,
+        batch_size=2,
+        now=now,
+        time_context=TIME_CONTEXT
+    )
+
+    def tracks(**kwargs):
+        return [
+            (played.title, played.plays, played.track_id)
+            for played in analytics.most_played('track', **kwargs)
+        ]
+
+    with lass.common.benchmark.standin() as engine:
+        populate_plays(engine)
+        assert analytics.generation() == 0
+
+        # The deleted listing is skipped; the unsettled one stops the
+        # rollup, even though the listing after it is settled.
+        assert catch_up() == 4
+        assert analytics.generation() == 5
+        assert catch_up() == 0
+
+        assert tracks() == [('Song A', 3, 1), ('Song B', 1, None)]
+        assert tracks(first_week=first_week, last_week=first_week) == [
+            ('Song A', 2, None),
+            ('Song B', 1, None)
+        ]
+        assert tracks(show_id=1) == [('Song A', 3, 1)]
+        assert tracks(limit=1) == [('Song A', 3, 1)]
+        assert [
+            (played.artist, played.plays)
+            for played in analytics.most_played('artist')
+        ] == [('Artist X', 4)]
+
+        # Once everything has settled, the rest is rolled up and the
+        # cached lists are replaced.
+        add_plays(engine, [(8, 1, 8, 'Artist X', 'SONG B', None)])
+        later = now + datetime.timedelta(days=1)
+        assert catch_up(now=later) == 3
+        assert analytics.generation() == 8
+        assert tracks() == [
+            ('Song A', 3, 1),
+            ('Song B', 2, None),
+            ('Song D', 1, None),
+            ('Song E', 1, None)
+        ]
+
+        rollups = lass.model_base.DBSession.query(
+            lass.music.models.PlayRollup
+        ).filter(
+            lass.music.models.PlayRollup.kind == 'track'
+        ).all()
+        assert sorted(
+            (rollup.week, rollup.show_id, rollup.plays)
+            for rollup in rollups
+            if rollup.item_key == 'artist x\tsong b'
+        ) == [
+            (first_week, None, 1),
+            (first_week + datetime.timedelta(weeks=1), 1, 1)
+        ]
+
+
+def test_term_weeks():
+    """Tests that term weeks run from the first to the last Monday."""
+    term = lass.schedule.terms.TermRecord(
+        1,
+        TIME_CONTEXT.start_on(datetime.date(2013, 10, 7)),
+        TIME_CONTEXT.start_on(datetime.date(2013, 12, 16)),
+        'autumn'
+    )
+    assert lass.music.analytics.term_weeks(term, TIME_CONTEXT) == (
+        datetime.date(2013, 10, 7),
+        datetime.date(2013, 12, 9)
+    )
+
+
+#
+# lass.music.search
+#
+
+
+LIBRARY = [
+    # (track ID, record ID, artist, title, record title)
+    (1, 1, 'Björk', 'Jóga', 'Homogenic'),
+    (2, 2, 'Beyoncé', 'Halo', 'I Am... Sasha Fierce'),
+    (3, 3, 'The Beatles', 'Hello, Goodbye', 'Magical Mystery Tour'),
+    (4, 4, 'Hello Saferide', 'Anna', 'More Modern Short Stories')
+]
+
+
+def add_library(engine, tracks, edited=None):
+    """Adds tracks, each on its own record, to a stand-in database."""
+    music = lass.music.models
+    row = lass.common.benchmark.row
+    added = datetime.datetime(2013, 10, 7, tzinfo=pytz.utc)
+
+    lass.common.benchmark.insert(engine, music.Record, [
+        row(
+            music.Record,
+            id=record_id,
+            status_id='o',
+            medium_id='c',
+            format_id='a',
+            memberid_add=1,
+            title=record,
+            artist=artist,
+            recordlabel='Label',
+            dateadded=added,
+            datetime_lastedit=edited or added,
+            shelfnumber=1,
+            shelfletter='A'
+        )
+        for _, record_id, artist, _, record in tracks
+    ])
+    lass.common.benchmark.insert(engine, music.Track, [
+        row(
+            music.Track,
+            id=track_id,
+            clean='y',
+            recordid=record_id,
+            artist=artist,
+            digitised=True,
+            lastfm_verified=False,
+            genre='p',
+            intro=datetime.time(0, 0, 10),
+            length=datetime.time(0, 3),
+            number=1,
+            title=title
+        )
+        for track_id, record_id, artist, title, _ in tracks
+    ])
+
+
+def test_search_tokens():
+    """Tests search word normalisation."""
+    search = lass.music.search
+    assert search.tokens('Jóga, Björk!') == ['joga', 'bjork']
+    assert search.tokens('  I Am... Sasha_Fierce ') == [
+        'i', 'am', 'sasha', 'fierce'
+    ]
+    assert search.tokens('ÆON Straße') == ['æon', 'strasse']
+    assert search.tokens('') == []
+    assert search.trigrams('ab') == {'  a', ' ab', 'ab '}
+
+
+def test_search():
+    """Tests ranked, accent-folded, prefix and fuzzy library searches,
+    and incremental index updates.
+    """
+    search = lass.music.search
+    now = datetime.datetime(2013, 11, 1, tzinfo=pytz.utc)
+
+    def ids(text):
+        return [track.id for track in search.search(text)]
+
+    with lass.common.benchmark.standin() as engine:
+        add_library(engine, LIBRARY)
+        assert search.update(batch_size=3, now=now) == 4
+
+        assert search.search('  ...  ') is None
+        assert ids('bjork') == [1]
+        assert ids('BEYONCÉ halo') == [2]
+        # Prefixes match, ranked alphabetically by title when tied.
+        assert ids('hel') == [4, 3]
+        # Matching more words ranks higher.
+        assert ids('hello goodbye') == [3, 4]
+        # Record titles count for less than titles and artists.
+        assert ids('magical hello') == [3, 4]
+        # Misspellings match similar words.
+        assert ids('beatels') == [3]
+        assert ids('zzzzqqq') == []
+
+        # Nothing has changed, so nothing is reindexed.
+        assert search.update(now=now) == 0
+
+        # New tracks are indexed, as are tracks on edited records.
+        add_library(
+            engine,
+            [(5, 5, 'Queen', 'Bohemian Rhapsody', 'A Night at the Opera')],
+            edited=now
+        )
+        Record = lass.music.models.Record
+        engine.execute(
+            Record.__table__.update().where(
+                Record.__table__.c.recordid == 1
+            ).values(
+                title='Telegram',
+                datetime_lastedit=now + datetime.timedelta(hours=1)
+            )
+        )
+        assert search.update(now=now + datetime.timedelta(hours=2)) == 2
+        assert ids('bohemian') == [5]
+        assert ids('telegram') == [1]
+        assert ids('homogenic') == []
+
+        assert search.rebuild(now=now) == 5
+        assert ids('bjork') == [1]
+
+
+#
+# lass.music.views
+#
+
+
+def test_most_played_lists_bad_limit():
+    """Tests that 'lass.music.views.most_played_lists' rejects limits that
+    are not positive integers as not found, before querying anything.
+    """
+    config = lass.schedule.benchmarks.CONFIG
+    with lass.common.benchmark.site_config(config):
+        for limit in ('-1', '0', 'many'):
+            request = pyramid.testing.DummyRequest(params={'limit': limit})
+            try:
+                lass.music.views.most_played_lists(request)
+            except pyramid.exceptions.NotFound:
+                pass
+            else:
+                assert False, 'No NotFound for limit {}.'.format(limit)
@@ -26,9 +26,21 @@ ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
 SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
+import datetime
+
 import pyramid
 
+import lass.common.time
+import lass.common.view_helpers
+import lass.music.analytics
 import lass.music.models
+import lass.music.search
+import lass.schedule.models
+import lass.schedule.terms
+
+
+# The longest most-played list that can be asked for.
+MAX_LIMIT = 100
 
 
 @pyramid.view.view_config(
@@ -49,8 +61,170 @@ def recommended(request):
     return generic_chart('music')
 
 
+@pyramid.view.view_config(
+    route_name='music-search',
+    renderer='music/search.jinja2'
+)
+def search(request):
+    """The music library search page view.
+
+    This takes the search string in the 'term' parameter, and the results
+    page in 'page' (see 'lass.common.view_helpers.media_list').
+    """
+    term = request.params.get('term', '')
+    source = lass.music.search.search(term)
+    results = (
+        lass.common.view_helpers.media_list(request, source)
+        if source is not None
+        else {}
+    )
+    return dict({'term': term}, **results)
+
+
 def generic_chart(chart_name):
     """View helper for making a view that returns a URY music chart."""
     return {
         chart_name: lass.music.models.Chart.latest(chart_name)
     }
+
+
+@pyramid.view.view_config(
+    route_name='music-most-played',
+    renderer='music/most_played.jinja2'
+)
+def most_played(request):
+    """The most played tracks and artists page view."""
+    return most_played_lists(request)
+
+
+@pyramid.view.view_config(
+    route_name='music-most-played-json',
+    renderer='json'
+)
+def most_played_json(request):
+    """The most played tracks and artists, as JSON."""
+    lists = most_played_lists(request)
+    if not isinstance(lists, dict):
+        return lists
+
+    return dict(
+        lists,
+        first_week=iso_or_none(lists['first_week']),
+        last_week=iso_or_none(lists['last_week']),
+        tracks=[played._asdict() for played in lists['tracks']],
+        artists=[played._asdict() for played in lists['artists']]
+    )
+
+
+def most_played_lists(request):
+    """View helper for working out the most-played lists a request asks for.
+
+    The request may narrow the plays counted with one of the parameters
+    'week' (a date in the week, as YYYY-MM-DD), 'term' (a term ID, or
+    'current') or 'show' (a show ID); if none is given, the current week
+    is used.  The parameter 'limit' sets the length of the lists.
+
+    Returns:
+        A dict of the 'scope' of the lists, the Mondays of the 'first_week'
+        and 'last_week' covered (None if unbounded), and the 'tracks' and
+        'artists' lists themselves; or a 304 response if the client already
+        has them.
+    """
+    time_context = lass.common.time.context_from_config()
+    params = request.params
+
+    try:
+        limit = min(
+            int(params.get('limit', lass.music.analytics.DEFAULT_LIMIT)),
+            MAX_LIMIT
+        )
+        if limit < 1:
+            raise ValueError('limit must be at least 1')
+        if 'show' in params:
+            show_id = int(params['show'])
+            scope = {'show': show_id}
+            first_week = last_week = None
+        elif 'term' in params:
+            term = find_term(params['term'])
+            scope = {'term': {'id': term.id, 'name': term.name}}
+            first_week, last_week = lass.music.analytics.term_weeks(
+                term,
+                time_context
+            )
+            show_id = None
+        else:
+            if 'week' in params:
+                date = datetime.datetime.strptime(
+                    params['week'],
+                    '%Y-%m-%d'
+                ).date()
+            else:
+                date = time_context.schedule_date_of(time_context.local_now())
+            first_week = last_week = (
+                date - datetime.timedelta(days=date.weekday())
+            )
+            scope = {'week': first_week.isoformat()}
+            show_id = None
+    except (ValueError, LookupError) as error:
+        raise pyramid.exceptions.NotFound(str(error))
+
+    not_modified = lass.common.view_helpers.conditional(
+        request,
+        '{}-{}-{}-{}-{}'.format(
+            lass.music.analytics.generation(),
+            first_week,
+            last_week,
+            show_id,
+            limit
+        )
+    )
+    if not_modified:
+        return not_modified
+
+    return {
+        'scope': scope,
+        'first_week': first_week,
+        'last_week': last_week,
+        'tracks': lass.music.analytics.most_played(
+            'track',
+            first_week,
+            last_week,
+            show_id,
+            limit
+        ),
+        'artists': lass.music.analytics.most_played(
+            'artist',
+            first_week,
+            last_week,
+            show_id,
+            limit
+        )
+    }
+
+
+def find_term(term_name):
+    """Finds a term from its ID, or 'current' for the current term.
+
+    Raises:
+        LookupError: if there is no such term.
+    """
+    if term_name == 'current':
+        term = lass.schedule.models.Term.of(None)
+    else:
+        term_id = int(term_name)
+        term = next(
+            (
+                term
+                for term in lass.schedule.terms.table().terms
+                if term.id == term_id
+            ),
+            None
+        )
+    if term is None:
+        raise LookupError('No such term: {}'.format(term_name))
+    return term
+
+
+def iso_or_none(date):
+    """Formats a date in ISO format, passing None through."""
+    return None if date is None else date.isoformat()
@@ -0,0 +1,368 @@
+"""A stale-while-revalidate cache of member profiles.
+
+Member profiles come from the URY API ('User/{id}'), change rarely, and
+are mostly reached through the credit links on show and schedule pages.
+This module keeps them in memory:
+
+- a profile younger than PROFILE_MAX_AGE is served as is;
+- an older profile, up to PROFILE_STALE_AGE, is still served at once,
+  but is refreshed in the background for the next request;
+- anything older, or missing, is fetched while the request waits, but if
+  the API cannot be reached an old profile is served rather than an
+  error.
+
+Unknown members are remembered too, so that broken links do not each
+cost a round trip to the API.
+
+A warmer thread also prefetches the profile of everyone credited on a
+show scheduled this term, so that pages linked from the schedule are
+served from memory from the first click.  It is configured with these
+settings:
+
+    lass.profiles.warm_interval: Seconds between warming runs; if 0, the
+        cache is not warmed.  (Default: 900.)
+
+---
+
+Copyright (c) 2013, University Radio York.
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimer in the
+  documentation and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import collections
+import datetime
+import logging
+import threading
+import time
+
+import pytz
+import transaction
+
+import lass.common.api
+import lass.common.mixins
+import lass.common.singleflight
+import lass.model_base
+
+
+log = logging.getLogger(__name__)
+
+
+# The age, in seconds, up to which a profile is served without being
+# refreshed.
+PROFILE_MAX_AGE = 300
+
+# The age, in seconds, up to which a profile is served while it is being
+# refreshed in the background.
+PROFILE_STALE_AGE = 24 * 60 * 60
+
+# The maximum number of profiles kept in memory.
+MAX_PROFILES = 5000
+
+# The default number of seconds between warming runs.
+DEFAULT_WARM_INTERVAL = 900
+
+SETTINGS_PREFIX = 'lass.profiles.'
+
+
+# A cached profile; 'profile' is None if the member does not exist.
+Entry = collections.namedtuple('Entry', 'fetched_at profile')
+
+
+class ProfileCache(object):
+    """A bounded, stale-while-revalidate cache of member profiles."""
+    def __init__(
+            self,
+            max_age=PROFILE_MAX_AGE,
+            stale_age=PROFILE_STALE_AGE,
+            max_entries=MAX_PROFILES
+    ):
+        self.max_age = max_age
+        self.stale_age = stale_age
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.fetches = lass.common.singleflight.Group()
+        self.refreshing = set()
+
+    def get(self, person_id, now=None):
+        """Retrieves the profile of a member.
+
+        Args:
+            person_id: The ID of the member.
+            now: The current monotonic time; if None, it will be looked up.
+                (Default: None.)
+
+        Returns:
+            The member's profile, as returned by the API.  This is shared
+            with other callers, so MUST NOT be modified.
+
+        Raises:
+            lass.common.api.NotFound, if there is no such member;
+            lass.common.api.Error, if the profile is neither cached nor
+            fetchable.
+        """
+        now = time.monotonic() if now is None else now
+        entry = self.entry(person_id)
+        age = None if entry is None else now - entry.fetched_at
+
+        if age is None or age >= self.stale_age:
+            try:
+                entry = self.refresh(person_id)
+            except lass.common.api.Error:
+                if entry is None:
+                    raise
+                log.warning(
+                    'Serving %ds old profile %s, as the API is down.',
+                    age,
+                    person_id
+                )
+        elif age >= self.max_age:
+            self.refresh_in_background(person_id)
+
+        if entry.profile is None:
+            raise lass.common.api.NotFound(
+                'No member with ID {}.'.format(person_id)
+            )
+        return entry.profile
+
+    def entry(self, person_id):
+        """Returns the cached Entry for a member, or None."""
+        with self.lock:
+            entry = self.entries.get(person_id)
+            if entry is not None:
+                self.entries.move_to_end(person_id)
+            return entry
+
+    def put(self, person_id, profile, now=None):
+        """Caches a member's profile (None if the member does not exist).
+
+        Returns:
+            The new Entry.
+        """
+        entry = Entry(time.monotonic() if now is None else now, profile)
+        with self.lock:
+            self.entries[person_id] = entry
+            self.entries.move_to_end(person_id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return entry
+
+    def refresh(self, person_id):
+        """Fetches a member's profile into the cache.
+
+        Concurrent refreshes of the same profile share one API request.
+
+        Returns:
+            The new Entry.
+
+        Raises:
+            lass.common.api.Error, if the API could not be reached.
+        """
+        entry, _ = self.fetches.do(person_id, self.fetch, person_id)
+        return entry
+
+    def fetch(self, person_id):
+        """Fetches a member's profile into the cache, bypassing the API's
+        own response cache.
+        """
+        try:
+            profile = lass.common.api.get(
+                resource(person_id),
+                max_age=0
+            )
+        except lass.common.api.NotFound:
+            profile = None
+        return self.put(person_id, profile)
+
+    def refresh_in_background(self, person_id):
+        """Starts refreshing a member's profile, unless it is already being
+        refreshed.
+        """
+        with self.lock:
+            if person_id in self.refreshing:
+                return
+            self.refreshing.add(person_id)
+
+        def refresh():
+            try:
+                self.refresh(person_id)
+            except Exception:
+                log.exception('Could not refresh profile %s.', person_id)
+            finally:
+                with self.lock:
+                    self.refreshing.discard(person_id)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def warm(self, person_ids):
+        """Fetches the profiles of many members at once.
+
+        Profiles that are cached and not yet due a refresh are skipped.
+
+        Args:
+            person_ids: An iterable of member IDs.
+
+        Returns:
+            The number of profiles fetched.
+        """
+        now = time.monotonic()
+        due = []
+        for person_id in person_ids:
+            entry = self.entry(person_id)
+            if entry is None or now - entry.fetched_at >= self.max_age:
+                due.append(person_id)
+
+        results = lass.common.api.get_many(
+            [resource(person_id) for person_id in due],
+            max_age=0
+        )
+
+        fetched = 0
+        for person_id, result in zip(due, results):
+            if isinstance(result, lass.common.api.NotFound):
+                self.put(person_id, None)
+            elif isinstance(result, Exception):
+                log.warning(
+                    'Could not warm profile %s: %s',
+                    person_id,
+                    result
+                )
+            else:
+                self.put(person_id, result)
+                fetched += 1
+        return fetched
+
+
+PROFILES = ProfileCache()
+
+
+def get(person_id):
+    """Retrieves the profile of a member from the shared cache.
+
+    See 'ProfileCache.get'.
+    """
+    return PROFILES.get(person_id)
+
+
+def resource(person_id):
+    """Returns the API resource of a member's profile."""
+    return 'User/{}'.format(person_id)
+
+
+#
+# Warming
+#
+
+
+def credited_people(date=None):
+    """Finds everyone credited on a show scheduled this term.
+
+    Args:
+        date: The aware datetime whose term is used, and on which the
+            credits must be active; if None, the current time is used.
+            (Default: None.)
+
+    Returns:
+        A sorted list of member IDs.
+    """
+    # Imported here, as the schedule models import the people models.
+    import lass.schedule.models as schedule
+
+    date = datetime.datetime.now(pytz.utc) if date is None else date
+    term = schedule.Term.of(date)
+    if term is None:
+        return []
+
+    ShowCredit = schedule.ShowCredit
+    scheduled = lass.model_base.DBSession.query(
+        schedule.Season.show_id
+    ).join(
+        schedule.Timeslot,
+        schedule.Timeslot.season_id == schedule.Season.id
+    ).filter(
+        (schedule.Timeslot.start >= term.start) &
+        (schedule.Timeslot.start < term.finish)
+    )
+
+    rows = lass.model_base.DBSession.query(
+        ShowCredit.person_id
+    ).filter(
+        ShowCredit.subject_id.in_(scheduled.subquery()) &
+        (ShowCredit.person_id != None) &
+        lass.common.mixins.Transient.active_on(date, ShowCredit)
+    ).distinct().all()
+    return sorted(person_id for person_id, in rows)
+
+
+def warm(cache=PROFILES, date=None):
+    """Prefetches the profile of everyone credited on a show scheduled
+    this term.
+
+    Returns:
+        The number of profiles fetched.
+    """
+    try:
+        with transaction.manager:
+            person_ids = credited_people(date)
+    finally:
+        lass.model_base.DBSession.remove()
+    return cache.warm(person_ids)
+
+
+def start_warmer(settings, cache=PROFILES):
+    """Starts a thread warming the profile cache periodically.
+
+    Args:
+        settings: The Pyramid application settings.
+        cache: The cache to warm.  (Default: PROFILES.)
+
+    Returns:
+        The thread, or None if warming is turned off.
+    """
+    interval = float(
+        settings.get(
+            SETTINGS_PREFIX + 'warm_interval',
+            DEFAULT_WARM_INTERVAL
+        )
+    )
+    if interval <= 0:
+        return None
+
+    def run():
+        while True:
+            started = time.monotonic()
+            try:
+                fetched = warm(cache)
+                log.info('Warmed %d member profiles.', fetched)
+            except Exception:
+                log.exception('Could not warm member profiles.')
+            time.sleep(max(0, interval - (time.monotonic() - started)))
+
+    thread = threading.Thread(
+        target=run,
+        name='profile-warmer',
+        daemon=True
+    )
+    thread.start()
+    return thread
@@ -0,0 +1,137 @@
+"""Nose tests for the People submodule.
+
+---
+
+Copyright (c) 2013, University Radio York.
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimer in the
+  documentation and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import unittest.mock
+
+import lass.common.api
+import lass.common.benchmark
+import lass.model_base
+import lass.people.profiles
+import lass.schedule.benchmarks
+import lass.schedule.models
+
+
+#
+# lass.people.profiles
+#
+
+
+def test_profile_cache():
+    """Tests the stale-while-revalidate behaviour of the profile cache."""
+    cache = lass.people.profiles.ProfileCache(max_age=10, stale_age=100)
+    profiles = {1: {'fname': 'Ann'}}
+    calls = []
+
+    def get(resource, max_age=None):
+        calls.append(resource)
+        if api_down:
+            raise lass.common.api.Error
+        person_id = int(resource.partition('/')[2])
+        if person_id not in profiles:
+            raise lass.common.api.NotFound
+        return profiles[person_id]
+
+    api_down = False
+    with unittest.mock.patch('lass.common.api.get', get), \
+            unittest.mock.patch.object(cache, 'refresh_in_background') as bg:
+        assert cache.get(1, now=0) == {'fname': 'Ann'}
+        cache.put(1, {'fname': 'Ann'}, now=0)
+        assert cache.get(1, now=5) == {'fname': 'Ann'}
+        assert calls == ['User/1'] and not bg.called
+
+        # Stale profiles are served while they are refreshed.
+        assert cache.get(1, now=50) == {'fname': 'Ann'}
+        bg.assert_called_once_with(1)
+        assert calls == ['User/1']
+
+        # Expired profiles are fetched, unless the API is down.
+        api_down = True
+        assert cache.get(1, now=500) == {'fname': 'Ann'}
+        assert calls == ['User/1'] * 2
+        try:
+            cache.get(2)
+        except lass.common.api.Error:
+            pass
+        else:
+            assert False, 'Missing profile did not raise Error.'
+
+        # Unknown members are remembered.
+        api_down = False
+        for _ in range(2):
+            try:
+                cache.get(2)
+            except lass.common.api.NotFound:
+                pass
+            else:
+                assert False, 'Unknown member did not raise NotFound.'
+        assert calls == ['User/1'] * 2 + ['User/2'] * 2
+
+    # Warming only fetches what is due.
+    cache.put(1, {'fname': 'Ann'})
+    with unittest.mock.patch(
+        'lass.common.api.get_many',
+        return_value=[{'fname': 'Bob'}, lass.common.api.NotFound()]
+    ) as get_many:
+        assert cache.warm([1, 3, 4]) == 1
+    get_many.assert_called_once_with(['User/3', 'User/4'], max_age=0)
+    assert cache.get(3) == {'fname': 'Bob'}
+    assert cache.entry(4).profile is None
+
+
+def test_credited_people():
+    """Tests finding the people credited on this term's shows."""
+    benchmarks = lass.schedule.benchmarks
+    models = lass.schedule.models
+
+    with lass.common.benchmark.standin() as engine:
+        with lass.common.benchmark.site_config(benchmarks.CONFIG):
+            generator = benchmarks.Generator(engine, shows=10)
+            generator.populate()
+            time_context = generator.time_context
+            date = time_context.start_on(
+                benchmarks.dst_week(generator.year, time_context)
+            )
+
+            term = models.Term.of(date)
+            session = lass.model_base.DBSession
+            show_ids = {
+                timeslot.season.show_id
+                for timeslot in session.query(models.Timeslot)
+                if term.start <= timeslot.start < term.finish
+            }
+            expected = sorted({
+                credit.person_id
+                for credit in session.query(models.ShowCredit)
+                if credit.subject_id in show_ids
+            })
+            lass.common.benchmark.reset_session()
+
+            assert expected
+            assert lass.people.profiles.credited_people(date) == expected
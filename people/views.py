@@ -31,6 +31,7 @@ import pyramid
 
 import lass.common.api
 import lass.common.view_helpers
+import lass.people.profiles
 
 
 @pyramid.view.view_config(
@@ -39,11 +40,10 @@ import lass.common.view_helpers
 )
 def person_detail(request):
     """Provides details about a person."""
-    person_id = request.matchdict['id']
-
     try:
-        person = lass.common.api.get('User/{}'.format(person_id))
-    except lass.common.api.NotFound:
+        person_id = int(request.matchdict['id'])
+        person = lass.people.profiles.get(person_id)
+    except (ValueError, lass.common.api.NotFound):
         raise pyramid.httpexceptions.HTTPNotFound(
             'No member with this ID exists.'
         )
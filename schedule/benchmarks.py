@@ -0,0 +1,707 @@
+"""Benchmarks for the schedule pipeline.
+
+This harness fills a stand-in database (see 'lass.common.benchmark') with
+a synthetic academic year of terms, shows, seasons and timeslots, along
+with metadata histories and credits, and then times each stage of the
+schedule pipeline over ranges ranging from one week to the whole year:
+
+    from_to: Selecting the timeslots ('lass.schedule.lists.from_to');
+    annotate: Annotating them ('Timeslot.annotate');
+    blocks: Assigning their schedule blocks ('lass.schedule.blocks');
+    fill: Filling the gaps between them ('lass.schedule.filler.fill');
+    tabulate: Turning each week into a table ('lass.schedule.table').
+
+The synthetic schedule deliberately includes the weeks in which the
+clocks change, shows that run over midnight and shows that run over
+several days, as these are the cases most likely to hit slow paths.
+
+Run 'python -m lass.schedule.benchmarks --help' for usage; results can
+be recorded to a file and compared against earlier runs to catch
+performance regressions.
+
+---
+
+Copyright (c) 2013, University Radio York.
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimer in the
+  documentation and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import argparse
+import datetime
+import itertools
+import random
+import sys
+
+import lass.common.benchmark
+import lass.common.time
+import lass.credits.models
+import lass.metadata.models
+import lass.people.models
+import lass.schedule.blocks
+import lass.schedule.filler
+import lass.schedule.lists
+import lass.schedule.models
+import lass.schedule.table
+import lass.schedule.terms
+
+
+# The number of weeks covered by each benchmark scale.
+SCALES = (
+    ('week', 1),
+    ('month', 4),
+    ('term', 10),
+    ('year', 52)
+)
+
+
+STAGES = ('from_to', 'annotate', 'blocks', 'fill', 'tabulate')
+
+
+# Synthetic site configuration the pipeline reads while benchmarking.
+CONFIG = {
+    'sitewide/time': {
+        'timezone': 'Europe/London',
+        'second_year_terms': ['spring', 'summer'],
+        'schedule_start_time': 7
+    },
+    'sitewide/blocks': {
+        'blocks': {
+            'Daytime': {'type': 'regular'},
+            'Evening': {'type': 'evening'},
+            'Specialist': {'type': 'specialist'},
+            'News': {'type': 'news'}
+        },
+        'range_blocks': [
+            [3, 0, None],
+            [7, 0, 'Daytime'],
+            [19, 0, 'Evening'],
+            [23, 0, 'Specialist']
+        ],
+        'name_blocks': [
+            ['*news*', 'News'],
+            ['*special*', None]
+        ]
+    },
+    'sitewide/filler': {
+        'metadata': {
+            'text': {
+                'title': ['URY Jukebox'],
+                'description': ['Non-stop music while nobody is on air.']
+            },
+            'image': {
+                'thumbnail_image': ['/static/img/jukebox.png']
+            }
+        },
+        'block': {'name': 'Jukebox', 'type': 'jukebox'}
+    }
+}
+
+
+TEXT_KEYS = ('title', 'description', 'tag')
+IMAGE_KEYS = ('image', 'thumbnail_image', 'player_image')
+
+
+def term_dates(year):
+    """Works out the start dates of the three terms of an academic year.
+
+    Each term lasts ten weeks and starts on a Monday: autumn in early
+    October, spring in early January, and summer in late April.
+
+    Returns:
+        A list of (name, start date) tuples.
+    """
+    def monday_on_or_after(date):
+        return date + datetime.timedelta(days=(7 - date.weekday()) % 7)
+
+    return [
+        ('autumn', monday_on_or_after(datetime.date(year, 10, 1))),
+        ('spring', monday_on_or_after(datetime.date(year + 1, 1, 6))),
+        ('summer', monday_on_or_after(datetime.date(year + 1, 4, 20)))
+    ]
+
+
+def dst_week(year, time_context):
+    """Finds the Monday of the week in which the clocks go back in the
+    autumn of the given year.
+    """
+    date = datetime.date(year, 10, 31)
+    while True:
+        before = time_context.localise(time_context.start_on(date))
+        after = time_context.localise(
+            time_context.start_on(date + datetime.timedelta(days=1))
+        )
+        if before.utcoffset() != after.utcoffset():
+            return date - datetime.timedelta(days=date.weekday())
+        date -= datetime.timedelta(days=1)
+
+
+def weekly_template(rng, shows):
+    """Makes up a week of regular programming.
+
+    Returns:
+        A list of (day, hour offset from the schedule day start, length in
+        hours, show index) tuples, in chronological order.  Some hours are
+        left empty for the filler, and some shows run past midnight.
+    """
+    template = []
+    for day in range(7):
+        hour = 0
+        while hour < 24:
+            length = rng.choice((1, 1, 2, 2, 3))
+            if rng.random() < 0.75:
+                template.append((day, hour, length, rng.randrange(shows)))
+            hour += length
+    return template
+
+
+class Generator(object):
+    """Generates a synthetic academic year of schedule data."""
+    def __init__(self, engine, year=2013, shows=60, history=3, seed=0):
+        """Initialises the Generator.
+
+        Args:
+            engine: The stand-in engine to populate.
+            year: The calendar year in which the academic year starts.
+                (Default: 2013.)
+            shows: The number of shows in the schedule.  (Default: 60.)
+            history: The number of historical versions of each piece of
+                show metadata.  (Default: 3.)
+            seed: The seed for the random number generator, so that runs
+                are reproducible.  (Default: 0.)
+        """
+        self.engine = engine
+        self.year = year
+        self.shows = shows
+        self.history = history
+        self.rng = random.Random(seed)
+        self.time_context = lass.common.time.TimeContext(
+            **CONFIG['sitewide/time']
+        )
+        self.ids = itertools.count(1)
+        self.counts = {}
+
+    def insert(self, model, rows):
+        """Inserts rows, keeping count of how many of each model exist."""
+        lass.common.benchmark.insert(self.engine, model, rows)
+        name = model.__name__
+        self.counts[name] = self.counts.get(name, 0) + len(rows)
+
+    def row(self, model, **values):
+        """Makes a row for 'model' with a fresh ID."""
+        return lass.common.benchmark.row(model, id=next(self.ids), **values)
+
+    def populate(self):
+        """Populates the stand-in database.
+
+        Returns:
+            A dict mapping model names to the number of rows generated.
+        """
+        self.year_start = self.time_context.start_on(
+            term_dates(self.year)[0][1]
+        )
+        self.people()
+        self.reference()
+        self.terms()
+        self.shows_and_metadata()
+        self.seasons_and_timeslots()
+        return self.counts
+
+    def people(self):
+        self.members = list(range(1, 51))
+        self.insert(
+            lass.people.models.Person,
+            [
+                lass.common.benchmark.row(
+                    lass.people.models.Person,
+                    id=member,
+                    first_name='Member',
+                    last_name=str(member),
+                    date_joined=self.year_start.replace(tzinfo=None)
+                )
+                for member in self.members
+            ]
+        )
+
+    def owned(self, model, approvable=True, **values):
+        """Makes a row for an ownable (and, usually, approvable) model."""
+        values['owner_id'] = self.rng.choice(self.members)
+        if approvable:
+            values['approver_id'] = self.rng.choice(self.members)
+        return self.row(model, **values)
+
+    def reference(self):
+        """Generates show types, metadata keys and credit types."""
+        self.public_type, self.private_type = next(self.ids), next(self.ids)
+        self.insert(
+            lass.schedule.models.ShowType,
+            [
+                lass.common.benchmark.row(
+                    lass.schedule.models.ShowType,
+                    id=type_id,
+                    name=name,
+                    description=name,
+                    is_public=public,
+                    is_collapsible=False,
+                    can_be_messaged=public
+                )
+                for type_id, name, public in (
+                    (self.public_type, 'show', True),
+                    (self.private_type, 'demo', False)
+                )
+            ]
+        )
+
+        self.keys = {}
+        key_rows = []
+        for name in TEXT_KEYS + IMAGE_KEYS:
+            key_row = self.row(
+                lass.metadata.models.Key,
+                name=name,
+                description=name,
+                allow_multiple=(name == 'tag'),
+                searchable=(name in TEXT_KEYS),
+                plural=name + 's'
+            )
+            self.keys[name] = key_row['metadata_key_id']
+            key_rows.append(key_row)
+        self.insert(lass.metadata.models.Key, key_rows)
+
+        self.credit_types = [next(self.ids), next(self.ids)]
+        self.insert(
+            lass.credits.models.CreditType,
+            [
+                lass.common.benchmark.row(
+                    lass.credits.models.CreditType,
+                    id=type_id,
+                    name=name,
+                    plural=name + 's',
+                    is_in_byline=byline
+                )
+                for type_id, name, byline in zip(
+                    self.credit_types,
+                    ('presenter', 'producer'),
+                    (True, False)
+                )
+            ]
+        )
+
+    def terms(self):
+        self.term_list = []
+        rows = []
+        for name, start_date in term_dates(self.year):
+            start = self.time_context.start_on(start_date)
+            finish = self.time_context.start_on(
+                start_date + datetime.timedelta(weeks=10)
+            )
+            term_id = next(self.ids)
+            self.term_list.append((term_id, start_date, start, finish))
+            rows.append(
+                lass.common.benchmark.row(
+                    lass.schedule.models.Term,
+                    id=term_id,
+                    start=start,
+                    finish=finish,
+                    name=name
+                )
+            )
+        self.insert(lass.schedule.models.Term, rows)
+        # Don't let a term table from another database answer for this one.
+        lass.schedule.terms.invalidate()
+
+    def history_rows(self, model, subject_id, key, values):
+        """Makes a history of metadata rows for one key of one subject.
+
+        Each value supersedes the one before it, with only the last still
+        in effect.
+        """
+        rows = []
+        starts = sorted(
+            self.year_start - datetime.timedelta(days=self.rng.randrange(400))
+            for _ in values
+        )
+        for i, (value, start) in enumerate(zip(values, starts)):
+            rows.append(
+                self.owned(
+                    model,
+                    subject_id=subject_id,
+                    key_id=self.keys[key],
+                    value=value,
+                    effective_from=start,
+                    effective_to=(
+                        starts[i + 1] if i + 1 < len(starts) else None
+                    )
+                )
+            )
+        return rows
+
+    def shows_and_metadata(self):
+        models = lass.schedule.models
+        self.show_ids = []
+        shows, texts, images, credits = [], [], [], []
+
+        for i in range(self.shows):
+            # Every so often, make a show the name blocks will pick up on.
+            name = 'Show {}{}'.format(
+                i,
+                ' News' if i % 10 == 0 else (' Special' if i % 15 == 0 else '')
+            )
+            show = self.owned(
+                models.Show,
+                type_id=(
+                    self.private_type if i % 20 == 19 else self.public_type
+                ),
+                submitted_at=self.year_start,
+                approvable=False
+            )
+            show_id = show['show_id']
+            self.show_ids.append(show_id)
+            shows.append(show)
+
+            for key in ('title', 'description'):
+                texts.extend(
+                    self.history_rows(
+                        models.ShowText,
+                        show_id,
+                        key,
+                        [
+                            '{} ({} version {})'.format(name, key, v)
+                            if v + 1 < self.history else name
+                            for v in range(self.history)
+                        ]
+                    )
+                )
+            for tag in range(self.rng.randrange(4)):
+                texts.extend(
+                    self.history_rows(
+                        models.ShowText,
+                        show_id,
+                        'tag',
+                        ['tag{}'.format(tag)]
+                    )
+                )
+            for key in IMAGE_KEYS:
+                images.extend(
+                    self.history_rows(
+                        models.ShowImage,
+                        show_id,
+                        key,
+                        [
+                            '/media/{}/{}_{}.png'.format(show_id, key, v)
+                            for v in range(self.history)
+                        ]
+                    )
+                )
+            for _ in range(self.rng.randint(1, 3)):
+                credits.append(
+                    self.owned(
+                        models.ShowCredit,
+                        subject_id=show_id,
+                        credit_type_id=self.rng.choice(self.credit_types),
+                        person_id=self.rng.choice(self.members),
+                        effective_from=self.year_start - datetime.timedelta(
+                            days=self.rng.randrange(100)
+                        ),
+                        effective_to=None
+                    )
+                )
+
+        self.insert(models.Show, shows)
+        self.insert(models.ShowText, texts)
+        self.insert(models.ShowImage, images)
+        self.insert(models.ShowCredit, credits)
+
+    def seasons_and_timeslots(self):
+        models = lass.schedule.models
+        seasons, season_texts, timeslots, timeslot_texts = [], [], [], []
+
+        for term_id, start_date, _, _ in self.term_list:
+            season_ids = {}
+            for show_id in self.show_ids:
+                season = self.owned(
+                    models.Season,
+                    show_id=show_id,
+                    term_id=term_id,
+                    submitted_at=self.year_start,
+                    approvable=False
+                )
+                season_ids[show_id] = season['show_season_id']
+                seasons.append(season)
+                if self.rng.random() < 0.2:
+                    season_texts.extend(
+                        self.history_rows(
+                            models.SeasonText,
+                            season['show_season_id'],
+                            'title',
+                            ['Season title for show {}'.format(show_id)]
+                        )
+                    )
+
+            for start, duration, show in self.term_slots(start_date):
+                timeslot = self.owned(
+                    models.Timeslot,
+                    season_id=season_ids[self.show_ids[show]],
+                    start=start,
+                    duration=duration
+                )
+                timeslots.append(timeslot)
+                if self.rng.random() < 0.05:
+                    timeslot_texts.extend(
+                        self.history_rows(
+                            models.TimeslotText,
+                            timeslot['show_season_timeslot_id'],
+                            'title',
+                            ['Special episode']
+                        )
+                    )
+
+        self.insert(models.Season, seasons)
+        self.insert(models.SeasonText, season_texts)
+        self.insert(models.Timeslot, timeslots)
+        self.insert(models.TimeslotText, timeslot_texts)
+
+    def term_slots(self, start_date):
+        """Generates the timeslots for one ten-week term.
+
+        Each week repeats the same template, except that in the third week
+        one show runs over the whole weekend (36 hours from Friday
+        evening), displacing whatever would otherwise have been on.
+
+        Returns:
+            A chronological list of non-overlapping (aware start,
+            duration, show index) tuples.
+        """
+        tc = self.time_context
+        template = weekly_template(self.rng, self.shows)
+
+        marathon_start = tc.shift_local(
+            tc.start_on(start_date + datetime.timedelta(weeks=2, days=4)),
+            datetime.timedelta(hours=11)
+        )
+        marathon = (
+            marathon_start,
+            datetime.timedelta(hours=36),
+            self.rng.randrange(self.shows)
+        )
+        marathon_finish = marathon_start + marathon[1]
+
+        slots = [marathon]
+        cursor = None
+        for week in range(10):
+            for day, hour, length, show in template:
+                date = start_date + datetime.timedelta(weeks=week, days=day)
+                # Shifting in local time keeps slots at the same wall-clock
+                # time either side of the clocks changing.
+                start = tc.shift_local(
+                    tc.start_on(date),
+                    datetime.timedelta(hours=hour)
+                )
+                duration = datetime.timedelta(hours=length)
+                finish = start + duration
+
+                # Clock changes can squeeze slots into each other, and the
+                # marathon pushes everything else out of the way.
+                if cursor is not None and start < cursor:
+                    continue
+                if start < marathon_finish and marathon_start < finish:
+                    continue
+
+                slots.append((start, duration, show))
+                cursor = finish
+
+        return sorted(slots, key=lambda slot: slot[0])
+
+
+def week_starts(start, weeks, time_context):
+    """Returns the aware starts of each week in a range."""
+    return [
+        time_context.shift_local(start, datetime.timedelta(weeks=week))
+        for week in range(weeks + 1)
+    ]
+
+
+def run_pipeline(start, weeks, time_context, timings):
+    """Runs the schedule pipeline once over a range of weeks, timing it.
+
+    Args:
+        start: The aware datetime at which the range starts.
+        weeks: The number of weeks in the range.
+        time_context: The TimeContext the pipeline is working in.
+        timings: The 'lass.common.benchmark.Timings' to record times in.
+
+    Returns:
+        A tuple of the number of timeslots selected and the number of
+        slots after filling.
+    """
+    Timeslot = lass.schedule.models.Timeslot
+    starts = week_starts(start, weeks, time_context)
+    finish = starts[-1]
+
+    with timings.time('from_to'):
+        slots = lass.schedule.lists.from_to(Timeslot.public(), start, finish)
+
+    with timings.time('annotate'):
+        Timeslot.annotate(slots)
+
+    with timings.time('blocks'):
+        lass.schedule.blocks.annotate(slots)
+
+    with timings.time('fill'):
+        filled = list(
+            lass.schedule.filler.fill(
+                slots,
+                lass.schedule.filler.filler_from_config(),
+                min(slots[0].start, start) if slots else start,
+                max(slots[-1].finish, finish) if slots else finish
+            )
+        )
+
+    with timings.time('tabulate'):
+        for week_start, week_finish in zip(starts, starts[1:]):
+            lass.schedule.table.tabulate(
+                week_start,
+                [
+                    slot for slot in filled
+                    if slot.start < week_finish and week_start < slot.finish
+                ],
+                time_context
+            )
+
+    lass.common.benchmark.reset_session()
+    return len(slots), len(filled)
+
+
+def benchmark(scales=None, repeat=5, url=None, year=2013):
+    """Runs the schedule pipeline benchmark.
+
+    Args:
+        scales: The names of the scales (see 'SCALES') to run at.  If None,
+            all scales are run.  (Default: None.)
+        repeat: The number of times to run the pipeline at each scale.
+            (Default: 5.)
+        url: The URL of the stand-in database; see
+            'lass.common.benchmark.standin_engine'.  (Default: None.)
+        year: The academic year to synthesise.  (Default: 2013.)
+
+    Returns:
+        A tuple of the results, which map scale names to the summarised
+        timings of each stage, and a dict containing the number of rows
+        generated and the number of slots seen at each scale.
+    """
+    scale_weeks = dict(SCALES)
+    if scales is None:
+        scales = [name for name, _ in SCALES]
+
+    results = {}
+    with lass.common.benchmark.standin(url) as engine:
+        with lass.common.benchmark.site_config(CONFIG):
+            generator = Generator(engine, year=year)
+            info = {'rows': generator.populate(), 'slots': {}}
+
+            # Start on the week the clocks change, so every scale has to
+            # deal with at least one change.
+            time_context = generator.time_context
+            start = time_context.start_on(dst_week(year, time_context))
+
+            for scale in scales:
+                timings = lass.common.benchmark.Timings()
+                for _ in range(repeat):
+                    info['slots'][scale] = run_pipeline(
+                        start,
+                        scale_weeks[scale],
+                        time_context,
+                        timings
+                    )
+                results[scale] = timings.summary()
+
+    return results, info
+
+
+def main(argv=sys.argv):
+    parser = argparse.ArgumentParser(
+        prog='lass.schedule.benchmarks',
+        description='Benchmarks the schedule pipeline.'
+    )
+    parser.add_argument(
+        '--scale',
+        action='append',
+        choices=[name for name, _ in SCALES],
+        help='a scale to run at (may be repeated; default: all)'
+    )
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument(
+        '--database',
+        help='the stand-in database URL (default: in-memory SQLite)'
+    )
+    parser.add_argument(
+        '--output',
+        help='a JSON-lines file to record the results in'
+    )
+    parser.add_argument(
+        '--baseline',
+        help='a results file to compare against for regressions'
+    )
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args(argv[1:])
+
+    baseline = (
+        lass.common.benchmark.last_recorded(args.baseline, 'schedule')
+        if args.baseline
+        else None
+    )
+
+    results, info = benchmark(args.scale, args.repeat, args.database)
+
+    for scale, stages in results.items():
+        slots, filled = info['slots'][scale]
+        print('{} ({} timeslots, {} after filling):'.format(
+            scale,
+            slots,
+            filled
+        ))
+        for stage in STAGES:
+            print('    {:<10} p50 {p50:>10.3f}ms  p90 {p90:>10.3f}ms'.format(
+                stage,
+                **stages[stage]
+            ))
+
+    if args.output:
+        lass.common.benchmark.record(args.output, 'schedule', results)
+
+    regressions = (
+        lass.common.benchmark.compare(baseline, results, args.tolerance)
+        if baseline
+        else []
+    )
+    for scale, stage, old, new in regressions:
+        print('REGRESSION: {} {}: {:.3f}ms -> {:.3f}ms'.format(
+            scale,
+            stage,
+            old,
+            new
+        ))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -41,7 +41,8 @@ def annotate(timeslots):
     Each timeslot is augmented with a new attribute 'block' that points either
     to None (in the case of the timeslot having no attached block) or a dict
     with keys 'name' and 'type' denoting the block's descriptive name and
-    internal type key, respectively.
+    internal type key, respectively.  Timeslots in the same block share the
+    same dict, which must not be modified.
 
     Args:
         timeslots: A list of timeslots to be annotated as described above.  The
@@ -63,17 +64,20 @@ def annotate(timeslots):
         )
         next_range_block = make_next_range_block_function(range_blocks)
 
+        # Timeslots in the same block share its dict.
+        blocks = {None: None}
         for timeslot in timeslots:
             range_block, next_range_block = next_range_block(timeslot)
             name_block = name_block_for_timeslot(timeslot, conf)
 
             # Name blocks take precedence if available.
             block_name = name_block if name_block is not None else range_block
-            timeslot.block = (
-                None
-                if block_name is None
-                else dict(conf['blocks'][block_name], name=block_name)
-            )
+            if block_name not in blocks:
+                blocks[block_name] = dict(
+                    conf['blocks'][block_name],
+                    name=block_name
+                )
+            timeslot.block = blocks[block_name]
 
 
 def range_iter(blocks, start_date, time_context):
@@ -110,8 +114,10 @@ def range_iter(blocks, start_date, time_context):
 
 
 def block_config():
-    """Retrieves the default block configuration."""
-    return lass.common.config.from_yaml('sitewide/blocks')
+    """Retrieves the default block configuration, which must not be
+    modified.
+    """
+    return lass.common.config.cached_from_yaml('sitewide/blocks')
 
 
 def name_block_for_timeslot(timeslot, block_config):
@@ -0,0 +1,570 @@
+"""Machine-readable schedule feeds, in JSON and iCalendar formats.
+
+A feed covers a day, a week or a term of the public schedule.  Each
+timeslot in a feed has a fingerprint, worked out in bulk from the
+timeslot itself and the latest versions of the metadata and credits it
+shows, without loading any of them.  Every state of a feed is
+identified by a sync token; a client that sends back the token it was
+last given receives only the timeslots that changed since, and the IDs
+of the ones that went away.
+
+Serialised timeslots are cached by fingerprint, so a timeslot is only
+loaded and annotated again when something it depends on changes.
+
+---
+
+Copyright (c) 2013, University Radio York.
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimer in the
+  documentation and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+import collections
+import datetime
+import hashlib
+import threading
+
+import pytz
+import sqlalchemy
+
+import lass.common.mixins
+import lass.common.time
+import lass.common.view_helpers
+import lass.model_base
+import lass.schedule.lists
+import lass.schedule.models
+
+
+# The ranges a feed can cover.
+RANGES = ('day', 'week', 'term')
+
+# How long, in seconds, clients may reuse a feed without revalidating it.
+FEED_MAX_AGE = 60
+
+# How many feed states, and serialised timeslots, are remembered.
+MAX_SNAPSHOTS = 1000
+MAX_ENTRIES = 10000
+
+PRODUCT_ID = '-//University Radio York//lass schedule feed//EN'
+
+
+State = collections.namedtuple(
+    'State',
+    'range start finish fingerprints sync_token'
+)
+State.__doc__ = """The current state of a schedule feed, as from 'state'."""
+
+
+Feed = collections.namedtuple(
+    'Feed',
+    'range start finish sync_token full timeslots removed'
+)
+Feed.__doc__ = """A schedule feed, or the changes to one since a sync token.
+
+'timeslots' holds the serialised timeslots (see 'serialise') that are in
+the feed, or that changed since the token if 'full' is False; 'removed'
+holds the IDs of timeslots that have left the feed since the token.
+"""
+
+
+class Store(object):
+    """A bounded, least-recently-used, thread-safe mapping."""
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Retrieves the value stored under 'key', or None."""
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        """Stores a value, dropping the least recently used if full."""
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        """Drops every stored value."""
+        with self.lock:
+            self.entries.clear()
+
+
+# Maps sync tokens to the range and timeslot fingerprints they stand for.
+SNAPSHOTS = Store(MAX_SNAPSHOTS)
+
+# Maps (timeslot ID, fingerprint) pairs to serialised timeslots.
+ENTRIES = Store(MAX_ENTRIES)
+
+
+def feed_range(range_name, date, time_context):
+    """Works out the start and finish of a feed.
+
+    Args:
+        range_name: One of 'RANGES'.
+        date: The schedule date the feed should contain.  Week feeds start
+            on the Monday of its week, and term feeds cover its term (or
+            the last term to start before it).
+        time_context: The TimeContext of the schedule.
+
+    Returns:
+        The start and finish of the feed, as aware datetimes.
+
+    Raises:
+        LookupError: if there is no such range, or no term for the date.
+    """
+    if range_name == 'day':
+        start_date, days = date, 1
+    elif range_name == 'week':
+        start_date, days = date - datetime.timedelta(days=date.weekday()), 7
+    elif range_name == 'term':
+        term = lass.schedule.models.Term.of(time_context.start_on(date))
+        if term is None:
+            raise LookupError('No term on or before {}.'.format(date))
+        return term.start, term.finish
+    else:
+        raise LookupError('No such feed range: {}.'.format(range_name))
+
+    return (
+        time_context.start_on(start_date),
+        time_context.start_on(start_date + datetime.timedelta(days=days))
+    )
+
+
+def fingerprints(start, finish, date=None):
+    """Fingerprints every public timeslot between 'start' and 'finish'.
+
+    A timeslot's fingerprint changes whenever it is moved or resized, or
+    whenever the metadata and credits it or its show has, or which of
+    them are active, change.  This takes two queries however many
+    timeslots there are, and loads no models.
+
+    Args:
+        start: The datetime representing the start of the feed.
+        finish: The datetime representing the finish of the feed.
+        date: The datetime on which metadata and credits are checked for
+            activity.  If None, the current time is used.  (Default: None.)
+
+    Returns:
+        An OrderedDict mapping timeslot IDs to fingerprints, in the order
+        the timeslots are scheduled.
+    """
+    Timeslot = lass.schedule.models.Timeslot
+    Season = lass.schedule.models.Season
+    if date is None:
+        date = lass.common.time.aware_now()
+
+    slots = Timeslot.public().filter(
+        (start < Timeslot.finish) & (Timeslot.start < finish)
+    ).with_entities(
+        Timeslot.id,
+        Timeslot.start,
+        Timeslot.duration,
+        Timeslot.season_id,
+        Season.show_id
+    ).order_by(
+        lass.schedule.lists.order()
+    ).all()
+
+    timeslot_ids = [slot.id for slot in slots]
+    show_ids = sorted({slot.show_id for slot in slots})
+    sources = [
+        (attached, Timeslot, timeslot_ids)
+        for attached in lass.common.view_helpers.attached_models(Timeslot)
+    ] + [
+        (attached, lass.schedule.models.Show, show_ids)
+        for attached in lass.common.view_helpers.attached_models(
+            lass.schedule.models.Show
+        )
+    ]
+
+    versions = {}
+    if slots:
+        rows = lass.model_base.DBSession.execute(
+            sqlalchemy.union_all(*(
+                attached_versions(attached, subject_ids, date)
+                for attached, _, subject_ids in sources
+            ))
+        ).fetchall()
+        versions = {
+            (row.kind, row.subject_id): tuple(row)[2:] for row in rows
+        }
+
+    return collections.OrderedDict(
+        (
+            slot.id,
+            digest((
+                tuple(slot),
+                [
+                    versions.get((
+                        attached.__name__,
+                        slot.id if subject is Timeslot else slot.show_id
+                    ))
+                    for attached, subject, _ in sources
+                ]
+            ))
+        )
+        for slot in slots
+    )
+
+
+def attached_versions(attached, subject_ids, date):
+    """Selects the version information of one kind of attachable for many
+    subjects at once, for 'fingerprints'.
+
+    This is the bulk equivalent of
+    'lass.common.view_helpers.attached_version', which also counts how
+    many of the attachables are active on 'date' so that fingerprints
+    change when an item of metadata takes or loses effect.
+    """
+    return sqlalchemy.select([
+        sqlalchemy.literal(attached.__name__).label('kind'),
+        attached.subject_id.label('subject_id'),
+        sqlalchemy.func.max(attached.effective_from).label('latest_from'),
+        sqlalchemy.func.max(attached.effective_to).label('latest_to'),
+        sqlalchemy.func.count().label('rows'),
+        sqlalchemy.func.sum(
+            sqlalchemy.case(
+                [(lass.common.mixins.Transient.active_on(date, attached), 1)],
+                else_=0
+            )
+        ).label('active')
+    ]).where(
+        attached.subject_id.in_(subject_ids)
+    ).group_by(
+        attached.subject_id
+    )
+
+
+def digest(value):
+    """Hashes the representation of 'value' into a short string."""
+    return hashlib.sha1(repr(value).encode('utf-8')).hexdigest()
+
+
+def snapshot(range_key, prints):
+    """Remembers a state of a feed.
+
+    Args:
+        range_key: A hashable value identifying the feed.
+        prints: The fingerprints of the feed, as from 'fingerprints'.
+
+    Returns:
+        The sync token for this state.  Feeds in the same state always
+        have the same token.
+    """
+    token = digest((range_key, list(prints.items())))
+    SNAPSHOTS.put(token, (range_key, dict(prints)))
+    return token
+
+
+def changes(range_key, prints, sync_token):
+    """Works out which timeslots changed since a feed's state 'sync_token'.
+
+    Args:
+        range_key: A hashable value identifying the feed.
+        prints: The current fingerprints of the feed.
+        sync_token: The token of the state the client has, or None.
+
+    Returns:
+        A tuple of the IDs of the timeslots that are new or changed, and
+        the IDs of the timeslots that were removed; or None if the token
+        is not known for this feed (it is unset, has been forgotten, or
+        belongs to another feed), in which case the client needs the full
+        feed.
+    """
+    known = SNAPSHOTS.get(sync_token) if sync_token else None
+    if known is None or known[0] != range_key:
+        return None
+
+    _, previous = known
+    changed = [
+        timeslot_id
+        for timeslot_id, fingerprint in prints.items()
+        if previous.get(timeslot_id) != fingerprint
+    ]
+    removed = sorted(
+        timeslot_id for timeslot_id in previous if timeslot_id not in prints
+    )
+    return changed, removed
+
+
+def entries(prints, timeslot_ids, start, finish):
+    """Retrieves serialised timeslots, loading only those not cached.
+
+    Args:
+        prints: The current fingerprints of the feed.
+        timeslot_ids: The IDs of the timeslots wanted, in schedule order.
+        start: The datetime representing the start of the feed.
+        finish: The datetime representing the finish of the feed.
+
+    Returns:
+        A list of the serialised timeslots, in schedule order.
+    """
+    found = {
+        timeslot_id: ENTRIES.get((timeslot_id, prints[timeslot_id]))
+        for timeslot_id in timeslot_ids
+    }
+    missing = [
+        timeslot_id for timeslot_id, entry in found.items() if entry is None
+    ]
+
+    if missing:
+        Timeslot = lass.schedule.models.Timeslot
+        slots = lass.schedule.lists.from_to(
+            Timeslot.public().filter(Timeslot.id.in_(missing)),
+            start,
+            finish
+        )
+        Timeslot.annotate(slots)
+        for slot in slots:
+            found[slot.id] = serialise(slot)
+            ENTRIES.put((slot.id, prints[slot.id]), found[slot.id])
+
+    # A timeslot that disappeared between fingerprinting and loading is
+    # left out; the next sync will report it as removed.
+    return [
+        found[timeslot_id]
+        for timeslot_id in timeslot_ids
+        if found[timeslot_id] is not None
+    ]
+
+
+def serialise(timeslot):
+    """Converts an annotated timeslot into a plain dict for a feed."""
+    text = getattr(timeslot, 'text', {})
+    block = getattr(timeslot, 'block', None)
+    return {
+        'id': timeslot.id,
+        'season_id': timeslot.season_id,
+        'show_id': timeslot.season.show_id,
+        'start': timeslot.start.astimezone(pytz.utc),
+        'finish': timeslot.finish.astimezone(pytz.utc),
+        'title': first(text.get('title')),
+        'description': first(text.get('description')),
+        'block': block['name'] if block else None,
+        'credits': [
+            {
+                'type': credit.type.name,
+                'person_id': credit.person_id,
+                'name': ' '.join(
+                    name
+                    for name in (
+                        credit.person.first_name,
+                        credit.person.last_name
+                    )
+                    if name
+                )
+            }
+            for credit in timeslot.credits
+        ]
+    }
+
+
+def first(values):
+    """Returns the first of a list of metadata values, or None."""
+    return values[0] if values else None
+
+
+def state(range_name, date, time_context=None):
+    """Works out the current state of a schedule feed.
+
+    This is cheap (see 'fingerprints'), so views can use the state's sync
+    token to answer revalidations before building the feed itself.
+
+    Args:
+        range_name: One of 'RANGES'.
+        date: The schedule date the feed should contain (see 'feed_range').
+        time_context: The TimeContext of the schedule.  If None, the site
+            configuration is used.  (Default: None.)
+
+    Returns:
+        A State.
+
+    Raises:
+        LookupError: if the range could not be worked out.
+    """
+    if time_context is None:
+        time_context = lass.common.time.context_from_config()
+
+    start, finish = feed_range(range_name, date, time_context)
+    range_key = (range_name, start, finish)
+    prints = fingerprints(start, finish)
+
+    return State(
+        range=range_name,
+        start=start,
+        finish=finish,
+        fingerprints=prints,
+        sync_token=snapshot(range_key, prints)
+    )
+
+
+def build(feed_state, sync_token=None):
+    """Builds a schedule feed.
+
+    Args:
+        feed_state: The State of the feed, from 'state'.
+        sync_token: The sync token the client was last given for this
+            feed, if any.  (Default: None.)
+
+    Returns:
+        A Feed, holding only the changes since 'sync_token' if the token
+        is known, and the whole feed otherwise.
+    """
+    start, finish = feed_state.start, feed_state.finish
+    prints = feed_state.fingerprints
+
+    delta = changes((feed_state.range, start, finish), prints, sync_token)
+    if delta is None:
+        full, wanted, removed = True, list(prints), []
+    else:
+        full, (wanted, removed) = False, delta
+
+    return Feed(
+        range=feed_state.range,
+        start=start,
+        finish=finish,
+        sync_token=feed_state.sync_token,
+        full=full,
+        timeslots=entries(prints, wanted, start, finish),
+        removed=removed
+    )
+
+
+def to_json(feed, url_for):
+    """Converts a Feed into a JSON-serialisable dict.
+
+    Args:
+        feed: The Feed.
+        url_for: A function taking a timeslot ID and returning the URL of
+            the timeslot's page.
+    """
+    return {
+        'range': feed.range,
+        'start': feed.start.isoformat(),
+        'finish': feed.finish.isoformat(),
+        'sync_token': feed.sync_token,
+        'full': feed.full,
+        'timeslots': [
+            dict(
+                entry,
+                start=entry['start'].isoformat(),
+                finish=entry['finish'].isoformat(),
+                url=url_for(entry['id'])
+            )
+            for entry in feed.timeslots
+        ],
+        'removed': feed.removed
+    }
+
+
+def to_ical(feed, url_for, host, now=None):
+    """Converts a Feed into an iCalendar (RFC 5545) document.
+
+    Calendar clients have no notion of sync tokens, so this should only
+    be given full feeds; they can revalidate with the feed's ETag instead.
+
+    Args:
+        feed: The Feed.
+        url_for: A function taking a timeslot ID and returning the URL of
+            the timeslot's page.
+        host: The host name to qualify event UIDs with.
+        now: The aware datetime to stamp events with.  If None, the
+            current time is used.  (Default: None.)
+
+    Returns:
+        The document, as a string with CRLF line endings.
+    """
+    stamp = ical_datetime(now or lass.common.time.aware_now())
+
+    lines = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:' + PRODUCT_ID,
+        'CALSCALE:GREGORIAN',
+        'X-WR-CALNAME:' + ical_text('Schedule ({})'.format(feed.range))
+    ]
+    for entry in feed.timeslots:
+        lines.extend([
+            'BEGIN:VEVENT',
+            'UID:timeslot-{}@{}'.format(entry['id'], host),
+            'DTSTAMP:' + stamp,
+            'DTSTART:' + ical_datetime(entry['start']),
+            'DTEND:' + ical_datetime(entry['finish']),
+            'SUMMARY:' + ical_text(entry['title'] or ''),
+            'URL:' + url_for(entry['id'])
+        ])
+        if entry['description']:
+            lines.append('DESCRIPTION:' + ical_text(entry['description']))
+        if entry['block']:
+            lines.append('CATEGORIES:' + ical_text(entry['block']))
+        lines.append('END:VEVENT')
+    lines.append('END:VCALENDAR')
+
+    return ''.join(fold(line) + '\r\n' for line in lines)
+
+
+def ical_datetime(value):
+    """Formats an aware datetime as an iCalendar UTC date-time."""
+    return value.astimezone(pytz.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def ical_text(value):
+    """Escapes a string for use as an iCalendar TEXT value."""
+    return value.replace(
+        '\\', '\\\\'
+    ).replace(
+        ';', '\\;'
+    ).replace(
+        ',', '\\,'
+    ).replace(
+        '\r\n', '\\n'
+    ).replace(
+        '\n', '\\n'
+    )
+
+
+def fold(line, limit=75):
+    """Folds a content line so no physical line exceeds 'limit' octets."""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= limit:
+        return line
+
+    parts = []
+    current = ''
+    size = 0
+    for character in line:
+        width = len(character.encode('utf-8'))
+        # Continuation lines start with a space, which counts to the limit.
+        if size + width > (limit if not parts else limit - 1):
+            parts.append(current)
+            current, size = '', 0
+        current += character
+        size += width
+    parts.append(current)
+    return '\r\n '.join(parts)
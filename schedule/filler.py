@@ -39,6 +39,8 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import datetime
 import functools
+import threading
+import types
 
 import lass.common.config
 import lass.schedule.models
@@ -47,35 +49,102 @@ import lass.schedule.models
 ZERO = datetime.timedelta(seconds=0)
 
 
+def freeze(value):
+    """Makes a read-only copy of a piece of configuration, turning dicts
+    into read-only mappings and lists into tuples.
+    """
+    if isinstance(value, dict):
+        frozen = types.MappingProxyType(
+            {key: freeze(item) for key, item in value.items()}
+        )
+    elif isinstance(value, (list, tuple)):
+        frozen = tuple(freeze(item) for item in value)
+    else:
+        frozen = value
+    return frozen
+
+
+def make_template(metadata={}, block=None):
+    """Makes the shared, read-only set of attributes for filler timeslots.
+
+    Args:
+        metadata: A dict mapping metadata types (for example, 'text') to
+            dicts mapping metadata keys to lists of values.  (Default: {}.)
+        block: The block dict for the filler, or None if the filler is not
+            in a block.  (Default: None.)
+
+    Returns:
+        A read-only mapping from attribute names to read-only attribute
+        values, for use as the 'template' of a FillerTimeslot.
+    """
+    return freeze(dict(metadata, block=block))
+
+
+EMPTY_TEMPLATE = make_template()
+
+
 class FillerTimeslot(lass.schedule.models.BaseTimeslot):
     """An object representing a filler timeslot.
 
     Filler timeslots are mostly compatible with regular timeslots, but
     have pre-applied "fake" metadata, and have no attached seasons or
     shows.
+
+    There can be many filler timeslots in a schedule, so each one stores
+    only its start and duration; its metadata and block are looked up in
+    a template shared between all filler timeslots made from the same
+    configuration.  As the template is shared, it is read-only.
     """
+    __slots__ = ('start', 'duration', 'template')
+
     is_filler = True
     is_collapsible = True
 
-    def __init__(self, start, duration, metadata={}, block=None):
+    def __init__(self, start, duration, template=EMPTY_TEMPLATE):
         super().__init__(start, duration)
-        for attr, contents in metadata.items():
-            setattr(self, attr, contents)
+        self.template = template
+
+    def __getattr__(self, name):
+        # Only called when normal attribute lookup fails, so the slots
+        # above always take priority over the template.
+        if name == 'template':
+            # Not set yet (for example, while being copied); don't recurse.
+            raise AttributeError(name)
+        try:
+            return self.template[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
 
-        self.block = block
+# The last filler configuration seen by 'filler_from_config', and the
+# filler function made from it.
+_filler = (None, None)
+_filler_lock = threading.Lock()
 
 
 def filler_from_config():
     """Creates a filler function that creates fake filler timeslots with
     metadata taken from the website's configuration files (specifically
     'sitewide/filler.yml'.
+
+    The function, and the template its timeslots share, is only rebuilt
+    when the configuration file changes.
     """
-    filler_config = lass.common.config.from_yaml('sitewide/filler')
-    return functools.partial(
-        FillerTimeslot,
-        metadata=filler_config['metadata'],
-        block=filler_config['block']
-    )
+    global _filler
+
+    filler_config = lass.common.config.cached_from_yaml('sitewide/filler')
+    with _filler_lock:
+        config, filler = _filler
+        if config is not filler_config:
+            filler = functools.partial(
+                FillerTimeslot,
+                template=make_template(
+                    filler_config['metadata'],
+                    filler_config['block']
+                )
+            )
+            _filler = (filler_config, filler)
+    return filler
 
 
 #
@@ -88,37 +157,56 @@ def fill(timeslots, filler, start, finish):
     such that the list is fully populated from the given start time
     to the given end time.
 
+    Filling is lazy, so the filled schedule can be consumed as it is
+    produced.  Any filler timeslots already in 'timeslots' are treated as
+    gaps, so that each run of empty time becomes exactly one filler slot
+    (and filling an already filled list changes nothing).
+
     Args:
-        timeslots: The list of timeslots, may be empty.
+        timeslots: An iterable of timeslots in chronological order; may be
+            empty.
+        filler: A function taking a start datetime and duration and
+            returning a filler timeslot; see 'filler_from_config'.
         start: The datetime at which the filled timeslot list should start.
         finish: The datetime at which the filled timeslot list should finish.
+
+    Returns:
+        An iterator over the filled timeslots.  If two timeslots overlap, a
+        ValueError is raised when the iterator reaches them.
     """
+    # Checked here, rather than inside the generator, so that bad ranges
+    # are reported at the call site.
     if start > finish:
         raise ValueError('Start time is after finish time.')
 
-    current_time = start
-    filled = []
-    unplaced = iter(timeslots)
+    return fill_iter(timeslots, filler, start, finish)
+
+
+def fill_iter(timeslots, filler, start, finish):
+    """The generator behind 'fill'."""
+    gap_start = start
 
-    while current_time < finish:
-        timeslot = next(unplaced, None)
-        next_time = min(finish, timeslot.start) if timeslot else finish
-        gap = next_time - current_time
+    for timeslot in timeslots:
+        if finish <= gap_start:
+            break
+        if getattr(timeslot, 'is_filler', False):
+            # Merge into the surrounding gap.
+            continue
 
-        if gap < ZERO:
+        gap_finish = min(finish, timeslot.start)
+        if gap_finish < gap_start:
             raise ValueError(
                 'Negative gap ({} between {} and {}, next ts: {}).'.format(
-                    gap, current_time, next_time,
-                    None if timeslot is None else timeslot.text['title'][0]
+                    gap_finish - gap_start, gap_start, gap_finish,
+                    timeslot.text['title'][0]
                 )
             )
-        elif gap > ZERO:
-            filled.append(filler(current_time, gap))
-            current_time = next_time
+        elif gap_start < gap_finish:
+            yield filler(gap_start, gap_finish - gap_start)
         # If no gap, don't fill!
 
-        if timeslot:
-            filled.append(timeslot)
-            current_time = timeslot.finish
+        yield timeslot
+        gap_start = timeslot.finish
 
-    return filled
+    if gap_start < finish:
+        yield filler(gap_start, finish - gap_start)
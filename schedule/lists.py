@@ -8,8 +8,11 @@ import sqlalchemy
 import lass.schedule.models
 
 import lass.credits.query
+import lass.common.database
+import lass.common.singleflight
 import lass.common.time
 import lass.schedule.filler
+import lass.schedule.records
 
 
 def process(slots, start, finish):
@@ -32,11 +35,32 @@ def process(slots, start, finish):
         start = min(slots[0].start, start)
         finish = max(slots[-1].finish, finish)
 
-    return lass.schedule.filler.fill(
-        slots,
-        lass.schedule.filler.filler_from_config(),
-        start,
-        finish
+    return list(
+        lass.schedule.filler.fill(
+            slots,
+            lass.schedule.filler.filler_from_config(),
+            start,
+            finish
+        )
+    )
+
+
+def process_records(slots, start, finish):
+    """Like 'process', but for the TimeslotRecords of 'records_from_to'
+    and 'records_next'.
+    """
+    if slots:
+        lass.schedule.records.annotate(slots)
+        start = min(slots[0].start, start)
+        finish = max(slots[-1].finish, finish)
+
+    return list(
+        lass.schedule.filler.fill(
+            slots,
+            lass.schedule.filler.filler_from_config(),
+            start,
+            finish
+        )
     )
 
 
@@ -56,8 +80,8 @@ class Schedule(object):
             creator: A function taking the start time and returning a list of
                 unfilled and unannotated timeslots.
             processor: A processing function for post-processing the output of
-                'function' (for example, annotating and filling).  (Default:
-                'process'.)
+                'function' (for example, annotating and filling), or None if
+                'creator' returns processed timeslots.  (Default: 'process'.)
             source: A Query from which all timeslots should be selected.
                 May be None, in which case the query matching all public
                 timeslots will be used.
@@ -91,7 +115,7 @@ class Schedule(object):
             processor,
             start=self.start,
             finish=self.finish
-        )
+        ) if processor else None
         self.stored = False
         self.time_context = lass.common.time.context_from_config()
 
@@ -108,7 +132,9 @@ class Schedule(object):
             The list of timeslots this object has been directed to compute.
         """
         if not self.stored:
-            self.slots = self.processor(self.creator())
+            self.slots = self.creator()
+            if self.processor:
+                self.slots = self.processor(self.slots)
             self.stored = True
 
         return self.slots
@@ -196,6 +222,52 @@ def next(source, start, finish, count):
     return with_credits.order_by(order()).limit(count).all()
 
 
+def records_from_to(source, start, finish):
+    """Like 'from_to', but selects read-only TimeslotRecords (see
+    'lass.schedule.records') instead of Timeslots.
+
+    Credits are loaded when the records are processed, by
+    'process_records'.
+    """
+    all_from_to = source.filter(
+        (start < lass.schedule.models.Timeslot.finish) &
+        (lass.schedule.models.Timeslot.start < finish)
+    )
+    return lass.schedule.records.from_query(all_from_to.order_by(order()))
+
+
+def records_next(source, start, finish, count):
+    """Like 'next', but selects read-only TimeslotRecords (see
+    'lass.schedule.records') instead of Timeslots.
+    """
+    all_next = source.filter(start < lass.schedule.models.Timeslot.finish)
+    return lass.schedule.records.from_query(
+        all_next.order_by(order()).limit(count)
+    )
+
+
+@lass.common.singleflight.coalesce(
+    key=lambda source, start, finish, count: (
+        lass.common.database.query_key(source),
+        count
+    )
+)
+def shared_next(source, start, finish, count):
+    """Like 'records_next', but also processes the records (see
+    'process_records').
+
+    Concurrent calls for the same source and count share one query and
+    its processing, and so the 'start' of whichever call came first; the
+    records are read-only once processed, so can be shared between
+    threads.
+    """
+    return process_records(
+        records_next(source, start, finish, count),
+        start,
+        finish
+    )
+
+
 def load_credits(query):
     """Adds credit loading to a timeslot query."""
     # Grab the *show*'s credits, because timeslots don't have their
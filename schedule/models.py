@@ -39,10 +39,12 @@ import sqlalchemy.ext.hybrid
 
 import lass.common
 import lass.metadata
+import lass.metadata.layers
 import lass.music
 import lass.model_base
 import lass.people.mixins
 import lass.credits.models
+import lass.schedule.tracklist
 
 
 class ScheduleModel(lass.model_base.Base):
@@ -218,23 +220,26 @@ class Term(lass.model_base.Base):
         This case can easily be distinguished by checking the returned term's
         'finish' attribute.
 
+        This looks the term up in the in-memory term table (see
+        'lass.schedule.terms') rather than querying the database.
+
         Args:
             datetime: An aware datetime for which a corresponding term is
                 sought.  If None, the current time will be used.
                 (Default: None.)
 
         Returns:
-            The term on the date, or the last active term if none exists.
-            Technically, this returns the last term to start before the date.
+            The term on the date, or the last active term if none exists, as
+            a 'lass.schedule.terms.TermRecord'.  Technically, this returns
+            the last term to start before the date.
         """
+        # Imported here, as the term table module imports this one.
+        import lass.schedule.terms
+
         if datetime is None:
             datetime = lass.common.time.aware_now()
 
-        return cls.query.filter(
-            cls.start <= datetime
-        ).order_by(
-            sqlalchemy.desc(cls.start)
-        ).first()
+        return lass.schedule.terms.table().of(datetime)
 
 
 #
@@ -305,17 +310,17 @@ class Season(
         for show, show_seasons in shows.items():
             for show_season in show_seasons:
                 # This metadata is currently not handled at all by
-                # seasons, so copy it all over from the show verbatim.
+                # seasons, so share the show's verbatim.
                 show_season.image = show.image
 
-                # For the text metadata, it'd be nice to merge show and
-                # season metadata.  Give seasons precedence so any
-                # custom episode metadata is pulled in first.
-                for key, value in show.text.items():
-                    if key in show_season.text:
-                        show_season.text[key] += value
-                    else:
-                        show_season.text[key] = value
+                # For the text metadata, merge show and season metadata,
+                # giving seasons precedence so any custom episode metadata
+                # is pulled in first.  The show's metadata is layered under
+                # the season's rather than copied into it.
+                show_season.text = lass.metadata.layers.LayeredMetadata(
+                    show_season.text,
+                    show.text
+                )
 
 
 class SeasonAttachable(ScheduleModel):
@@ -350,6 +355,9 @@ class BaseTimeslot(object):
     """The common level of functionality available on both data-model and
     pseudo-timeslots.
     """
+    # Lets pseudo-timeslots go without a __dict__ if they want.
+    __slots__ = ()
+
     def __init__(self, start, duration):
         self.start = start
         self.duration = duration
@@ -411,47 +419,11 @@ class Timeslot(
     def tracklist(self):
         """Returns a list of tracks played during this timeslot.
 
-        This runs one database query per usage.
+        Tracklists are cached (see 'lass.schedule.tracklist'); to load the
+        tracklists of many timeslots in one query, use
+        'lass.schedule.tracklist.tracklists' on them first.
         """
-        in_library = lass.model_base.DBSession.query(
-            lass.music.models.Track.title.label('track'),
-            lass.music.models.Track.artist.label('artist'),
-            lass.music.models.Record.title.label('record'),
-            lass.music.models.TrackListing.timestart.label('played_at')
-        ).select_from(
-            lass.music.models.TrackListing
-        ).join(
-            lass.music.models.TrackListingLibraryTrack,
-            lass.music.models.TrackListingLibraryTrack.track,
-            lass.music.models.TrackListingLibraryTrack.record
-        )
-
-        out_library = lass.model_base.DBSession.query(
-            lass.music.models.TrackListingCustomTrack.track.label('track'),
-            lass.music.models.TrackListingCustomTrack.artist.label('artist'),
-            lass.music.models.TrackListingCustomTrack.album.label('record'),
-            lass.music.models.TrackListing.timestart.label('played_at')
-        ).select_from(
-            lass.music.models.TrackListing
-        ).join(
-            lass.music.models.TrackListingCustomTrack
-        )
-
-        return self.tracklist_filter(in_library).union(
-            self.tracklist_filter(out_library)
-        ).order_by(
-            sqlalchemy.asc('played_at')
-        ).all()
-
-    def tracklist_filter(self, query):
-        """Performs filtering for the tracklist mini-queries."""
-        return query.filter(
-            (lass.music.models.TrackListing.timeslotid == self.id) &
-            (
-                (lass.music.models.TrackListing.state_id == None) |
-                (~lass.music.models.TrackListing.state_id.in_(['o', 'd']))
-            )
-        )
+        return lass.schedule.tracklist.tracklists([self])[self.id]
 
     @property
     def can_be_messaged(self):
@@ -508,17 +480,17 @@ class Timeslot(
         for show, show_timeslots in shows.items():
             for show_timeslot in show_timeslots:
                 # This metadata is currently not handled at all by
-                # timeslots, so copy it all over from the show verbatim.
+                # timeslots, so share the show's verbatim.
                 show_timeslot.image = show.image
 
-                # For the text metadata, it'd be nice to merge show and
-                # timeslot metadata.  Give timeslots precedence so any
-                # custom episode metadata is pulled in first.
-                for key, value in show.text.items():
-                    if key in show_timeslot.text:
-                        show_timeslot.text[key] += value
-                    else:
-                        show_timeslot.text[key] = value
+                # For the text metadata, merge show and timeslot metadata,
+                # giving timeslots precedence so any custom episode metadata
+                # is pulled in first.  The show's metadata is layered under
+                # the timeslot's rather than copied into it.
+                show_timeslot.text = lass.metadata.layers.LayeredMetadata(
+                    show_timeslot.text,
+                    show.text
+                )
         lass.schedule.blocks.annotate(timeslots)
 
     @property
@@ -586,7 +558,7 @@ class Message(lass.model_base.Base):
     # Should be a foreign key to sis_commtype
     commtypeid = sqlalchemy.Column(sqlalchemy.Integer)
     sender = sqlalchemy.Column(sqlalchemy.String(64))
-    date = sqlalchemy.DateTime(timezone=True)
+    date = sqlalchemy.Column(sqlalchemy.DateTime(timezone=True))
     subject = sqlalchemy.Column(sqlalchemy.String(255))
     content = sqlalchemy.Column(sqlalchemy.Text)
     # Should be a foreign key to sis_status
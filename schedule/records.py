@@ -0,0 +1,331 @@
+"""Compact, read-only timeslot records for rendering schedules.
+
+Loading a week of schedule as ORM Timeslots loads every timeslot's
+season, show and show type as ORM objects too, plus the show credits
+with their people and credit types, and then gives every timeslot its
+own copies of its show's metadata.  This module instead selects only
+the columns a schedule needs into small records with '__slots__', and
+shares everything that belongs to a show (its type, metadata and
+credits) between all of that show's timeslots.
+
+TimeslotRecords behave like annotated Timeslots as far as
+'lass.schedule.filler', 'lass.schedule.blocks', 'lass.schedule.table'
+and the schedule templates are concerned, but are read-only: their
+metadata mappings and credit tuples are shared, and MUST NOT be
+modified.  Only 'block' is set after a record is made.
+
+---
+
+Copyright (c) 2013, University Radio York.
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimer in the
+  documentation and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import collections
+import types
+
+import sqlalchemy
+
+import lass.common.time
+import lass.credits.models
+import lass.credits.query
+import lass.metadata.layers
+import lass.metadata.query
+import lass.model_base
+import lass.people.models
+import lass.schedule.blocks
+import lass.schedule.models
+import lass.schedule.tracklist
+
+
+# The metadata keys loaded for each show, and for each timeslot, by type.
+SHOW_META = {
+    'text': ('title', 'description', 'tag'),
+    'image': ('image', 'thumbnail_image', 'player_image')
+}
+TIMESLOT_META = {
+    'text': ('title',)
+}
+
+EMPTY_META = types.MappingProxyType({})
+
+
+ShowTypeRecord = collections.namedtuple(
+    'ShowTypeRecord',
+    'id name is_collapsible can_be_messaged'
+)
+SeasonRecord = collections.namedtuple('SeasonRecord', 'id show')
+PersonRecord = collections.namedtuple(
+    'PersonRecord',
+    'id first_name last_name'
+)
+CreditTypeRecord = collections.namedtuple(
+    'CreditTypeRecord',
+    'id name plural is_in_byline'
+)
+CreditRecord = collections.namedtuple(
+    'CreditRecord',
+    'type person effective_from effective_to'
+)
+
+
+class ShowRecord(object):
+    """The parts of a show shared between the records of its timeslots."""
+    __slots__ = ('id', 'type', 'text', 'image', 'credits')
+
+    def __init__(self, id, type, text=EMPTY_META, image=EMPTY_META):
+        self.id = id
+        self.type = type
+        self.text = text
+        self.image = image
+        # A list of CreditRecords, including inactive ones.
+        self.credits = []
+
+
+class TimeslotRecord(lass.schedule.models.BaseTimeslot):
+    """A read-only stand-in for an annotated Timeslot."""
+    __slots__ = (
+        'id',
+        'start',
+        'duration',
+        'season',
+        'text',
+        'image',
+        'credits',
+        'block'
+    )
+
+    is_filler = False
+
+    def __init__(self, id, start, duration, season):
+        super().__init__(start, duration)
+        self.id = id
+        self.season = season
+        self.text = season.show.text
+        self.image = season.show.image
+        self.credits = ()
+        self.block = None
+
+    @property
+    def show(self):
+        """Returns the ShowRecord of this timeslot's show."""
+        return self.season.show
+
+    @property
+    def is_collapsible(self):
+        """See 'lass.schedule.models.Timeslot.is_collapsible'."""
+        return self.season.show.type.is_collapsible
+
+    @property
+    def can_be_messaged(self):
+        """See 'lass.schedule.models.Timeslot.can_be_messaged'."""
+        return self.season.show.type.can_be_messaged
+
+    @property
+    def tracklist(self):
+        """See 'lass.schedule.models.Timeslot.tracklist'."""
+        return lass.schedule.tracklist.tracklists([self])[self.id]
+
+
+def columns():
+    """Returns the columns selected for each timeslot record."""
+    models = lass.schedule.models
+    return (
+        models.Timeslot.id,
+        models.Timeslot.start,
+        models.Timeslot.duration,
+        models.Season.id,
+        models.Show.id,
+        models.ShowType.id,
+        models.ShowType.name,
+        models.ShowType.is_collapsible,
+        models.ShowType.can_be_messaged
+    )
+
+
+def from_query(query):
+    """Makes timeslot records from the rows of a query.
+
+    Args:
+        query: A query on timeslots joined to their seasons, shows and show
+            types, such as 'Timeslot.public()' with any filters and
+            ordering.  Its entities are replaced by those of 'columns'.
+
+    Returns:
+        A list of unannotated TimeslotRecords, in the order of the query.
+    """
+    show_types, shows, seasons = {}, {}, {}
+    records = []
+    for (
+        timeslot_id, start, duration, season_id, show_id, *show_type
+    ) in query.with_entities(*columns()):
+        type_record = show_types.get(show_type[0])
+        if type_record is None:
+            type_record = show_types[show_type[0]] = ShowTypeRecord(
+                *show_type
+            )
+        show = shows.get(show_id)
+        if show is None:
+            show = shows[show_id] = ShowRecord(show_id, type_record)
+        season = seasons.get(season_id)
+        if season is None:
+            season = seasons[season_id] = SeasonRecord(season_id, show)
+        records.append(TimeslotRecord(timeslot_id, start, duration, season))
+    return records
+
+
+def annotate(records, date=None):
+    """Annotates timeslot records with their metadata, credits and blocks,
+    as 'lass.schedule.models.Timeslot.annotate' annotates Timeslots.
+
+    Args:
+        records: A list of TimeslotRecords, in chronological order.
+        date: The datetime on which metadata must be active; if None, the
+            current time is used.  (Default: None.)
+    """
+    if not records:
+        return
+    date = lass.common.time.aware_now() if date is None else date
+    models = lass.schedule.models
+
+    shows = {record.show.id: record.show for record in records}
+    for meta_type, keys in SHOW_META.items():
+        found = meta(models.Show, list(shows), meta_type, keys, date)
+        for show_id, show in shows.items():
+            setattr(show, meta_type, found.get(show_id, EMPTY_META))
+    load_credits(shows)
+
+    own_text = meta(
+        models.Timeslot,
+        [record.id for record in records],
+        'text',
+        TIMESLOT_META['text'],
+        date
+    )
+    active_credits = {}
+    for record in records:
+        show = record.show
+        record.image = show.image
+
+        # Timeslot text takes precedence over, but is layered over, show
+        # text; most timeslots have none, and just share their show's.
+        text = own_text.get(record.id)
+        record.text = show.text if text is None else (
+            lass.metadata.layers.LayeredMetadata(text, show.text)
+        )
+
+        # Most timeslots of a show have the same credits, so share them.
+        credits = tuple(
+            credit for credit in show.credits
+            if credit.effective_from is not None and
+            credit.effective_from <= record.finish and (
+                credit.effective_to is None or
+                record.start < credit.effective_to
+            )
+        )
+        record.credits = active_credits.setdefault(
+            (show.id, tuple(map(id, credits))),
+            credits
+        )
+
+    lass.schedule.blocks.annotate(records)
+
+
+def meta(model, ids, meta_type, keys, date):
+    """Loads metadata for the given IDs of a model.
+
+    Returns:
+        A dict mapping IDs to read-only mappings of keys to tuples of
+        values; IDs without any metadata are left out.
+    """
+    found = lass.metadata.query.run(
+        lass.metadata.query.SubjectIDs(model, ids),
+        meta_type,
+        date,
+        model.meta_sources(),
+        *keys
+    )
+    return {
+        subject_id: types.MappingProxyType(
+            {key: tuple(values) for key, values in subject_meta.items()}
+        )
+        for subject_id, subject_meta in found.items()
+    }
+
+
+def load_credits(shows):
+    """Loads every credit of the given shows into their 'credits' lists,
+    sharing the records of people and credit types between them.
+
+    Args:
+        shows: A dict mapping show IDs to ShowRecords.
+    """
+    Person = lass.people.models.Person
+    CreditType = lass.credits.models.CreditType
+    credit = lass.credits.query.credit_model(lass.schedule.models.Show)
+
+    rows = lass.model_base.DBSession.query(
+        credit.subject_id,
+        credit.effective_from,
+        credit.effective_to,
+        CreditType.id,
+        CreditType.name,
+        CreditType.plural,
+        CreditType.is_in_byline,
+        Person.id,
+        Person.first_name,
+        Person.last_name
+    ).select_from(
+        credit
+    ).join(
+        CreditType,
+        credit.credit_type_id == CreditType.id
+    ).join(
+        Person,
+        credit.person_id == Person.id
+    ).filter(
+        credit.subject_id.in_(list(shows))
+    ).order_by(
+        sqlalchemy.asc(credit.subject_id),
+        sqlalchemy.asc(CreditType.name),
+        sqlalchemy.asc(Person.last_name),
+        sqlalchemy.asc(Person.first_name)
+    ).all()
+
+    credit_types, people = {}, {}
+    for show in shows.values():
+        show.credits = []
+    for show_id, effective_from, effective_to, *rest in rows:
+        type_row, person_row = rest[:4], rest[4:]
+        credit_type = credit_types.get(type_row[0])
+        if credit_type is None:
+            credit_type = credit_types[type_row[0]] = CreditTypeRecord(
+                *type_row
+            )
+        person = people.get(person_row[0])
+        if person is None:
+            person = people[person_row[0]] = PersonRecord(*person_row)
+        shows[show_id].credits.append(
+            CreditRecord(credit_type, person, effective_from, effective_to)
+        )
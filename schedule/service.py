@@ -31,15 +31,21 @@ ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
 SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
+import collections
+import threading
+import time
+
 import sqlalchemy
 
+import lass.common.config
 import lass.common.time
 import lass.schedule.models
+import lass.schedule.terms
 
 
 # Allowed service types; see service_type() for documentation
 SERVICE_TYPES = (
-    'up',
+    'normal',
     'sustainer',
     'emergency',
     'down'
@@ -152,7 +158,7 @@ def service_type(at_time=None, term=None, service_config=None):
         term: The term active during 'at_time', used for deciding the service
             type in the absence of manual overrides.  Provided to prevent
             duplicate queries when the term is already known; if None then the
-            term will be found using 'lass.schedule.models.Term.on'.
+            term will be found using 'lass.schedule.models.Term.of'.
             (Default: None.)
         service_config: The service configuration to use for manual overrides;
             if None, the config will be read from scratch.  Provided to prevent
@@ -177,7 +183,7 @@ def service_type(at_time=None, term=None, service_config=None):
             # Database is down, handle gracefully
             term = None
     if service_config is None:
-        service_config = read_config
+        service_config = read_config()
 
     if use_overrides:
         # Try manual override
@@ -194,7 +200,7 @@ def service_type(at_time=None, term=None, service_config=None):
             # updated (or is down).  Ideally, we should make a log of this at
             # some point.
             service_type = 'down'
-        elif term.end > at_time:
+        elif term.finish > at_time:
             # Inside a term, which to us implies programming is happening.
             service_type = 'normal'
         elif term.name.lower() == 'summer':
@@ -207,5 +213,90 @@ def service_type(at_time=None, term=None, service_config=None):
 
 
 def read_config():
-    """Reads in the service configuration from file."""
-    return lass.common.config.from_yaml('sitewide/service')
+    """Reads in the service configuration from file.
+
+    The result is shared (see 'lass.common.config.cached_from_yaml'), and
+    MUST NOT be modified.
+    """
+    return lass.common.config.cached_from_yaml('sitewide/service')
+
+
+Cached = collections.namedtuple(
+    'Cached',
+    'state config next_boundary table_expires'
+)
+Cached.__doc__ = """A shared State, with what it was computed from."""
+
+
+_current = None
+_current_lock = threading.Lock()
+
+
+def current(now=None):
+    """Returns the State of the station's service right now.
+
+    The State is shared between all callers, and is only recomputed once
+    it could have changed: when a term next starts or finishes, when the
+    term table (see 'lass.schedule.terms') is reloaded, or when the service
+    configuration file changes.
+
+    Args:
+        now: The current aware datetime; if None, it will be looked up.
+            (Default: None.)
+
+    Returns:
+        A State for the current time, with its term and service type
+        already worked out.  Callers MUST NOT modify it.
+    """
+    global _current
+
+    if now is None:
+        now = lass.common.time.aware_now()
+    config = read_config()
+
+    with _current_lock:
+        cached = _current
+    if cached is not None and is_fresh(cached, now, config):
+        return cached.state
+
+    try:
+        table = lass.schedule.terms.table()
+    except sqlalchemy.exc.OperationalError:
+        # Database is down; don't share a State that will report this, so
+        # the service comes back as soon as the database does.
+        return State(service_config=config)
+
+    state = State(service_config=config)
+    # Work these out now, so nothing is written to the shared State later.
+    state._lazy('term', lambda: table.of(now))
+    state.service_type
+
+    with _current_lock:
+        _current = Cached(
+            state=state,
+            config=config,
+            next_boundary=table.next_boundary(now),
+            table_expires=lass.schedule.terms.expires_at()
+        )
+    return state
+
+
+def is_fresh(cached, now, config):
+    """Decides whether a Cached State still describes the service at 'now'.
+    """
+    return (
+        cached.config is config and
+        (cached.next_boundary is None or now < cached.next_boundary) and
+        (
+            cached.table_expires is None or
+            time.monotonic() < cached.table_expires
+        )
+    )
+
+
+def invalidate():
+    """Forces the shared State to be recomputed on its next use."""
+    global _current
+
+    with _current_lock:
+        _current = None
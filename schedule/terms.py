@@ -0,0 +1,151 @@
+"""An in-memory table of academic terms.
+
+Terms change a few times a year at most, but the current term is wanted on
+nearly every page (see 'lass.schedule.service').  Rather than query for it
+each time, the whole term list is loaded into a sorted table, which answers
+'which term is this date in?' with a binary search.  The table is reloaded
+periodically so newly entered terms are picked up.
+
+---
+
+Copyright (c) 2013, University Radio York.
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimer in the
+  documentation and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import bisect
+import collections
+import threading
+import time
+
+import lass.schedule.models
+
+
+# How long, in seconds, a loaded term table is used before it is reloaded.
+TABLE_MAX_AGE = 3600
+
+
+TermRecord = collections.namedtuple('TermRecord', 'id start finish name')
+TermRecord.__doc__ = """A detached, immutable copy of a Term.
+
+This has the same 'id', 'start', 'finish' and 'name' attributes as the
+model, and so can stand in for it wherever only those are needed.
+"""
+
+
+class TermTable(object):
+    """A sorted, immutable table of terms."""
+    def __init__(self, terms):
+        """Initialises the TermTable.
+
+        Args:
+            terms: An iterable of terms (or TermRecords), in any order.
+        """
+        self.terms = tuple(
+            sorted(
+                (
+                    TermRecord(term.id, term.start, term.finish, term.name)
+                    for term in terms
+                ),
+                key=lambda term: term.start
+            )
+        )
+        self.starts = [term.start for term in self.terms]
+        self.boundaries = sorted(
+            {term.start for term in self.terms} |
+            {term.finish for term in self.terms if term.finish is not None}
+        )
+
+    def of(self, datetime):
+        """Finds the term of the given datetime.
+
+        This behaves exactly like 'lass.schedule.models.Term.of': if the
+        datetime lies outside a term, the last term to start before it is
+        returned.
+
+        Args:
+            datetime: An aware datetime.
+
+        Returns:
+            The TermRecord of the term, or None if no term starts on or
+            before 'datetime'.
+        """
+        index = bisect.bisect_right(self.starts, datetime)
+        return self.terms[index - 1] if index else None
+
+    def next_boundary(self, datetime):
+        """Finds the first term start or finish after the given datetime.
+
+        Args:
+            datetime: An aware datetime.
+
+        Returns:
+            The aware datetime of the next boundary, or None if no term
+            starts or finishes after 'datetime'.
+        """
+        index = bisect.bisect_right(self.boundaries, datetime)
+        return self.boundaries[index] if index < len(self.boundaries) else None
+
+
+_table = None
+_loaded_at = None
+_lock = threading.Lock()
+
+
+def table():
+    """Returns the current term table, loading it if it is missing or
+    more than TABLE_MAX_AGE seconds old.
+
+    Returns:
+        A TermTable of every term in the database.
+
+    Raises:
+        sqlalchemy.exc.OperationalError: if the table needs loading and the
+            database is down.
+    """
+    global _table, _loaded_at
+
+    with _lock:
+        now = time.monotonic()
+        if _table is None or now - _loaded_at >= TABLE_MAX_AGE:
+            _table = TermTable(lass.schedule.models.Term.query.all())
+            _loaded_at = now
+        return _table
+
+
+def expires_at():
+    """Returns when, by 'time.monotonic', the current table will be
+    reloaded; None if no table is loaded.
+    """
+    with _lock:
+        return None if _loaded_at is None else _loaded_at + TABLE_MAX_AGE
+
+
+def invalidate():
+    """Forces the term table to be reloaded on its next use."""
+    global _table, _loaded_at
+
+    with _lock:
+        _table = None
+        _loaded_at = None
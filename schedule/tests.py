@@ -28,14 +28,37 @@ NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
+import collections
 import datetime
 import functools
 import operator
+import os
+import pyramid.httpexceptions
+import pyramid.testing
+import tempfile
+import time
+import transaction
 import unittest.mock
 
+import lass.common.benchmark
+import lass.common.jobs
 import lass.common.time
+import lass.common.view_helpers
+import lass.model_base
+import lass.music.models
+import lass.people.models
+import lass.schedule.benchmarks
 import lass.schedule.blocks
+import lass.schedule.feeds
+import lass.schedule.filler
+import lass.schedule.lists
 import lass.schedule.models
+import lass.schedule.records
+import lass.schedule.service
+import lass.schedule.table
+import lass.schedule.terms
+import lass.schedule.tracklist
+import lass.schedule.views
 
 
 TEST_BLOCK_CONFIG = {
@@ -183,6 +206,101 @@ def test_range_iter():
         assert iter_datetime.minute == minute
 
 
+#
+# lass.schedule.filler
+#
+
+
+TEST_FILLER = functools.partial(
+    lass.schedule.filler.FillerTimeslot,
+    template=lass.schedule.filler.make_template(
+        {'text': {'title': ['Filler']}},
+        {'name': 'Filler', 'type': 'filler'}
+    )
+)
+
+
+def test_filler_timeslot():
+    """Tests 'lass.schedule.filler.FillerTimeslot'."""
+    start = lass.common.time.aware_now()
+    a = TEST_FILLER(start, datetime.timedelta(hours=1))
+    b = TEST_FILLER(start, datetime.timedelta(hours=2))
+
+    assert a.text['title'][0] == 'Filler'
+    assert a.block['type'] == 'filler'
+    assert a.finish == start + datetime.timedelta(hours=1)
+    assert a.is_filler and a.is_collapsible
+
+    # Filler metadata is shared, so mustn't be changeable or copied.
+    assert a.text is b.text
+    assert not hasattr(a, '__dict__')
+    try:
+        a.text['title'] = ['Not filler']
+    except TypeError:
+        pass
+    else:
+        assert False, 'Filler metadata was modified.'
+
+    try:
+        a.image
+    except AttributeError:
+        pass
+    else:
+        assert False, 'Missing filler attributes should be AttributeErrors.'
+
+
+def test_fill():
+    """Tests 'lass.schedule.filler.fill'."""
+    start = lass.common.time.aware_now()
+    hour = datetime.timedelta(hours=1)
+    at = lambda hours: start + hours * hour
+    span = lambda slots: [
+        (slot.start, slot.duration, slot.is_filler) for slot in slots
+    ]
+
+    # An empty schedule should be one filler slot.
+    assert span(lass.schedule.filler.fill([], TEST_FILLER, at(0), at(5))) == [
+        (at(0), 5 * hour, True)
+    ]
+
+    a = lass.schedule.models.Timeslot(start=at(1), duration=hour)
+    b = lass.schedule.models.Timeslot(start=at(2), duration=hour)
+    c = lass.schedule.models.Timeslot(start=at(5), duration=hour)
+    filled = lass.schedule.filler.fill(
+        [a, b, TEST_FILLER(at(3), hour), TEST_FILLER(at(4), hour), c],
+        TEST_FILLER,
+        at(0),
+        at(8)
+    )
+    # Filling should be lazy.
+    assert not isinstance(filled, list)
+
+    # Existing filler should merge with the gaps around it.
+    expected = [
+        (at(0), hour, True),
+        (at(1), hour, False),
+        (at(2), hour, False),
+        (at(3), 2 * hour, True),
+        (at(5), hour, False),
+        (at(6), 2 * hour, True)
+    ]
+    filled = list(filled)
+    assert span(filled) == expected
+    assert span(
+        lass.schedule.filler.fill(filled, TEST_FILLER, at(0), at(8))
+    ) == expected
+
+    # Overlapping timeslots are an error.
+    overlap = lass.schedule.models.Timeslot(start=at(1), duration=2 * hour)
+    b.text = {'title': ['Overlapped']}
+    try:
+        list(lass.schedule.filler.fill([overlap, b], TEST_FILLER, at(0), at(4)))
+    except ValueError:
+        pass
+    else:
+        assert False, 'Overlapping timeslots were filled.'
+
+
 #
 # lass.schedule.models
 #
@@ -219,3 +337,581 @@ def test_show_schedule_seasons():
 
     show.seasons = [bad_season, good_season]
     assert show.scheduled_seasons == [good_season]
+
+
+#
+# lass.schedule.benchmarks
+#
+
+
+def test_benchmark_smoke():
+    """Runs the schedule benchmark once at its smallest scale, to make
+    sure the harness and the pipeline it drives still fit together.
+    """
+    results, info = lass.schedule.benchmarks.benchmark(
+        scales=['week'],
+        repeat=1
+    )
+
+    assert set(results) == {'week'}
+    assert set(results['week']) == set(lass.schedule.benchmarks.STAGES)
+    assert all(stage['n'] == 1 for stage in results['week'].values())
+
+    # The benchmark week contains a clock change; it should still have
+    # timeslots in it, and filling should never lose any.
+    slots, filled = info['slots']['week']
+    assert 0 < slots <= filled
+    assert info['rows']['Timeslot'] > 0
+
+
+def test_ical_text_and_fold():
+    """Tests iCalendar text escaping and content line folding."""
+    assert lass.schedule.feeds.ical_text('a;b,c\\d\ne') == (
+        'a\\;b\\,c\\\\d\\ne'
+    )
+
+    assert lass.schedule.feeds.fold('short') == 'short'
+    folded = lass.schedule.feeds.fold('SUMMARY:' + 'é' * 100)
+    lines = folded.split('\r\n')
+    assert all(len(line.encode('utf-8')) <= 75 for line in lines)
+    assert all(line.startswith(' ') for line in lines[1:])
+    assert ''.join(line[1:] for line in lines[1:]).startswith('é')
+    assert lines[0] + ''.join(line[1:] for line in lines[1:]) == (
+        'SUMMARY:' + 'é' * 100
+    )
+
+
+def test_feeds_sync():
+    """Tests that schedule feeds hand clients with a sync token only what
+    changed since, and only reload the timeslots that changed.
+    """
+    Timeslot = lass.schedule.models.Timeslot
+    benchmarks = lass.schedule.benchmarks
+
+    lass.schedule.feeds.SNAPSHOTS.clear()
+    lass.schedule.feeds.ENTRIES.clear()
+
+    with lass.common.benchmark.standin() as engine:
+        with lass.common.benchmark.site_config(benchmarks.CONFIG):
+            generator = benchmarks.Generator(engine, shows=10)
+            generator.populate()
+            time_context = generator.time_context
+            date = benchmarks.dst_week(generator.year, time_context)
+
+            def state():
+                lass.common.benchmark.reset_session()
+                return lass.schedule.feeds.state('week', date, time_context)
+
+            first_state = state()
+            first = lass.schedule.feeds.build(first_state)
+            assert first.full
+            assert first.removed == []
+            ids = [entry['id'] for entry in first.timeslots]
+            assert len(ids) > 2
+            assert ids == list(first_state.fingerprints)
+            assert all(
+                first.start < entry['finish'] and entry['start'] < first.finish
+                for entry in first.timeslots
+            )
+
+            # Nothing has changed, so nothing should be reloaded.
+            with unittest.mock.patch.object(Timeslot, 'annotate') as annotate:
+                second_state = state()
+                assert second_state.sync_token == first_state.sync_token
+                second = lass.schedule.feeds.build(
+                    second_state,
+                    first.sync_token
+                )
+                assert (second.full, second.timeslots, second.removed) == (
+                    False, [], []
+                )
+                assert lass.schedule.feeds.build(second_state).timeslots == (
+                    first.timeslots
+                )
+                assert not annotate.called
+
+            # Move one timeslot and delete another.
+            moved, deleted = ids[0], ids[1]
+            moved_to = first.timeslots[0]['start'] + datetime.timedelta(
+                minutes=30
+            )
+            table = Timeslot.__table__
+            engine.execute(
+                table.update().where(Timeslot.id == moved).values(
+                    {Timeslot.start.property.columns[0].name: moved_to}
+                )
+            )
+            engine.execute(table.delete().where(Timeslot.id == deleted))
+
+            third = lass.schedule.feeds.build(state(), first.sync_token)
+            assert third.sync_token != first.sync_token
+            assert not third.full
+            assert [entry['id'] for entry in third.timeslots] == [moved]
+            assert third.timeslots[0]['start'] == moved_to
+            assert third.removed == [deleted]
+
+            # Tokens are tied to their feeds; unknown ones get everything.
+            other = lass.schedule.feeds.state(
+                'day',
+                date,
+                time_context
+            )
+            assert lass.schedule.feeds.build(other, first.sync_token).full
+            third_state = state()
+            assert lass.schedule.feeds.build(third_state, 'x').full
+
+            document = lass.schedule.feeds.to_ical(
+                lass.schedule.feeds.build(third_state),
+                lambda timeslot_id: '/timeslots/{}'.format(timeslot_id),
+                'example.org'
+            )
+            assert document.startswith('BEGIN:VCALENDAR\r\n')
+            assert document.endswith('END:VCALENDAR\r\n')
+            assert document.count('BEGIN:VEVENT') == len(ids) - 1
+            assert 'UID:timeslot-{}@example.org'.format(moved) in document
+
+            json_feed = lass.schedule.feeds.to_json(
+                third,
+                lambda timeslot_id: '/timeslots/{}'.format(timeslot_id)
+            )
+            assert json_feed['timeslots'][0]['url'] == '/timeslots/{}'.format(
+                moved
+            )
+            assert json_feed['removed'] == [deleted]
+
+
+def make_terms(now):
+    """Makes a term either side of 'now', and one containing it."""
+    TermRecord = lass.schedule.terms.TermRecord
+    week = datetime.timedelta(weeks=1)
+    return [
+        TermRecord(3, now + 2 * week, now + 12 * week, 'spring'),
+        TermRecord(1, now - 24 * week, now - 14 * week, 'summer'),
+        TermRecord(2, now - week, now + week, 'autumn')
+    ]
+
+
+def test_term_table():
+    """Tests the bisecting term table."""
+    now = lass.common.time.aware_now()
+    day = datetime.timedelta(days=1)
+    table = lass.schedule.terms.TermTable(make_terms(now))
+
+    assert [term.id for term in table.terms] == [1, 2, 3]
+    assert table.of(now - 200 * day) is None
+    assert table.of(now).id == 2
+    # Outside a term, the last term to start is used.
+    assert table.of(now + 10 * day).id == 2
+    assert table.of(now + 14 * day).id == 3
+    assert table.of(now + 1000 * day).id == 3
+
+    assert table.next_boundary(now) == now + 7 * day
+    assert table.next_boundary(now + 7 * day) == now + 14 * day
+    assert table.next_boundary(now + 1000 * day) is None
+
+
+def test_service_type():
+    """Tests the term-based service types."""
+    now = lass.common.time.aware_now()
+    summer, autumn, _ = sorted(make_terms(now), key=operator.attrgetter('id'))
+    service_type = lass.schedule.service.service_type
+
+    assert service_type(now, autumn, {}) == 'normal'
+    assert service_type(now, summer, {}) == 'down'
+    assert service_type(now, autumn._replace(finish=now), {}) == 'sustainer'
+    # Overrides only apply to the current service type.
+    assert service_type(None, autumn, {'service_type': 'down'}) == 'down'
+    assert service_type(now, autumn, {'service_type': 'down'}) == 'normal'
+
+
+def test_service_current():
+    """Tests that the shared service state is only recomputed when a term
+    boundary passes or the configuration changes.
+    """
+    now = lass.common.time.aware_now()
+    table = lass.schedule.terms.TermTable(make_terms(now))
+    config = {}
+
+    lass.schedule.service.invalidate()
+    with unittest.mock.patch(
+        'lass.schedule.terms.table',
+        return_value=table
+    ) as table_function, unittest.mock.patch(
+        'lass.schedule.service.read_config',
+        side_effect=lambda: config
+    ):
+        state = lass.schedule.service.current(now)
+        assert state.term.id == 2
+        assert state.service_type == 'normal'
+        assert state.programming_available
+        assert lass.schedule.service.current(now) is state
+        assert table_function.call_count == 1
+
+        # The autumn term finishes a week from now.
+        week_later = now + datetime.timedelta(weeks=1)
+        later = lass.schedule.service.current(week_later)
+        assert later is not state
+        assert lass.schedule.service.current(week_later) is later
+
+        config = {'service_type': 'down'}
+        overridden = lass.schedule.service.current(week_later)
+        assert overridden is not later
+        assert overridden.service_type == 'down'
+        assert not overridden.can_listen
+    lass.schedule.service.invalidate()
+
+
+def test_tracklists():
+    """Tests bulk tracklist loading, and that only the tracklists of
+    finished timeslots are kept for good.
+    """
+    music = lass.music.models
+    row = lass.common.benchmark.row
+    now = lass.common.time.aware_now()
+    played = datetime.datetime(2013, 10, 7, 9)
+    Slot = collections.namedtuple('Slot', 'id finish')
+    hour = datetime.timedelta(hours=1)
+    past, live, silent = Slot(1, now), Slot(2, now + hour), Slot(3, now)
+
+    def listing(listing_id, timeslot_id, minute, state_id=None):
+        return row(
+            music.TrackListing,
+            id=listing_id,
+            source_id='b',
+            state_id=state_id,
+            timeslotid=timeslot_id,
+            timestart=played + datetime.timedelta(minutes=minute)
+        )
+
+    def custom(listing_id, track):
+        return row(
+            music.TrackListingCustomTrack,
+            audiologid=listing_id,
+            track=track,
+            artist='Artist',
+            album='Album'
+        )
+
+    with lass.common.benchmark.standin() as engine:
+        insert = functools.partial(lass.common.benchmark.insert, engine)
+        insert(music.Record, [row(
+            music.Record,
+            id=1,
+            status_id='o',
+            medium_id='c',
+            format_id='a',
+            memberid_add=1,
+            title='Record',
+            artist='Artist',
+            recordlabel='Label',
+            dateadded=played,
+            shelfnumber=1,
+            shelfletter='A'
+        )])
+        insert(music.Track, [row(
+            music.Track,
+            id=1,
+            clean='y',
+            recordid=1,
+            artist='Artist',
+            digitised=True,
+            lastfm_verified=False,
+            genre='p',
+            intro=datetime.time(0, 0, 10),
+            length=datetime.time(0, 3),
+            number=1,
+            title='Library'
+        )])
+        insert(music.TrackListing, [
+            listing(1, past.id, 10),
+            listing(2, past.id, 5),
+            listing(3, past.id, 15, state_id='d'),
+            listing(4, live.id, 0)
+        ])
+        insert(music.TrackListingLibraryTrack, [row(
+            music.TrackListingLibraryTrack,
+            audiologid=1,
+            recordid=1,
+            trackid=1
+        )])
+        insert(music.TrackListingCustomTrack, [
+            custom(2, 'Custom'),
+            custom(3, 'Deleted'),
+            custom(4, 'Live')
+        ])
+
+        cache = lass.schedule.tracklist.Cache()
+        with unittest.mock.patch(
+            'lass.schedule.tracklist.load',
+            wraps=lass.schedule.tracklist.load
+        ) as load:
+            tracklists = lass.schedule.tracklist.tracklists(
+                [past, live, silent],
+                cache
+            )
+            assert load.call_count == 1
+
+            assert [track.track for track in tracklists[past.id]] == [
+                'Custom',
+                'Library'
+            ]
+            assert tracklists[past.id][1].record == 'Record'
+            assert tracklists[live.id][0] == lass.schedule.tracklist.Track(
+                'Live',
+                'Artist',
+                'Album',
+                played
+            )
+            assert tracklists[silent.id] == []
+
+            # Finished timeslots are kept far longer than live ones, but
+            # not for good.
+            later = time.monotonic() + lass.schedule.tracklist.LIVE_MAX_AGE
+            assert cache.get(past.id, now=later) is not None
+            assert cache.get(silent.id, now=later) == ()
+            assert cache.get(live.id) is not None
+            assert cache.get(live.id, now=later) is None
+
+            again = lass.schedule.tracklist.tracklists([past, silent], cache)
+            assert again == {past.id: tracklists[past.id], silent.id: []}
+            assert load.call_count == 1
+
+            assert cache.get(past.id, now=float('inf')) is None
+
+
+#
+# lass.schedule.records
+#
+
+
+def test_records_match_timeslots():
+    """Tests that timeslot records render like annotated Timeslots."""
+    benchmarks = lass.schedule.benchmarks
+    lists = lass.schedule.lists
+
+    def summary(slots):
+        return [
+            (
+                getattr(slot, 'id', None),
+                slot.start,
+                slot.finish,
+                slot.is_filler,
+                slot.is_collapsible,
+                {key: list(values) for key, values in slot.text.items()},
+                {key: list(values) for key, values in slot.image.items()},
+                slot.block,
+                sorted(
+                    (credit.type.name, credit.person.id)
+                    for credit in getattr(slot, 'credits', ())
+                )
+            )
+            for slot in slots
+        ]
+
+    with lass.common.benchmark.standin() as engine:
+        with lass.common.benchmark.site_config(benchmarks.CONFIG):
+            generator = benchmarks.Generator(engine, shows=10)
+            generator.populate()
+            time_context = generator.time_context
+            start = time_context.start_on(
+                benchmarks.dst_week(generator.year, time_context)
+            )
+            finish = start + datetime.timedelta(weeks=1)
+            source = lass.schedule.models.Timeslot.public
+
+            timeslots = lists.process(
+                lists.from_to(source(), start, finish),
+                start,
+                finish
+            )
+            records = lists.process_records(
+                lists.records_from_to(source(), start, finish),
+                start,
+                finish
+            )
+            assert summary(records) == summary(timeslots)
+            assert all(
+                isinstance(record, lass.schedule.records.TimeslotRecord)
+                for record in records
+                if not record.is_filler
+            )
+            assert any(
+                'Special episode' in record.text['title']
+                for record in records
+            )
+
+            # Records of a show share its metadata.
+            by_show = collections.defaultdict(set)
+            for record in records:
+                if not record.is_filler:
+                    by_show[record.show.id].add(id(record.image))
+            assert all(len(images) == 1 for images in by_show.values())
+
+            def table(slots):
+                return [
+                    (
+                        row['start'],
+                        [
+                            None if cell is None else (
+                                getattr(cell[0], 'id', None),
+                                cell[0].start,
+                                cell[1]
+                            )
+                            for cell in row['days']
+                        ]
+                    )
+                    for row in lass.schedule.table.tabulate(
+                        start,
+                        slots,
+                        time_context
+                    )
+                ]
+            assert table(records) == table(timeslots)
+
+            # The shared now/next list matches the unshared one.
+            upcoming = lists.Schedule(
+                functools.partial(lists.shared_next, count=10),
+                processor=None,
+                start=start
+            )
+            assert summary(upcoming.timeslots) == summary(
+                lists.process_records(
+                    lists.records_next(source(), start, None, 10),
+                    start,
+                    upcoming.finish
+                )
+            )
+            assert any(not slot.is_filler for slot in upcoming.timeslots)
+
+
+def test_version_token_follows_schedule():
+    """Tests that page versions change when shows start and finish, as
+    every page shows what is on air.
+    """
+    benchmarks = lass.schedule.benchmarks
+    models = lass.schedule.models
+    token = lass.common.view_helpers.version_token
+
+    with lass.common.benchmark.standin() as engine:
+        with lass.common.benchmark.site_config(benchmarks.CONFIG):
+            generator = benchmarks.Generator(engine, shows=10)
+            generator.populate()
+            timeslot = models.Timeslot.public().order_by(
+                models.Timeslot.start
+            ).first()
+            show_id = timeslot.season.show.id
+            start, finish = timeslot.start, timeslot.finish
+            second = datetime.timedelta(seconds=1)
+
+            during = {
+                token(models.Show, show_id, now=when)
+                for when in (start, finish - second)
+            }
+            assert len(during) == 1
+            assert token(models.Show, show_id, now=start - second) not in (
+                during
+            )
+            assert token(models.Show, show_id, now=finish + second) not in (
+                during
+            )
+
+
+#
+# lass.schedule.views
+#
+
+
+def test_message():
+    """Tests sending a message to the current show, inline and through the
+    job queue.
+    """
+    benchmarks = lass.schedule.benchmarks
+    models = lass.schedule.models
+    config = dict(
+        benchmarks.CONFIG,
+        **{
+            'sitewide/message': {
+                'spam': ['Spam'],
+                'warns': [{'triggers': ['password'], 'messages': 'Careful!'}]
+            }
+        }
+    )
+
+    def send(comments, earlier_writes=()):
+        request = pyramid.testing.DummyRequest(
+            params={'comments': comments},
+            client_addr='127.0.0.1'
+        )
+        # Requests run in (and commit) a transaction of their own.
+        try:
+            with transaction.manager:
+                lass.model_base.DBSession.add_all(earlier_writes)
+                response = lass.schedule.views.message(request)
+        except pyramid.httpexceptions.HTTPSeeOther as redirect:
+            response = redirect
+        return response.location.rpartition('=')[2]
+
+    def messages():
+        lass.common.benchmark.reset_session()
+        return [
+            message.content
+            for message in lass.model_base.DBSession.query(
+                models.Message
+            ).order_by(models.Message.id)
+        ]
+
+    pyramid.testing.setUp().add_route('home', '/')
+    try:
+        with lass.common.benchmark.standin() as engine:
+            with lass.common.benchmark.site_config(config):
+                generator = benchmarks.Generator(engine, shows=10)
+                generator.populate()
+                timeslot = models.Timeslot.public().order_by(
+                    models.Timeslot.start
+                ).first()
+                start = timeslot.start
+                lass.common.benchmark.reset_session()
+
+                with unittest.mock.patch(
+                    'lass.common.time.aware_now',
+                    return_value=start + datetime.timedelta(minutes=30)
+                ):
+                    assert send('Hello') == 'index'
+                    assert send('More Spam') == 'spam'
+                    assert send('My password is...') == 'index'
+                    assert messages() == [
+                        'Hello',
+                        '<div class="ui-state-highlight"><span>Careful!'
+                        '</span></div>My password is...'
+                    ]
+
+                    # Inline delivery joins the request's transaction, so
+                    # the request's other writes survive it.
+                    person = lass.people.models.Person(id=10000)
+                    assert send('Again', earlier_writes=[person]) == 'index'
+                    assert messages()[2:] == ['Again']
+                    assert lass.model_base.DBSession.query(
+                        lass.people.models.Person
+                    ).get(10000) is not None
+
+                    with tempfile.TemporaryDirectory() as directory:
+                        queue = lass.common.jobs.configure(
+                            {'lass.jobs.path': os.path.join(directory, 'q')}
+                        )
+                        try:
+                            assert send('Queued') == 'index'
+                            assert send('Queued') == 'index'
+                            assert len(messages()) == 3
+                            worker = lass.common.jobs.Worker(queue)
+                            assert worker.run_due() == 1
+                        finally:
+                            lass.common.jobs.configure({})
+                    assert messages()[3:] == ['Queued']
+
+                with unittest.mock.patch(
+                    'lass.common.time.aware_now',
+                    return_value=start - datetime.timedelta(minutes=30)
+                ):
+                    assert send('Too early') == 'no_msg'
+    finally:
+        pyramid.testing.tearDown()
@@ -0,0 +1,222 @@
+"""Bulk loading and caching of timeslot tracklists.
+
+Tracklists for any number of timeslots are loaded in one query.  Once a
+timeslot has finished, its tracklist rarely changes, so it is kept for
+FINISHED_MAX_AGE seconds (or until it is the least recently used of
+MAX_CACHED tracklists); this still lets late corrections, such as tracks
+being deleted from a tracklist, show up eventually.  Tracklists of
+timeslots still on air are only kept for LIVE_MAX_AGE seconds.
+
+---
+
+Copyright (c) 2013, University Radio York.
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimer in the
+  documentation and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import collections
+import threading
+import time
+
+import sqlalchemy
+
+import lass.common.time
+import lass.model_base
+import lass.music.models
+
+
+# How long, in seconds, to keep the tracklist of a timeslot yet to finish.
+LIVE_MAX_AGE = 30
+
+# How long, in seconds, to keep the tracklist of a finished timeslot.
+FINISHED_MAX_AGE = 60 * 60
+
+# How many tracklists to keep at most.
+MAX_CACHED = 5000
+
+
+Track = collections.namedtuple('Track', 'track artist record played_at')
+Track.__doc__ = """One item of a tracklist, as shown on timeslot pages."""
+
+
+def query(timeslot_ids):
+    """Constructs a query for the tracklists of many timeslots at once.
+
+    Both tracks from the record library and tracks entered by hand are
+    selected; deleted and omitted tracklist entries are not.
+
+    Args:
+        timeslot_ids: The IDs of the timeslots.
+
+    Returns:
+        A query returning (timeslot ID, track, artist, record, played at)
+        tuples, ordered by timeslot and then by time played.
+    """
+    music = lass.music.models
+
+    in_library = lass.model_base.DBSession.query(
+        music.TrackListing.timeslotid.label('timeslot_id'),
+        music.Track.title.label('track'),
+        music.Track.artist.label('artist'),
+        music.Record.title.label('record'),
+        music.TrackListing.timestart.label('played_at')
+    ).select_from(
+        music.TrackListing
+    ).join(
+        music.TrackListingLibraryTrack,
+        music.TrackListingLibraryTrack.track,
+        music.TrackListingLibraryTrack.record
+    )
+
+    out_library = lass.model_base.DBSession.query(
+        music.TrackListing.timeslotid.label('timeslot_id'),
+        music.TrackListingCustomTrack.track.label('track'),
+        music.TrackListingCustomTrack.artist.label('artist'),
+        music.TrackListingCustomTrack.album.label('record'),
+        music.TrackListing.timestart.label('played_at')
+    ).select_from(
+        music.TrackListing
+    ).join(
+        music.TrackListingCustomTrack
+    )
+
+    return tracklist_filter(in_library, timeslot_ids).union(
+        tracklist_filter(out_library, timeslot_ids)
+    ).order_by(
+        sqlalchemy.asc('timeslot_id'),
+        sqlalchemy.asc('played_at')
+    )
+
+
+def tracklist_filter(query, timeslot_ids):
+    """Performs filtering for the tracklist mini-queries."""
+    TrackListing = lass.music.models.TrackListing
+    return query.filter(
+        TrackListing.timeslotid.in_(timeslot_ids) &
+        (
+            (TrackListing.state_id == None) |
+            (~TrackListing.state_id.in_(['o', 'd']))
+        )
+    )
+
+
+def load(timeslot_ids):
+    """Loads the tracklists of many timeslots, bypassing the cache.
+
+    Args:
+        timeslot_ids: The IDs of the timeslots.
+
+    Returns:
+        A dict mapping each of the IDs to a tuple of Tracks, in the order
+        they were played.
+    """
+    tracklists = {timeslot_id: [] for timeslot_id in timeslot_ids}
+    if tracklists:
+        for row in query(list(tracklists)):
+            tracklists[row.timeslot_id].append(Track(*row[1:]))
+    return {
+        timeslot_id: tuple(tracks)
+        for timeslot_id, tracks in tracklists.items()
+    }
+
+
+class Cache(object):
+    """A bounded, least-recently-used store of tracklists by timeslot ID.
+
+    Each tracklist has an expiry time by 'time.monotonic', or None if it
+    is kept until it drops out of the store.
+    """
+    def __init__(self, max_entries=MAX_CACHED):
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, timeslot_id, now=None):
+        """Retrieves the unexpired tracklist of a timeslot, or None."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            entry = self.entries.get(timeslot_id)
+            if entry is not None:
+                tracks, expires = entry
+                if expires is not None and expires <= now:
+                    del self.entries[timeslot_id]
+                    entry = None
+                else:
+                    self.entries.move_to_end(timeslot_id)
+        return None if entry is None else entry[0]
+
+    def put(self, timeslot_id, tracks, expires=None):
+        """Stores a tracklist, dropping the least recently used if full."""
+        with self.lock:
+            self.entries[timeslot_id] = (tracks, expires)
+            self.entries.move_to_end(timeslot_id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        """Drops every tracklist."""
+        with self.lock:
+            self.entries.clear()
+
+
+CACHE = Cache()
+
+
+def tracklists(timeslots, cache=CACHE):
+    """Retrieves the tracklists of many timeslots.
+
+    Tracklists missing from the cache are loaded in one query, and cached.
+
+    Args:
+        timeslots: The timeslots, which need only have 'id' and 'finish'
+            attributes.
+        cache: The Cache to use.  (Default: CACHE.)
+
+    Returns:
+        A dict mapping the ID of each timeslot to a new list of Tracks
+        (named tuples of track, artist, record and played_at), in the
+        order they were played.
+    """
+    found = {timeslot.id: cache.get(timeslot.id) for timeslot in timeslots}
+    missing = [
+        timeslot for timeslot in timeslots if found[timeslot.id] is None
+    ]
+
+    if missing:
+        loaded = load([timeslot.id for timeslot in missing])
+
+        now = lass.common.time.aware_now()
+        stored_at = time.monotonic()
+        for timeslot in missing:
+            found[timeslot.id] = loaded[timeslot.id]
+            cache.put(
+                timeslot.id,
+                loaded[timeslot.id],
+                stored_at + (
+                    FINISHED_MAX_AGE if timeslot.finish <= now
+                    else LIVE_MAX_AGE
+                )
+            )
+
+    return {timeslot_id: list(tracks) for timeslot_id, tracks in found.items()}
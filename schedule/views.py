@@ -29,13 +29,21 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 import datetime
 import functools
+import hashlib
 import operator
 import pyramid
 import sqlalchemy
 
+import lass.common.config
+import lass.common.jobs
+import lass.common.time
 import lass.credits.query
 import lass.model_base
+import lass.music.models
+import lass.schedule.feeds
+import lass.schedule.lists
 import lass.schedule.models
+import lass.schedule.tracklist
 
 
 #
@@ -94,7 +102,17 @@ def show_detail(request):
         source=lass.schedule.models.Show,
         constraint=operator.attrgetter('type.is_public'),
         query_options=(sqlalchemy.orm.joinedload('seasons', 'timeslots'),),
-        target_name='show'
+        target_name='show',
+        version_sources=(
+            functools.partial(
+                timeslots_version,
+                lambda show_id: lass.schedule.models.Timeslot.season_id.in_(
+                    sqlalchemy.select([lass.schedule.models.Season.id]).where(
+                        lass.schedule.models.Season.show_id == show_id
+                    )
+                )
+            ),
+        )
     )
 
 
@@ -106,15 +124,70 @@ def season_detail(request):
     """Displays detail about a season.
 
     This view expects the season's timeslots to be listed, and thus these are
-    eagerly loaded.
+    eagerly loaded, as are their tracklists.
     """
-    return lass.common.view_helpers.detail(
+    result = lass.common.view_helpers.detail(
         request,
         id_name='seasonid',
         source=lass.schedule.models.Season,
         constraint=operator.attrgetter('show.type.is_public'),
         query_options=(sqlalchemy.orm.joinedload('timeslots'),),
-        target_name='season'
+        target_name='season',
+        version_sources=(
+            functools.partial(
+                timeslots_version,
+                lambda season_id: (
+                    lass.schedule.models.Timeslot.season_id == season_id
+                )
+            ),
+            tracklists_version
+        )
+    )
+    if isinstance(result, dict):
+        # Load every timeslot's tracklist in one go, rather than one query
+        # per timeslot when the template gets to it.
+        lass.schedule.tracklist.tracklists(result['season'].timeslots)
+    return result
+
+
+def timeslots_version(condition, item_id, now):
+    """Selects the version information of the timeslots listed on a show
+    or season page, for 'lass.common.view_helpers.version_token'.
+
+    Args:
+        condition: A function taking the item ID and returning a filter
+            selecting the timeslots listed on the item's page.
+        item_id: The ID of the show or season.
+        now: The current time; the timeslots that have finished by then
+            are counted, as the page lists past and future ones apart.
+    """
+    Timeslot = lass.schedule.models.Timeslot
+    return sqlalchemy.select([
+        sqlalchemy.func.max(Timeslot.start).label('latest_from'),
+        sqlalchemy.func.max(Timeslot.finish).label('latest_to'),
+        sqlalchemy.func.count().label('rows'),
+        sqlalchemy.func.count(
+            sqlalchemy.case([(Timeslot.finish <= now, 1)])
+        ).label('active')
+    ]).where(condition(item_id))
+
+
+def tracklists_version(season_id, _):
+    """Selects the version information of the tracklists listed on a season
+    page, for 'lass.common.view_helpers.version_token'.
+    """
+    TrackListing = lass.music.models.TrackListing
+    return sqlalchemy.select([
+        sqlalchemy.func.max(TrackListing.timestart).label('latest_from'),
+        sqlalchemy.func.max(TrackListing.timestop).label('latest_to'),
+        sqlalchemy.func.count().label('rows'),
+        sqlalchemy.literal(0).label('active')
+    ]).where(
+        TrackListing.timeslotid.in_(
+            sqlalchemy.select([lass.schedule.models.Timeslot.id]).where(
+                lass.schedule.models.Timeslot.season_id == season_id
+            )
+        )
     )
 
 
@@ -129,7 +202,52 @@ def timeslot_detail(request):
         id_name='timeslotid',
         source=lass.schedule.models.Timeslot,
         constraint=operator.attrgetter('season.show.type.is_public'),
-        target_name='timeslot'
+        target_name='timeslot',
+        # Timeslots inherit their season's and show's metadata and credits.
+        version_sources=[
+            functools.partial(inherited_version, attached, parent_id)
+            for attached, parent_id in (
+                (lass.schedule.models.SeasonText, season_id_of),
+                (lass.schedule.models.SeasonImage, season_id_of),
+                (lass.schedule.models.ShowText, show_id_of),
+                (lass.schedule.models.ShowImage, show_id_of),
+                (lass.schedule.models.ShowCredit, show_id_of)
+            )
+        ]
+    )
+
+
+def season_id_of(timeslot_id):
+    """Selects the ID of the season of a timeslot."""
+    Timeslot = lass.schedule.models.Timeslot
+    return sqlalchemy.select([Timeslot.season_id]).where(
+        Timeslot.id == timeslot_id
+    )
+
+
+def show_id_of(timeslot_id):
+    """Selects the ID of the show of a timeslot."""
+    Season = lass.schedule.models.Season
+    return sqlalchemy.select([Season.show_id]).where(
+        Season.id == season_id_of(timeslot_id).as_scalar()
+    )
+
+
+def inherited_version(attached, parent_id, timeslot_id, now):
+    """Selects the version information of metadata or credits a timeslot
+    inherits, for 'lass.common.view_helpers.version_token'.
+
+    Args:
+        attached: The attachable model of the inherited items.
+        parent_id: A function taking the timeslot ID and selecting the ID
+            of the item the timeslot inherits from.
+        timeslot_id: The ID of the timeslot.
+        now: The current time.
+    """
+    return lass.common.view_helpers.attached_version(
+        attached,
+        parent_id(timeslot_id).as_scalar(),
+        now
     )
 
 
@@ -282,7 +400,8 @@ def schedule_view(request, start_date, duration, time_context):
         'finish': finish,
         'duration': true_duration,
         'schedule': lass.schedule.lists.Schedule(
-            creator=lass.schedule.lists.from_to,
+            creator=lass.schedule.lists.records_from_to,
+            processor=lass.schedule.lists.process_records,
             start=start,
             finish=finish
         )
@@ -293,6 +412,106 @@ day = functools.partial(schedule_view, duration=datetime.timedelta(days=1))
 week = functools.partial(schedule_view, duration=datetime.timedelta(weeks=1))
 
 
+#
+# FEEDS
+#
+
+
+@pyramid.view.view_config(
+    route_name='schedule-feed',
+    match_param='format=json',
+    renderer='json'
+)
+def json_feed(request):
+    """Serves a schedule feed as JSON.
+
+    Clients should pass the sync token they were last given as the
+    'sync_token' parameter, and will then receive only the timeslots that
+    changed since (see 'lass.schedule.feeds').
+    """
+    feed_state = feed_state_for(request)
+    not_modified = lass.common.view_helpers.conditional(
+        request,
+        feed_state.sync_token,
+        lass.schedule.feeds.FEED_MAX_AGE
+    )
+    if not_modified:
+        return not_modified
+
+    return lass.schedule.feeds.to_json(
+        lass.schedule.feeds.build(
+            feed_state,
+            request.params.get('sync_token')
+        ),
+        functools.partial(timeslot_url, request)
+    )
+
+
+@pyramid.view.view_config(
+    route_name='schedule-feed',
+    match_param='format=ics'
+)
+def ical_feed(request):
+    """Serves a schedule feed as an iCalendar document.
+
+    Calendar clients cannot apply incremental changes, so this is always
+    the full feed; its ETag lets them revalidate cheaply instead.
+    """
+    feed_state = feed_state_for(request)
+    not_modified = lass.common.view_helpers.conditional(
+        request,
+        feed_state.sync_token,
+        lass.schedule.feeds.FEED_MAX_AGE
+    )
+    if not_modified:
+        return not_modified
+
+    response = request.response
+    response.content_type = 'text/calendar'
+    response.charset = 'utf-8'
+    response.text = lass.schedule.feeds.to_ical(
+        lass.schedule.feeds.build(feed_state),
+        functools.partial(timeslot_url, request),
+        request.host.split(':')[0]
+    )
+    return response
+
+
+def feed_state_for(request):
+    """Works out the state of the schedule feed a request asks for.
+
+    The route must provide 'range', one of 'lass.schedule.feeds.RANGES';
+    the optional 'date' parameter (YYYY-MM-DD) picks the date the feed
+    contains, defaulting to today.
+    """
+    time_context = lass.common.time.context_from_config()
+
+    raw_date = request.params.get('date')
+    if raw_date is None:
+        date = time_context.schedule_date_of(time_context.local_now())
+    else:
+        try:
+            date = datetime.datetime.strptime(raw_date, '%Y-%m-%d').date()
+        except ValueError:
+            raise pyramid.exceptions.NotFound(
+                'Invalid date: {}'.format(raw_date)
+            )
+
+    try:
+        return lass.schedule.feeds.state(
+            request.matchdict['range'],
+            date,
+            time_context
+        )
+    except LookupError as error:
+        raise pyramid.exceptions.NotFound(str(error))
+
+
+def timeslot_url(request, timeslot_id):
+    """Returns the URL of a timeslot's page."""
+    return request.route_url('schedule-timeslot-detail', timeslotid=timeslot_id)
+
+
 
 @pyramid.view.view_config(
     route_name='schedule-message',
@@ -303,9 +522,10 @@ def message(request):
     """
     Sends a message to the current show via the website.
 
+    The message is delivered by a job (see 'deliver_message'), so that
+    sending it does not wait on the database.
     """
-    # Current show
-    timeslot = lass.schedule.lists.next(1)[0]
+    now = lass.common.time.aware_now()
 
     # All redirects throw the user back at the index, with a query string set to
     # let the template know what the result of the message send was.
@@ -314,12 +534,24 @@ def message(request):
     # error/OK pages instead of redirects!
     redirect = lambda r: pyramid.httpexceptions.HTTPSeeOther(
         location=request.route_url(
-            'index',
+            'home',
             _query={'msg_result': r}
         )
     )
 
-    if not timeslot.can_be_messaged():
+    # Current show
+    timeslots = lass.schedule.lists.next(
+        lass.schedule.models.Timeslot.public(),
+        now,
+        None,
+        1
+    )
+    timeslot = timeslots[0] if timeslots else None
+    if (
+        timeslot is None or
+        now < timeslot.start or
+        not timeslot.can_be_messaged
+    ):
         raise redirect('no_msg')
 
     message = request.params['comments']
@@ -343,20 +575,51 @@ def message(request):
                 )
             )
     message_parts.append(message)
-    message = ''.join(message_parts.reverse())
-
-    message_comm = lass.schedule.models.Message(
-        commtypeid=3,  # Website communication
-        sender='URY Website',
-        timeslotid=timeslot.id,
-        subject=message[:255],
+    message = ''.join(message_parts)
+
+    # Resubmitting the form should not send the message twice.
+    key = hashlib.sha1(
+        '\0'.join(
+            ('message', str(timeslot.id), request.client_addr or '', message)
+        ).encode('utf-8')
+    ).hexdigest()
+    lass.common.jobs.enqueue(
+        'schedule.message',
+        key=key,
+        timeslot_id=timeslot.id,
         content=message,
-        date=lass.common.time.aware_now(),
-        statusid=1,  # Unread
-        comm_source=request.client_addr
+        date=now.timestamp(),
+        source=request.client_addr
     )
-    lass.DBSession.add(message_comm)
-    lass.DBSession.commit()
 
     result = redirect('index')
     return result
+
+
+@lass.common.jobs.handler('schedule.message')
+def deliver_message(timeslot_id, content, date, source):
+    """Job handler that stores a listener message in the SIS
+    communication system.
+
+    Args:
+        timeslot_id: The ID of the timeslot the message is for.
+        content: The message.
+        date: The time the message was sent, as a POSIX timestamp.
+        source: The address the message was sent from.
+    """
+    with lass.common.jobs.job_transaction():
+        lass.model_base.DBSession.add(
+            lass.schedule.models.Message(
+                commtypeid=3,  # Website communication
+                sender='URY Website',
+                timeslotid=timeslot_id,
+                subject=content[:255],
+                content=content,
+                date=datetime.datetime.fromtimestamp(
+                    date,
+                    datetime.timezone.utc
+                ),
+                statusid=1,  # Unread
+                comm_source=source
+            )
+        )
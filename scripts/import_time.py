@@ -0,0 +1,89 @@
+"""Script for auditing how long the website takes to import.
+
+Imports a module (by default, the whole website) in fresh interpreters
+under '-X importtime' and lists the slowest modules imported.  Exits
+with status 1 if the import is over budget or imports a module that
+should only be imported lazily; see 'lass.common.import_time'.
+
+---
+
+Copyright (c) 2013, University Radio York.
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimer in the
+  documentation and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import argparse
+import sys
+
+import lass.common.import_time
+
+
+def main(argv=sys.argv):
+    parser = argparse.ArgumentParser(
+        prog='lass.scripts.import_time',
+        description='Reports the import time of the website.'
+    )
+    parser.add_argument('module', nargs='?', default='lass')
+    parser.add_argument(
+        '--runs',
+        type=int,
+        default=3,
+        help='timed runs to take the fastest of (default: 3)'
+    )
+    parser.add_argument(
+        '--limit',
+        type=int,
+        default=20,
+        help='number of modules to list (default: 20)'
+    )
+    parser.add_argument(
+        '--budget',
+        type=float,
+        default=lass.common.import_time.BUDGET,
+        help='most seconds the import may take (default: %(default)s)'
+    )
+    args = parser.parse_args(argv[1:])
+
+    timings = lass.common.import_time.measure(args.module, args.runs)
+    for line in lass.common.import_time.report(timings, args.limit):
+        print(line)
+
+    total = timings[args.module].cumulative
+    deferred = lass.common.import_time.deferred_imports(timings)
+    print()
+    print('{} imported {} modules in {:.3f}s (budget {:.3f}s).'.format(
+        args.module,
+        len(timings),
+        total,
+        args.budget
+    ))
+    if deferred:
+        print('Imported modules meant to be lazy: {}'.format(
+            ', '.join(deferred)
+        ))
+    return 1 if total > args.budget or deferred else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
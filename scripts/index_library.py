@@ -0,0 +1,88 @@
+"""Script for building and updating the music library search index.
+
+Run this periodically (or with '--interval') to keep the index used by
+'lass.music.search' up to date, or with '--rebuild' to start it afresh.
+
+---
+
+Copyright (c) 2013, University Radio York.
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimer in the
+  documentation and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import argparse
+import sys
+import time
+
+import pyramid.paster
+
+import lass.common.database
+import lass.model_base
+import lass.music.search
+
+
+
+def main(argv=sys.argv):
+    parser = argparse.ArgumentParser(
+        prog='lass.scripts.index_library',
+        description='Builds and updates the music library search index.'
+    )
+    parser.add_argument('config_uri', help='for example, development.ini')
+    parser.add_argument(
+        '--rebuild',
+        action='store_true',
+        help='throw the index away and build it from scratch first'
+    )
+    parser.add_argument(
+        '--interval',
+        type=float,
+        default=0,
+        help='seconds between updates; if 0, update once (default: 0)'
+    )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=lass.music.search.BATCH_SIZE
+    )
+    args = parser.parse_args(argv[1:])
+
+    pyramid.paster.setup_logging(args.config_uri)
+    settings = pyramid.paster.get_appsettings(args.config_uri)
+    engine = lass.common.database.engine_from_settings(settings)
+    lass.model_base.DBSession.configure(bind=engine)
+
+    if args.rebuild:
+        lass.music.search.rebuild(args.batch_size)
+
+    while True:
+        started = time.monotonic()
+        lass.music.search.update(args.batch_size)
+
+        if not args.interval:
+            break
+        time.sleep(max(0, args.interval - (time.monotonic() - started)))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
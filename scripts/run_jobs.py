@@ -0,0 +1,123 @@
+"""Job worker for the website's job queue.
+
+Runs the jobs the website enqueues on 'lass.common.jobs' (delivering
+listener messages, subscribing new members to their interests, fetching
+blogs), retrying failed ones with backoff.  Run one or more of these
+alongside the website, with the same configuration file, which must set
+'lass.jobs.path'.
+
+---
+
+Copyright (c) 2013, University Radio York.
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimer in the
+  documentation and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import argparse
+import importlib
+import logging
+import sys
+import time
+
+import pyramid.paster
+
+import lass.common.database
+import lass.common.jobs
+import lass.model_base
+
+
+log = logging.getLogger(__name__)
+
+
+# Modules registering job handlers; see 'lass.common.jobs.handler'.
+JOB_MODULES = (
+    'lass.schedule.views',
+    'lass.teams.blog_fetch',
+    'lass.website.views'
+)
+
+
+def main(argv=sys.argv):
+    parser = argparse.ArgumentParser(
+        prog='lass.scripts.run_jobs',
+        description='Runs jobs from the website job queue.'
+    )
+    parser.add_argument('config_uri', help='for example, development.ini')
+    parser.add_argument(
+        '--poll',
+        type=float,
+        default=1,
+        help='seconds to wait when no jobs are due (default: 1)'
+    )
+    parser.add_argument(
+        '--once',
+        action='store_true',
+        help='run the jobs that are due, then exit'
+    )
+    parser.add_argument(
+        '--metrics-interval',
+        type=float,
+        default=60,
+        help='seconds between logging queue metrics (default: 60)'
+    )
+    args = parser.parse_args(argv[1:])
+
+    pyramid.paster.setup_logging(args.config_uri)
+    settings = pyramid.paster.get_appsettings(args.config_uri)
+    engine = lass.common.database.engine_from_settings(settings)
+    lass.model_base.DBSession.configure(bind=engine)
+
+    queue = lass.common.jobs.configure(settings)
+    if queue is None:
+        parser.error(
+            '{} does not set {}path.'.format(
+                args.config_uri,
+                lass.common.jobs.SETTINGS_PREFIX
+            )
+        )
+    for module in JOB_MODULES:
+        importlib.import_module(module)
+
+    worker = lass.common.jobs.Worker(queue)
+    last_metrics = time.monotonic()
+    while True:
+        try:
+            run = worker.run_due()
+        finally:
+            lass.model_base.DBSession.remove()
+
+        if time.monotonic() - last_metrics >= args.metrics_interval:
+            queue.purge()
+            log.info('Job metrics: %s', worker.metrics())
+            last_metrics = time.monotonic()
+
+        if args.once:
+            log.info('Job metrics: %s', worker.metrics())
+            break
+        if not run:
+            time.sleep(args.poll)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,10 +1,20 @@
 """Fetches the blogs configured on the website to local files.
 
-The local files dumped to are 'BLOGNAME.incoming.yml' in the
-assets/blogs directory.
+For each blog in 'sitewide/blogs', the latest entries are stored, trimmed
+down to the fields the website uses, in a file named after the blog in
+the assets/blogs directory (see 'lass.teams.feeds' for the format); the
+website reads these files and never fetches feeds itself.
 
-Should be run as a regular cron-job.  Must be run from within the
-website virtual environment.
+Fetches are conditional (using the ETag and Last-Modified headers from
+the previous fetch), all blogs are fetched concurrently, and each file
+is written to 'BLOGNAME.incoming' and then renamed into place, so the
+website never sees a half-written file.
+
+Run with '--interval SECONDS' to keep fetching as a service, or without
+it to fetch once (for example, from a cron-job).  With '--queue PATH',
+the fetches are instead queued on the website's job queue, for the job
+worker ('lass.scripts.run_jobs') to run and retry.  Must be run from
+within the website virtual environment.
 
 ---
 
@@ -33,21 +43,184 @@ LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
 NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
-import pyramid
-import feedparser
-import pickle
+import argparse
+import concurrent.futures
+import logging
+import sys
+import time
 
 import lass.common.config
+import lass.common.jobs
+import lass.common.lazy
+import lass.teams.feeds
 
 
-if __name__ == '__main__':
+feedparser = lass.common.lazy.lazy_import('feedparser')
+
+
+log = logging.getLogger(__name__)
+
+
+# The number of entries to keep per blog.
+DEFAULT_LIMIT = 20
+
+
+def fetch(name, config, limit=DEFAULT_LIMIT):
+    """Fetches one blog, storing it if it has changed.
+
+    Args:
+        name: The name of the blog in the blog configuration.
+        config: The configuration for the blog.
+        limit: The number of entries to keep.  (Default: DEFAULT_LIMIT.)
+
+    The stored blog is only replaced by a successful (200) fetch, or by
+    any fetch that returned entries; errors leave it as it was.
+
+    Returns:
+        True if the stored blog was updated; False otherwise.
+    """
+    path = lass.teams.feeds.blog_path(name)
+    blog = lass.teams.feeds.load(path)
+    previous = blog[0] if blog else {}
+
+    feed = feedparser.parse(
+        config['feed'],
+        etag=previous.get('etag'),
+        modified=previous.get('modified')
+    )
+
+    status = feed.get('status')
+    updated = False
+    if status == 304:
+        log.debug('Blog %s not modified.', name)
+    elif status != 200 and not feed.get('entries'):
+        # An error page (or no response at all) has no entries, but
+        # storing that would wipe the blog out; keep serving what we have.
+        log.warning(
+            'Could not fetch blog %s (status %s): %s',
+            name,
+            status,
+            feed.get('bozo_exception')
+        )
+    else:
+        lass.teams.feeds.store(
+            path,
+            {
+                'etag': feed.get('etag'),
+                'modified': feed.get('modified'),
+                'fetched': time.time()
+            },
+            lass.teams.feeds.trim(feed.get('entries', []), limit)
+        )
+        updated = True
+        log.info('Updated blog %s.', name)
+    return updated
+
+
+@lass.common.jobs.handler('teams.fetch_blog')
+def fetch_job(name, limit=DEFAULT_LIMIT):
+    """Job handler that fetches one blog; see 'fetch'.
+
+    Args:
+        name: The name of the blog in the blog configuration.
+        limit: The number of entries to keep.  (Default: DEFAULT_LIMIT.)
+    """
     blog_config = lass.common.config.from_yaml('sitewide/blogs')
+    fetch(name, blog_config[name], limit)
+
+
+def enqueue_all(queue, blog_config, interval, limit=DEFAULT_LIMIT):
+    """Queues a job to fetch each configured blog, for a worker to run.
+
+    At most one job per blog is queued per 'interval' seconds, however
+    often this is called.
+
+    Args:
+        queue: The lass.common.jobs.Queue to use.
+        blog_config: The blog configuration, mapping blog names to their
+            configurations.
+        interval: The number of seconds between fetches of each blog.
+        limit: The number of entries to keep per blog.
+            (Default: DEFAULT_LIMIT.)
+    """
+    period = int(time.time() // max(1, interval))
+    for name in blog_config:
+        queue.enqueue(
+            'teams.fetch_blog',
+            {'name': name, 'limit': limit},
+            key='blog:{}:{}'.format(name, period)
+        )
+
+
+def fetch_all(blog_config, workers=4, limit=DEFAULT_LIMIT):
+    """Fetches every configured blog concurrently.
+
+    A blog failing to fetch does not stop the others from being fetched.
 
-    for name, config in blog_config.items():
-        asset = 'assets:blogs/{}.incoming'.format(name)
-        full_path = pyramid.path.AssetResolver().resolve(asset).abspath()
+    Args:
+        blog_config: The blog configuration, mapping blog names to their
+            configurations.
+        workers: The maximum number of blogs to fetch at once.
+            (Default: 4.)
+        limit: The number of entries to keep per blog.
+            (Default: DEFAULT_LIMIT.)
 
-        feed = feedparser.parse(config['feed'])
+    Returns:
+        A dict mapping blog names to the result of 'fetch', or None if the
+        fetch failed.
+    """
+    results = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(fetch, name, config, limit): name
+            for name, config in blog_config.items()
+        }
+        for future in concurrent.futures.as_completed(futures):
+            name = futures[future]
+            try:
+                results[name] = future.result()
+            except Exception:
+                log.exception('Error fetching blog %s.', name)
+                results[name] = None
+    return results
 
-        with open(full_path, 'wb+') as stream:
-            pickle.dump(feed, stream)
+
+def main(argv=sys.argv):
+    parser = argparse.ArgumentParser(
+        prog='lass.teams.blog_fetch',
+        description='Fetches the configured blogs to local files.'
+    )
+    parser.add_argument(
+        '--interval',
+        type=float,
+        default=0,
+        help='seconds between fetches; if 0, fetch once (default: 0)'
+    )
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--limit', type=int, default=DEFAULT_LIMIT)
+    parser.add_argument(
+        '--queue',
+        help='path of a job queue; if given, queue the fetches for '
+             'lass.scripts.run_jobs instead of fetching here'
+    )
+    args = parser.parse_args(argv[1:])
+    queue = lass.common.jobs.Queue(args.queue) if args.queue else None
+
+    logging.basicConfig(level=logging.INFO)
+
+    while True:
+        started = time.monotonic()
+        # Re-read each time, so blogs can be added without a restart.
+        blog_config = lass.common.config.from_yaml('sitewide/blogs')
+        if queue is None:
+            fetch_all(blog_config, args.workers, args.limit)
+        else:
+            enqueue_all(queue, blog_config, args.interval, args.limit)
+
+        if not args.interval:
+            break
+        time.sleep(max(0, args.interval - (time.monotonic() - started)))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
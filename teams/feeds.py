@@ -0,0 +1,225 @@
+"""Storage for the team blog feeds.
+
+Blogs are fetched in the background by 'lass.teams.blog_fetch' and
+stored, one file per blog in the assets/blogs directory, as JSON lines:
+the first line holds the fetch state (ETag, Last-Modified and fetch
+time), and each following line holds one entry, trimmed down to the
+fields the website uses.
+
+The website reads blogs through a FeedStore, which keeps each parsed blog
+in memory and only re-reads its file when the file's modification time
+changes.
+
+---
+
+Copyright (c) 2013, University Radio York.
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimer in the
+  documentation and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+import collections.abc
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+
+import pyramid
+
+
+log = logging.getLogger(__name__)
+
+
+# The entry fields the website templates use; everything else is dropped.
+ENTRY_FIELDS = (
+    'id',
+    'title',
+    'link',
+    'author',
+    'summary',
+    'published',
+    'published_parsed',
+    'updated',
+    'updated_parsed'
+)
+
+# Fields holding 'time.struct_time's, which JSON stores as lists.
+TIME_FIELDS = ('published_parsed', 'updated_parsed')
+
+
+def blog_path(name):
+    """Finds the path of the stored file for the blog of the given name."""
+    asset = 'assets:blogs/{}'.format(name)
+    return pyramid.path.AssetResolver().resolve(asset).abspath()
+
+
+def trim(entries, limit=None):
+    """Trims a feed's entries down to the first 'limit' entries and the
+    fields in 'ENTRY_FIELDS', as plain dicts.
+    """
+    return [
+        {field: entry[field] for field in ENTRY_FIELDS if field in entry}
+        for entry in itertools.islice(entries, limit)
+    ]
+
+
+def store(path, state, entries):
+    """Atomically replaces the stored blog at 'path'.
+
+    The blog is written to 'path.incoming' first and then renamed over
+    'path', so readers never see a half-written file.
+
+    Args:
+        path: The path of the stored blog.
+        state: A JSON-serialisable dict of fetch state.
+        entries: The (trimmed) entries to store.
+    """
+    incoming = path + '.incoming'
+    with open(incoming, 'w') as stream:
+        stream.write(json.dumps(state) + '\n')
+        for entry in entries:
+            stream.write(json.dumps(entry) + '\n')
+        stream.flush()
+        os.fsync(stream.fileno())
+    os.replace(incoming, path)
+
+
+def load(path):
+    """Loads a stored blog.
+
+    Returns:
+        A tuple of the fetch state dict and a tuple of entries, or None if
+        the blog has not been stored yet (or cannot be read).
+    """
+    try:
+        with open(path) as stream:
+            state = json.loads(next(stream, '{}'))
+            entries = tuple(load_entry(line) for line in stream)
+    except IOError:
+        blog = None
+    except ValueError:
+        log.exception('Stored blog %s is corrupt.', path)
+        blog = None
+    else:
+        blog = (state, entries)
+    return blog
+
+
+def load_entry(line):
+    """Loads one stored blog entry, as a plain dict, from its JSON line."""
+    entry = json.loads(line)
+    for field in TIME_FIELDS:
+        if entry.get(field) is not None:
+            entry[field] = time.struct_time(entry[field])
+    return entry
+
+
+class Entries(collections.abc.Sequence):
+    """A read-only view of the first 'limit' entries of a blog.
+
+    This lets the feed store hand out limited lists of entries without
+    copying them.
+    """
+    __slots__ = ('entries', 'limit')
+
+    def __init__(self, entries, limit=None):
+        self.entries = entries
+        self.limit = len(entries) if limit is None else min(
+            max(limit, 0),
+            len(entries)
+        )
+
+    def __len__(self):
+        return self.limit
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.entries[:self.limit][index]
+        if index < 0:
+            index += self.limit
+        if not 0 <= index < self.limit:
+            raise IndexError('blog entry index out of range')
+        return self.entries[index]
+
+    def __iter__(self):
+        return itertools.islice(self.entries, self.limit)
+
+
+class FeedStore(object):
+    """An in-memory cache of stored blogs, checked against the blog
+    files' modification times.
+    """
+    def __init__(self, path_for=blog_path):
+        """Initialises the FeedStore.
+
+        Args:
+            path_for: A function taking a blog name and returning the path
+                of its stored file.  (Default: 'blog_path'.)
+        """
+        self.path_for = path_for
+        self.feeds = {}
+        self.lock = threading.Lock()
+
+    def entries(self, name, limit=None):
+        """Retrieves the entries of a blog.
+
+        Args:
+            name: The name of the blog.
+            limit: The maximum number of entries to retrieve, or None for
+                all of them.  (Default: None.)
+
+        Returns:
+            A read-only sequence of at most 'limit' entry dicts, which is
+            empty if the blog has not been fetched yet.
+        """
+        return Entries(self.get(name)[1], limit)
+
+    def get(self, name):
+        """Retrieves a blog, re-reading it if it has changed.
+
+        Returns:
+            A tuple of the blog's fetch state and its entries.
+        """
+        path = self.path_for(name)
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            mtime = None
+
+        with self.lock:
+            cached = self.feeds.get(name)
+        if cached is None or cached[0] != mtime:
+            blog = load(path) if mtime is not None else None
+            if blog is None:
+                log.warning('Blog %s has not been fetched yet.', name)
+                blog = ({}, ())
+            cached = (mtime, blog)
+            with self.lock:
+                self.feeds[name] = cached
+
+        return cached[1]
+
+
+# The feed store used by the website.
+STORE = FeedStore()
@@ -0,0 +1,200 @@
+"""Nose tests for the Teams submodule.
+
+---
+
+Copyright (c) 2013, University Radio York.
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimer in the
+  documentation and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import os
+import tempfile
+import time
+import unittest.mock
+
+import feedparser
+
+import lass.teams.blog_fetch
+import lass.teams.feeds
+
+
+#
+# lass.teams.feeds
+#
+
+
+def test_feeds_trim():
+    """Tests 'lass.teams.feeds.trim'."""
+    entries = [
+        {'title': str(i), 'link': 'http://example.com', 'content': 'big'}
+        for i in range(5)
+    ]
+    trimmed = lass.teams.feeds.trim(entries, limit=3)
+
+    assert [entry['title'] for entry in trimmed] == ['0', '1', '2']
+    assert all('content' not in entry for entry in trimmed)
+    assert all(type(entry) is dict for entry in trimmed)
+
+
+def test_feeds_store_and_load():
+    """Tests that blogs survive a round trip through the stored format."""
+    published = time.gmtime(0)
+    entries = [{'title': 'Post', 'published_parsed': published}]
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'test')
+        assert lass.teams.feeds.load(path) is None
+
+        lass.teams.feeds.store(path, {'etag': 'x'}, entries)
+        state, loaded = lass.teams.feeds.load(path)
+
+    assert state == {'etag': 'x'}
+    assert type(loaded[0]) is dict
+    assert loaded[0]['title'] == 'Post'
+    assert loaded[0]['published_parsed'] == published
+
+
+def test_feeds_entries():
+    """Tests 'lass.teams.feeds.Entries'."""
+    entries = (1, 2, 3, 4)
+    view = lass.teams.feeds.Entries(entries, 2)
+
+    assert len(view) == 2
+    assert list(view) == [1, 2]
+    assert view[-1] == 2
+    assert view[:] == (1, 2)
+    try:
+        view[2]
+    except IndexError:
+        pass
+    else:
+        assert False, 'Read past the limit.'
+
+    assert list(lass.teams.feeds.Entries(entries)) == [1, 2, 3, 4]
+    assert len(lass.teams.feeds.Entries(entries, 10)) == 4
+
+
+def test_feed_store():
+    """Tests 'lass.teams.feeds.FeedStore'."""
+    with tempfile.TemporaryDirectory() as directory:
+        path_for = lambda name: os.path.join(directory, name)
+        store = lass.teams.feeds.FeedStore(path_for)
+
+        assert list(store.entries('test')) == []
+
+        lass.teams.feeds.store(path_for('test'), {}, [{'title': 'One'}])
+        first = store.get('test')
+        assert [entry['title'] for entry in store.entries('test')] == ['One']
+        # Unchanged blogs should come from memory.
+        assert store.get('test') is first
+
+        lass.teams.feeds.store(
+            path_for('test'),
+            {},
+            [{'title': 'Two'}, {'title': 'One'}]
+        )
+        os.utime(path_for('test'), (0, 0))
+        entries = store.entries('test', 1)
+        assert [entry['title'] for entry in entries] == ['Two']
+
+
+#
+# lass.teams.blog_fetch
+#
+
+
+def make_feed(**kwargs):
+    """Makes a fake feedparser result."""
+    return feedparser.FeedParserDict(kwargs)
+
+
+def test_blog_fetch_fetch():
+    """Tests 'lass.teams.blog_fetch.fetch'."""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'test')
+        with unittest.mock.patch(
+            'lass.teams.feeds.blog_path',
+            return_value=path
+        ), unittest.mock.patch('feedparser.parse') as parse:
+            # First fetch: no validators, so the blog is stored.
+            parse.return_value = make_feed(
+                status=200,
+                etag='"1"',
+                modified='yesterday',
+                entries=[{'title': 'Post'}]
+            )
+            assert lass.teams.blog_fetch.fetch('test', {'feed': 'url'})
+            parse.assert_called_with('url', etag=None, modified=None)
+            assert not os.path.exists(path + '.incoming')
+            state, entries = lass.teams.feeds.load(path)
+            assert state['etag'] == '"1"'
+            assert entries[0]['title'] == 'Post'
+
+            # Second fetch: validators are sent, and a 304 leaves the
+            # stored blog alone.
+            parse.return_value = make_feed(status=304, entries=[])
+            assert not lass.teams.blog_fetch.fetch('test', {'feed': 'url'})
+            parse.assert_called_with('url', etag='"1"', modified='yesterday')
+
+            # A failed fetch mustn't wipe out the stored blog either.
+            parse.return_value = make_feed(
+                bozo=1,
+                bozo_exception=IOError('down'),
+                entries=[]
+            )
+            assert not lass.teams.blog_fetch.fetch('test', {'feed': 'url'})
+            _, entries = lass.teams.feeds.load(path)
+            assert [entry['title'] for entry in entries] == ['Post']
+
+            # Nor may an error status that parsed cleanly to no entries.
+            for status in (404, 500):
+                parse.return_value = make_feed(status=status, entries=[])
+                assert not lass.teams.blog_fetch.fetch(
+                    'test',
+                    {'feed': 'url'}
+                )
+                _, entries = lass.teams.feeds.load(path)
+                assert [entry['title'] for entry in entries] == ['Post']
+
+            # A successful fetch of an empty blog is stored, though.
+            parse.return_value = make_feed(status=200, entries=[])
+            assert lass.teams.blog_fetch.fetch('test', {'feed': 'url'})
+            _, entries = lass.teams.feeds.load(path)
+            assert not entries
+
+
+def test_blog_fetch_all():
+    """Tests that 'lass.teams.blog_fetch.fetch_all' carries on past a
+    failing blog.
+    """
+    def fetch(name, config, limit):
+        if name == 'bad':
+            raise ValueError(name)
+        return True
+
+    with unittest.mock.patch('lass.teams.blog_fetch.fetch', fetch):
+        results = lass.teams.blog_fetch.fetch_all(
+            {'good': {}, 'bad': {}, 'also_good': {}}
+        )
+    assert results == {'good': True, 'bad': None, 'also_good': True}
@@ -25,12 +25,11 @@ ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
 (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
-import feedparser
 import functools
-import pickle
 import pyramid
 
 import lass.common.config
+import lass.teams.feeds
 
 
 # Redirects from old team pages.
@@ -91,26 +90,20 @@ def blog(name):
 def get_blog_posts(name, blog_config, limit=None):
     """Retrieves blog posts for the given blog.
 
-    This will try to use local caches in assets:blogs first and, if
-    said caches do not exist, will get the RSS feed directly.
+    Posts are read from the local copy kept in assets:blogs by
+    'lass.teams.blog_fetch', through the in-memory feed store; this never
+    goes out to the network, so if there is no local copy yet, there are
+    no posts.
 
     Args:
         name: The name of the blog.
-        blog_config: The configuration for the blog, specifying where
-            the RSS feed may be found if it isn't cached.
+        blog_config: The configuration for the blog.  Unused, but kept
+            for compatibility.
         limit: A limit on the number of items retrieved from the feed.
             (Default: None, or no limit.)
 
     Returns:
-        A feedparser-compatible blog feed object.
+        A read-only sequence of blog entry dicts, holding the fields in
+        'lass.teams.feeds.ENTRY_FIELDS'.
     """
-    asset = 'assets:blogs/{}'.format(name)
-    full_path = pyramid.path.AssetResolver().resolve(asset).abspath()
-
-    try:
-        with open(full_path, 'rb') as feed_file:
-            feed = pickle.load(feed_file)
-    except IOError:
-        feed = feedparser.feed(blog_config['feed'])
-
-    return feed['entries'][:limit]
+    return lass.teams.feeds.STORE.entries(name, limit)
@@ -1,9 +1,11 @@
 import functools
+import logging
 import operator
 import pyramid
 import sqlalchemy
 
 import lass.common.config
+import lass.common.database
 import lass.common.time
 import lass.model_base
 import lass.schedule.filler
@@ -11,6 +13,9 @@ import lass.schedule.lists
 import lass.schedule.models
 
 
+log = logging.getLogger(__name__)
+
+
 def get_page(request, current_url, website):
     """Looks up the current page and its title in the page configuration."""
     page = {}
@@ -54,7 +59,7 @@ def get_streams(website):
 def standard_context(event):
     request = event['request']
 
-    website = lass.common.config.from_yaml('sitewide/website')
+    website = lass.common.config.cached_from_yaml('sitewide/website')
 
     try:
         current_url = pyramid.url.current_route_url(request)
@@ -67,9 +72,10 @@ def standard_context(event):
             'date_config': lass.common.time.context_from_config(),
 
             'current_schedule': lass.schedule.lists.Schedule(
-                functools.partial(lass.schedule.lists.next, count=10)
+                functools.partial(lass.schedule.lists.shared_next, count=10),
+                processor=None
             ),
-            'service_state': lass.schedule.service.State(),
+            'service_state': lass.schedule.service.current(),
             'website': website,
             'raw_url': lambda r: request.route_url('home') + r,
             'current_url': current_url,
@@ -85,7 +91,28 @@ def standard_context(event):
 )
 def database_oops(exc, _):
     """View triggered when the database falls over."""
+    log.error(
+        'Database error: %s (pool state: %s)',
+        exc,
+        lass.common.database.summary()
+    )
     return {
         'no_database': True,
         'exception': exc
     }
+
+
+@pyramid.view.view_config(
+    route_name='database-status',
+    renderer='json'
+)
+def database_status(request):
+    """View summarising the state of the database connection pool.
+
+    Only clients at the addresses in 'lass.database.status_addresses'
+    (by default, the local machine) may see it; see 'lass.common.database'
+    for the route configuration it needs.
+    """
+    if not lass.common.database.may_see_status(request):
+        raise pyramid.httpexceptions.HTTPForbidden()
+    return lass.common.database.summary()
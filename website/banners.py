@@ -0,0 +1,263 @@
+"""An in-memory rotation index of website banners.
+
+Banner campaigns run on weekly grids of banner timeslots that rarely
+change, yet finding the banners to show used to take a nested query on
+every home page view.  This module compiles the timeslots of every
+active campaign into, for each location and ISO weekday, a sorted list
+of the times at which the set of banners changes, along with the
+banners shown between each pair of times; finding the banners for a
+location at a time is then a bisection.
+
+The index is rebuilt when a campaign starts or finishes, at most
+INDEX_MAX_AGE seconds after the banners are edited, or straight away
+after 'invalidate' is called.
+
+---
+
+Copyright (c) 2013, University Radio York.
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimer in the
+  documentation and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import bisect
+import collections
+import threading
+import time
+
+import sqlalchemy
+
+import lass.common.time
+import lass.model_base
+import lass.website.models
+
+
+# How long, in seconds, a built index is used before it is rebuilt.
+INDEX_MAX_AGE = 300
+
+
+BannerRecord = collections.namedtuple('BannerRecord', 'id alt image target')
+BannerRecord.__doc__ = """A detached, immutable copy of a Banner.
+
+This has the same 'id', 'alt', 'image' and 'target' attributes as the
+model, which is all the templates need.
+"""
+
+
+# A banner's appearance on a location, on a weekday between two times.
+Slot = collections.namedtuple('Slot', 'location day start finish banner')
+
+
+class RotationIndex(object):
+    """An immutable index of the banners shown on each location, by
+    weekday and time, while a set of campaigns is active.
+    """
+    def __init__(self, slots, valid_from=None, starts_at=None, ends_at=None):
+        """Initialises the RotationIndex.
+
+        Args:
+            slots: An iterable of Slots.
+            valid_from: The earliest datetime the index is correct for.
+                (Default: None, meaning any time.)
+            starts_at: The first start of a campaign after 'valid_from';
+                the index is not correct from this datetime onwards.
+                (Default: None, meaning never.)
+            ends_at: The first finish of a campaign at or after
+                'valid_from'; the index is not correct from this
+                datetime onwards.  (Default: None, meaning never.)
+        """
+        self.valid_from = valid_from
+        self.starts_at = starts_at
+        self.ends_at = ends_at
+
+        by_grid = collections.defaultdict(list)
+        for slot in slots:
+            if slot.start < slot.finish:
+                by_grid[slot.location, slot.day].append(slot)
+        self.grids = {
+            grid: self.compile(grid_slots)
+            for grid, grid_slots in by_grid.items()
+        }
+
+    @staticmethod
+    def compile(slots):
+        """Compiles the slots of one location and weekday.
+
+        Returns:
+            A tuple of a sorted list of the times at which the banners
+            shown change, and a list whose Nth item is the tuple of
+            banners shown from the Nth of those times until the next.
+        """
+        times = sorted(
+            {slot.start for slot in slots} | {slot.finish for slot in slots}
+        )
+        shown = []
+        for time_from in times:
+            banners = {
+                slot.banner.id: slot.banner
+                for slot in slots
+                if slot.start <= time_from < slot.finish
+            }
+            shown.append(tuple(banners[key] for key in sorted(banners)))
+        return times, shown
+
+    def is_valid(self, when):
+        """Returns whether the index is correct for the given datetime."""
+        return (
+            (self.valid_from is None or self.valid_from <= when) and
+            (self.starts_at is None or when < self.starts_at) and
+            (self.ends_at is None or when < self.ends_at)
+        )
+
+    def banners(self, location, when):
+        """Finds the banners shown on a location at a given time.
+
+        Args:
+            location: The name of a BannerLocation.
+            when: The datetime; its weekday and time are looked up as they
+                are, in its own timezone.
+
+        Returns:
+            A tuple of BannerRecords, in ID order.
+        """
+        grid = self.grids.get((location, when.isoweekday()))
+        if grid is None:
+            return ()
+        times, shown = grid
+        index = bisect.bisect_right(times, when.time()) - 1
+        return shown[index] if index >= 0 else ()
+
+
+def build(when):
+    """Builds the rotation index for the campaigns active on a datetime.
+
+    Args:
+        when: An aware datetime.
+
+    Returns:
+        A RotationIndex, correct from 'when' until the next campaign
+        starts or finishes.
+    """
+    models = lass.website.models
+    session = lass.model_base.DBSession
+    Campaign = models.BannerCampaign
+    Banner = models.Banner
+
+    rows = session.query(
+        models.BannerLocation.name,
+        models.BannerTimeslot.day,
+        models.BannerTimeslot.start_time,
+        models.BannerTimeslot.finish_time,
+        Banner.id,
+        Banner.alt,
+        Banner.image,
+        Banner.target
+    ).select_from(
+        models.BannerTimeslot
+    ).join(
+        Campaign,
+        models.BannerTimeslot.banner_campaign_id == Campaign.id
+    ).join(
+        Banner,
+        Campaign.banner_id == Banner.id
+    ).join(
+        models.BannerLocation,
+        Campaign.banner_location_id == models.BannerLocation.id
+    ).filter(
+        Campaign.active_on(when)
+    ).all()
+
+    starts_at, ends_at = session.query(
+        sqlalchemy.func.min(
+            sqlalchemy.case(
+                [(Campaign.effective_from > when, Campaign.effective_from)]
+            )
+        ),
+        sqlalchemy.func.min(
+            sqlalchemy.case(
+                [(Campaign.effective_to >= when, Campaign.effective_to)]
+            )
+        )
+    ).one()
+
+    return RotationIndex(
+        (
+            Slot(
+                location,
+                day,
+                start.replace(tzinfo=None),
+                finish.replace(tzinfo=None),
+                BannerRecord(*banner)
+            )
+            for location, day, start, finish, *banner in rows
+            if start is not None and finish is not None
+        ),
+        when,
+        starts_at,
+        ends_at
+    )
+
+
+_index = None
+_built_at = None
+_lock = threading.Lock()
+
+
+def index(when):
+    """Returns a rotation index correct for the given datetime, building
+    one if the current index is not, or is more than INDEX_MAX_AGE seconds
+    old.
+    """
+    global _index, _built_at
+
+    with _lock:
+        now = time.monotonic()
+        if (
+            _index is None or
+            now - _built_at >= INDEX_MAX_AGE or
+            not _index.is_valid(when)
+        ):
+            _index = build(when)
+            _built_at = now
+        return _index
+
+
+def invalidate():
+    """Throws away the current index, so the next lookup rebuilds it.
+
+    Call this after changing banners, campaigns or their timeslots.
+    """
+    global _index
+
+    with _lock:
+        _index = None
+
+
+def for_location(location, when=None):
+    """Finds the banners to show on a location at a given datetime.
+
+    See 'lass.website.models.Banner.for_location'.
+    """
+    if when is None:
+        when = lass.common.time.aware_now()
+    return list(index(when).banners(location, when))
@@ -114,33 +114,21 @@ class Banner(WebsiteModel):
         """Retrieves the set of banners to show on the given
         location at the given datetime.
 
+        This is looked up in the banner rotation index (see
+        'lass.website.banners'), not the database.
+
         Args:
             location: The name of a BannerLocation.
-            when: An aware datetime representing the time to retrieve banners for.
-                (Default: now.)
+            when: An aware datetime representing the time to retrieve
+                banners for.  (Default: now.)
         Returns:
-            A list of objects of this class to show on the given location at the
-            given time.
+            A list of BannerRecords, which have the same attributes as objects
+            of this class, to show on the given location at the given time.
         """
-        if not when:
-            when = lass.common.time.aware_now()
-
-        return lass.model_base.DBSession.query(
-            cls
-        ).filter(
-            # Pick up banners for this location that...
-            (BannerLocation.name == location) & cls.campaigns.any(
-                # ...have an active campaign running that...
-                BannerCampaign.active_on(when) &
-                BannerCampaign.timeslots.any(
-                    # ...has a timeslot we're currently in.
-                    (BannerTimeslot.day == when.isoweekday()) &
-                    (BannerTimeslot.start_time <= when.time()) &
-                    (BannerTimeslot.finish_time > when.time())
-                    # (Phew!)
-                )
-            )
-        )
+        # Imported here, as the banner index imports this module.
+        import lass.website.banners
+
+        return lass.website.banners.for_location(location, when)
 
 
 class BannerLocation(lass.common.mixins.Type, WebsiteModel):
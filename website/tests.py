@@ -1,7 +1,16 @@
 """Nose tests for the Website submodule."""
+import datetime
 import functools
 import nose.tools
+import pytz
+import threading
+import time
+import unittest.mock
 
+import lass.common.benchmark
+import lass.people.models
+import lass.website.banners
+import lass.website.models
 import lass.website.views
 
 
@@ -93,3 +102,175 @@ def test_signup_validate_create():
     bad_college = dict(valid_params)
     bad_college['college'] = 'horse'
     assert_signup_error(bad_college)
+
+
+def test_signup_subscribe_user():
+    """Tests that lass.website.views.signup_subscribe_user subscribes
+    concurrently, within its deadline.
+    """
+    posted = []
+    lock = threading.Lock()
+
+    def post(url, data, timeout):
+        with lock:
+            posted.append(url)
+        time.sleep(1 if url == 'slow' else 0.2)
+        response = unittest.mock.Mock()
+        if url == 'bad':
+            response.raise_for_status.side_effect = (
+                lass.website.views.requests.exceptions.HTTPError
+            )
+            response.json.return_value = {'message': 'No such list.'}
+        return response
+
+    client = unittest.mock.Mock(timeout=5)
+    client.session.post.side_effect = post
+    config = {'signup-deadline': 0.6}
+    subscribe = functools.partial(
+        lass.website.views.signup_subscribe_user,
+        {'memberid': 1},
+        config=config
+    )
+
+    with unittest.mock.patch('lass.common.api.client', return_value=client):
+        started = time.monotonic()
+        assert subscribe(['a', 'b', 'c', 'd', 'e']) == {}
+        assert time.monotonic() - started < 0.6
+        assert sorted(posted) == ['a', 'b', 'c', 'd', 'e']
+
+        for urls, details in (
+            (['a', 'bad'], 'No such list.'),
+            (['a', 'slow'], None)
+        ):
+            try:
+                subscribe(urls)
+            except lass.website.views.SignupError as error:
+                assert error.stage == 'subscribe'
+                assert details is None or error.details == details
+            else:
+                assert False, 'No SignupError for {}.'.format(urls)
+
+
+def populate_banners(engine):
+    """Fills a stand-in database with a few banner campaigns."""
+    models = lass.website.models
+    row = lass.common.benchmark.row
+    insert = functools.partial(lass.common.benchmark.insert, engine)
+    owned = functools.partial(row, owner_id=1, approver_id=1)
+
+    insert(
+        lass.people.models.Person,
+        [row(lass.people.models.Person, id=1, first_name='A', last_name='B')]
+    )
+    insert(
+        models.BannerLocation,
+        [
+            row(models.BannerLocation, id=1, name='index', description=''),
+            row(models.BannerLocation, id=2, name='other', description='')
+        ]
+    )
+    insert(
+        models.Banner,
+        [
+            row(models.Banner, id=banner, alt=str(banner), image='', target='')
+            for banner in (1, 2, 3)
+        ]
+    )
+    insert(
+        models.BannerCampaign,
+        [
+            # Always on the index; on the index only from June; elsewhere.
+            owned(
+                models.BannerCampaign,
+                id=1,
+                banner_id=1,
+                banner_location_id=1,
+                effective_from=datetime.datetime(2013, 1, 1, tzinfo=pytz.utc),
+                effective_to=None
+            ),
+            owned(
+                models.BannerCampaign,
+                id=2,
+                banner_id=2,
+                banner_location_id=1,
+                effective_from=datetime.datetime(2013, 6, 1, tzinfo=pytz.utc),
+                effective_to=datetime.datetime(2013, 7, 1, tzinfo=pytz.utc)
+            ),
+            owned(
+                models.BannerCampaign,
+                id=3,
+                banner_id=3,
+                banner_location_id=2,
+                effective_from=datetime.datetime(2013, 1, 1, tzinfo=pytz.utc),
+                effective_to=None
+            )
+        ]
+    )
+    insert(
+        models.BannerTimeslot,
+        [
+            owned(
+                models.BannerTimeslot,
+                id=slot_id,
+                banner_campaign_id=campaign,
+                day=day,
+                start_time=datetime.time(start),
+                finish_time=datetime.time(finish)
+            )
+            for slot_id, (campaign, day, start, finish) in enumerate(
+                (
+                    (1, 1, 9, 17),
+                    (1, 1, 20, 22),
+                    (2, 1, 12, 21),
+                    (3, 1, 0, 23)
+                ),
+                start=1
+            )
+        ]
+    )
+
+
+def test_banner_rotation_index():
+    """Tests lass.website.models.Banner.for_location."""
+    def banners(location, *when):
+        found = lass.website.models.Banner.for_location(
+            location,
+            datetime.datetime(*when, tzinfo=pytz.utc)
+        )
+        return [banner.id for banner in found]
+
+    with lass.common.benchmark.standin() as engine:
+        populate_banners(engine)
+        lass.website.banners.invalidate()
+        try:
+            # 2013-05-06 and 2013-06-03 are Mondays.
+            assert banners('index', 2013, 5, 6, 8, 59) == []
+            assert banners('index', 2013, 5, 6, 9) == [1]
+            assert banners('index', 2013, 5, 6, 12) == [1]
+            assert banners('index', 2013, 5, 6, 17) == []
+            assert banners('index', 2013, 5, 7, 12) == []
+            assert banners('other', 2013, 5, 6, 12) == [3]
+
+            # Campaign 2 starts without anything being invalidated.
+            built = lass.website.banners.index(
+                datetime.datetime(2013, 5, 6, tzinfo=pytz.utc)
+            )
+            assert built.starts_at.replace(tzinfo=None) == (
+                datetime.datetime(2013, 6, 1)
+            )
+            assert banners('index', 2013, 6, 3, 12) == [1, 2]
+
+            # An index is stale from the moment a campaign finishes.
+            built = lass.website.banners.index(
+                datetime.datetime(2013, 6, 3, tzinfo=pytz.utc)
+            )
+            assert built.ends_at.replace(tzinfo=None) == (
+                datetime.datetime(2013, 7, 1)
+            )
+            assert not built.is_valid(built.ends_at)
+            assert banners('index', 2013, 6, 3, 17) == [2]
+            assert banners('index', 2013, 6, 3, 20) == [1, 2]
+            assert banners('index', 2013, 6, 3, 21) == [1]
+            assert banners('index', 2013, 7, 8, 12) == [1]
+        finally:
+            lass.website.banners.invalidate()
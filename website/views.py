@@ -27,13 +27,21 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
 import functools
+import concurrent.futures
+import time
+
 import pyramid
-import requests
 
+import lass.common.api
 import lass.common.config
+import lass.common.jobs
+import lass.common.lazy
 import lass.website.models
 
 
+requests = lass.common.lazy.lazy_import('requests')
+
+
 @pyramid.view.view_config(
     route_name='about',
     renderer='website/about.jinja2'
@@ -51,6 +59,20 @@ def static(_):
     return {}
 
 
+# The default number of seconds that subscribing a new member to all of
+# their interests may take; see 'signup_subscribe_user'.  This can be
+# overridden with the 'signup-deadline' key of the API configuration.
+SUBSCRIBE_DEADLINE = 10
+
+# The maximum number of subscription requests in flight at once, across
+# all signups.
+MAX_SUBSCRIBERS = 8
+
+_subscribers = concurrent.futures.ThreadPoolExecutor(
+    max_workers=MAX_SUBSCRIBERS
+)
+
+
 class SignupError(Exception):
     """Exception marking an error found during signup."""
     def __init__(self, stage, details):
@@ -75,7 +97,7 @@ class SignupError(Exception):
 )
 def signup(request):
     """The view for processing a sign up"""
-    config = lass.common.config.from_yaml('sitewide/website')['api']
+    config = lass.common.api.api_config()
 
     try:
         create_payload = signup_validate_create(config, request.params)
@@ -84,9 +106,16 @@ def signup(request):
         subscribe_payload, interest_urls = (
             signup_validate_subscribe(config, request.params, member_id)
         )
-        context = (
-            signup_subscribe_user(subscribe_payload, interest_urls)
+        # If there is a job queue, the member need not wait for this.
+        # The API key is added back by the job, rather than being stored.
+        del subscribe_payload[config['param-api-key']]
+        lass.common.jobs.enqueue(
+            'website.subscribe',
+            key='subscribe:{}'.format(member_id),
+            payload=subscribe_payload,
+            interest_urls=list(interest_urls)
         )
+        context = {}
     except SignupError as error:
         context = {'error': error.stage, 'details': error.details}
 
@@ -151,7 +180,12 @@ def signup_validate_create(config, params):
 
 def signup_create_user(config, payload):
     """Performs the user creation part of the signup process."""
-    json = signup_request('create', config['create-user-url'], payload)
+    json = signup_request(
+        'create',
+        config['create-user-url'],
+        payload,
+        config
+    )
     return json['memberid']
 
 
@@ -226,17 +260,110 @@ def signup_validate_subscribe(config, params, member_id):
     return payload, interest_urls
 
 
-def signup_subscribe_user(payload, interest_urls):
-    """Performs the subscription part of the signup process."""
-    for interest_url in interest_urls:
-        signup_request('subscribe', interest_url, payload)
+def signup_subscribe_user(payload, interest_urls, config=None):
+    """Performs the subscription part of the signup process.
+
+    The subscriptions are requested concurrently, and must all finish
+    within the configured deadline.  Requests still running at the
+    deadline are not cancelled, but the signup is not kept waiting for
+    them.
+
+    Args:
+        payload: The subscription payload from 'signup_validate_subscribe'.
+        interest_urls: An iterable of the URLs to subscribe through.
+        config: The API configuration; if None, it will be looked up.
+            (Default: None.)
+
+    Returns:
+        An empty template context.
+
+    Raises:
+        SignupError, if any subscription failed or missed the deadline.
+    """
+    config = lass.common.api.api_config(config)
+    deadline = time.monotonic() + config.get(
+        'signup-deadline',
+        SUBSCRIBE_DEADLINE
+    )
+
+    futures = [
+        _subscribers.submit(
+            signup_request,
+            'subscribe',
+            interest_url,
+            payload,
+            config,
+            deadline
+        )
+        for interest_url in interest_urls
+    ]
+    done, not_done = concurrent.futures.wait(
+        futures,
+        timeout=max(0, deadline - time.monotonic())
+    )
+
+    # Report the first failure in the order the interests were given.
+    for future in futures:
+        if future in done and future.exception() is not None:
+            raise future.exception()
+    if not_done:
+        raise SignupError(
+            'subscribe',
+            'We could not sign you up to all of your interests in time.'
+        )
 
     return {}
 
 
-def signup_request(stage, url, payload):
-    """Sends a request to the signup API."""
-    response = requests.post(url, data=payload)
+@lass.common.jobs.handler('website.subscribe')
+def subscribe_job(payload, interest_urls):
+    """Job handler that performs the subscription part of the signup
+    process; see 'signup_subscribe_user'.
+
+    Args:
+        payload: The subscription payload, without the API key.
+        interest_urls: A list of the URLs to subscribe through.
+    """
+    config = lass.common.api.api_config()
+    signup_subscribe_user(
+        dict(payload, **{config['param-api-key']: config['api-key']}),
+        interest_urls,
+        config
+    )
+
+
+def signup_request(stage, url, payload, config=None, deadline=None):
+    """Sends a request to the signup API.
+
+    Args:
+        stage: The stage of signup the request is part of.
+        url: The URL to POST to.
+        payload: The payload to POST.
+        config: The API configuration, whose shared client's connections
+            are used; if None, it will be looked up.  (Default: None.)
+        deadline: If given, the monotonic time by which the API must have
+            started responding.  (Default: None.)
+
+    Returns:
+        The API's response, decoded from JSON.
+
+    Raises:
+        SignupError, if the API could not be contacted or refused the
+        request.
+    """
+    client = lass.common.api.client(config)
+    timeout = client.timeout
+    if deadline is not None:
+        timeout = max(0.001, deadline - time.monotonic())
+
+    try:
+        response = client.session.post(url, data=payload, timeout=timeout)
+    except requests.exceptions.RequestException:
+        raise SignupError(
+            stage,
+            'We could not contact our membership system.  '
+            'Please try again later.'
+        )
     try:
         response.raise_for_status()
     except requests.exceptions.HTTPError: